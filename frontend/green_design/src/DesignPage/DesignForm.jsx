@@ -60,6 +60,19 @@ const DesignForm = ({ onSubmit, initialData, isDirty, setIsDirty }) => {
     setIsDirty(isFormDirty);
   }, [designName, length, width, rooms, windows, specialRequest, setIsDirty]);
 
+  const waitForDesignJob = async (statusUrl) => {
+    while (true) {
+      const { data: job } = await axios.get(`http://127.0.0.1:5000${statusUrl}`);
+      if (job.status === 'succeeded') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error);
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     const designInfo = {
@@ -79,8 +92,11 @@ const DesignForm = ({ onSubmit, initialData, isDirty, setIsDirty }) => {
           'Content-Type': 'application/json'
         }
       });
-      
-      onSubmit(response.data);
+
+      // 設計在後端以任務方式執行，輪詢任務狀態直到完成
+      const result = await waitForDesignJob(response.data.statusUrl);
+
+      onSubmit(result);
       setIsDirty(false);
       // Wait for the response before navigating
       setTimeout(() => {
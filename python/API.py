@@ -1,33 +1,104 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Callable, Iterator, Tuple, TypeVar
 import json
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
 from config import Config
+from metrics import DESIGN_REQUESTS, STAGE_SECONDS, SVG_EXTRACTION_FAILURES, init_metrics, render_metrics, track_stage
 from room_designer import RoomDesigner
+from score_calculator import ScoreCalculator
+from environment_rules import EnvironmentRules
 from data_models import DesignData, Location
-import anthropic
+from design_jobs import DesignJobQueue
+from svg_cache import SVGCache
+from artifact_sink import ArtifactSink
+from history_store import DesignHistoryLog
+from design_snapshot import DesignSnapshot
+from firestore_batch import FirestoreBatchWriter
+from llm_providers import AnthropicProvider, CircuitBreaker, OpenAIProvider, ProviderRouter
+from local_firestore import LocalFirestore
+from serial_ingest import SerialIngest
+from replay_clients import Cassette, RecordingAnthropic, RecordingOpenAI, ReplayAnthropic, ReplayOpenAI, SimulatedLatency
+import functools
 import re
-import cairosvg
-import glob
 import os
 import base64
-
-# 初始化 Firebase
-cred = credentials.Certificate('python/serviceAccount.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-app = Flask(__name__)
-CORS(app)
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+# 導入本模組不建立任何客戶端：firebase_admin、anthropic 和 openai 的導入和初始化都很慢，
+# 由下面的 get_* 函數在第一次使用時完成，或由 create_app 啟動的預熱線程提前完成。
+T = TypeVar('T')
+
+def lazy(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    把無參數的工廠函數包裝成只執行一次的取值函數，多個線程同時調用時只有一個會執行工廠。
+    工廠拋出異常時不保存結果，下次調用重試。
+
+    :param factory: 建立對象的函數
+    :return: 返回同一個對象的函數，is_ready() 表示對象是否已建立
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get() -> T:
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get.is_ready = lambda: bool(instance)
+    return get
+
+@lazy
+def get_db():
+    """Firestore 客戶端；回放模式使用記憶體中的 LocalFirestore，不需要憑證和網路。"""
+    if Config.REPLAY_MODE == 'replay':
+        return LocalFirestore(Config.REPLAY_FIRESTORE_LATENCY)
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    firebase_admin.initialize_app(credentials.Certificate('python/serviceAccount.json'))
+    return firestore.client()
+
+@lazy
+def get_design_snapshot() -> DesignSnapshot:
+    """all_designs 的進程內快照，列表查詢直接從記憶體讀取。"""
+    return DesignSnapshot(get_db().collection('all_designs'), max_staleness=Config.SNAPSHOT_MAX_STALENESS)
+
+def sync_local_write(kind: str, doc_ref, data: Dict[str, Any], merge: bool):
+    """把本進程提交的 all_designs 寫入同步到快照，列表不必等監聽器回調。只有已建立快照的進程需要同步。"""
+    if doc_ref.path.rsplit('/', 1)[0] == 'all_designs' and get_design_snapshot.is_ready():
+        get_design_snapshot().apply_local_write(doc_ref.id, data, merge=merge or kind == "update")
+
+def new_batch_writer() -> FirestoreBatchWriter:
+    return FirestoreBatchWriter(get_db(), on_commit=sync_local_write)
+
+api = Blueprint('api', __name__)
+
+# 各位置的環境數據
+DEFAULT_LOCATIONS = {
+    "位置A": Location(temperature=27, humidity=65, sunlight=600),
+    "位置B": Location(temperature=25, humidity=55, sunlight=300),
+    "位置C": Location(temperature=28, humidity=70, sunlight=450),
+    "位置D": Location(temperature=26, humidity=60, sunlight=200)
+}
 
 class DesignService:
     def __init__(self):
+        import anthropic  # SDK 導入很慢，建立服務時才載入
+
+        Config.validate()
         self.designer = RoomDesigner(Config.get_openai_api_key())
-        self.history_file = 'design_history.json'
+        self.history_file = 'design_history.json'  # 舊格式，啟動時遷移到追加式日誌
+        self.history_log = DesignHistoryLog(Config.DESIGN_HISTORY_LOG)
+        self.history_log.migrate_from_json(self.history_file)
         self.latest_design_file = 'latest_room_design.json'  # 保存最新設計的文件名
         self.output_dir = 'output'  # 分割後 JSON 文件的輸出目錄
         self.svg_dir = 'svgs'        # 儲存生成的 SVG 文件的目錄
@@ -35,7 +106,22 @@ class DesignService:
         # 初始化 Anthropic 客戶端
         self.anthropic_api_key = 'sk-ant-REDACTED'  # 請將此 API 密鑰保存在安全的地方
         self.anthropic_client = anthropic.Anthropic(api_key=self.anthropic_api_key)
-        
+        self.cassette = None  # 錄製或回放模式下的錄製文件
+        if Config.REPLAY_MODE != 'off':
+            self.install_replay_clients()
+
+        # 兩個提供者各有一個熔斷器，佈局和 SVG 階段共用；佈局以 OpenAI 優先，SVG 以 Anthropic 優先。
+        # SVG 請求不經過佈局的快取、對沖和 token 預算，但與佈局共用 OpenAI 的熔斷器
+        openai_provider = OpenAIProvider(self.designer.gpt_interface, self.new_breaker())
+        openai_svg_provider = OpenAIProvider(self.designer.gpt_interface, openai_provider.breaker, direct=True)
+        anthropic_provider = AnthropicProvider(self.anthropic_client, Config.ANTHROPIC_MODEL,
+                                               Config.ANTHROPIC_MAX_TOKENS, self.new_breaker())
+        if Config.LLM_FAILOVER:
+            self.designer.layout_router = ProviderRouter([openai_provider, anthropic_provider])
+            self.svg_router = ProviderRouter([anthropic_provider, openai_svg_provider])
+        else:
+            self.svg_router = ProviderRouter([anthropic_provider])
+
         # 定義預設 prompt
         self.default_prompt = (
             "你是平面設計師的程式撰寫者，會針對配置方案要求來設計平面圖，但是是透過給我svg語法的方式，"
@@ -44,13 +130,71 @@ class DesignService:
             "越接近真實的平面圖感覺越好,svg。"
         )
         
+        # 設計過程的文件（最新設計、分割後的配置）改為可選的背景寫出
+        self.artifact_sink = ArtifactSink() if Config.WRITE_DESIGN_ARTIFACTS else None
+
+        # 以配置內容為鍵的 SVG 快取，相同配置不再重複調用模型
+        self.svg_cache = None
+        if Config.SVG_CACHE_ENABLED:
+            self.svg_cache = SVGCache(Config.SVG_CACHE_DIR, Config.SVG_CACHE_MAX_AGE, Config.SVG_CACHE_MAX_BYTES)
+
         # 確保輸出目錄存在
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         if not os.path.exists(self.svg_dir):
             os.makedirs(self.svg_dir)
 
-    def create_design(self, design_info: Dict[str, Any]) -> Dict[str, Any]:
+    def install_replay_clients(self):
+        """按 Config.REPLAY_MODE 把 OpenAI 和 Anthropic 客戶端換成錄製或回放的替身。"""
+        cassette = self.cassette = Cassette(Config.REPLAY_CASSETTE, strict=Config.REPLAY_STRICT)
+        gpt_interface = self.designer.gpt_interface
+        if Config.REPLAY_MODE == 'record':
+            gpt_interface.client = RecordingOpenAI(gpt_interface.client, cassette)
+            self.anthropic_client = RecordingAnthropic(self.anthropic_client, cassette)
+        else:
+            latency = SimulatedLatency(Config.REPLAY_LLM_LATENCY, Config.REPLAY_LLM_JITTER)
+            gpt_interface.client = ReplayOpenAI(cassette, latency)
+            self.anthropic_client = ReplayAnthropic(cassette, latency)
+        print(f"LLM 客戶端使用 {Config.REPLAY_MODE} 模式，錄製文件 {Config.REPLAY_CASSETTE}（{len(cassette)} 條）")
+
+    @staticmethod
+    def new_breaker() -> CircuitBreaker:
+        return CircuitBreaker(Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RECOVERY_TIMEOUT,
+                              Config.BREAKER_SLOW_CALL or None, Config.BREAKER_PROBE_TIMEOUT)
+
+    def provider_health(self) -> Dict[str, Any]:
+        """各 LLM 提供者的熔斷器狀態。"""
+        return self.svg_router.health()
+
+    def create_design(self, design_info: Dict[str, Any], writer: FirestoreBatchWriter = None) -> Dict[str, Any]:
+        """
+        生成設計和 SVG 平面圖。
+
+        :param design_info: 設計請求
+        :param writer: 收集 Firestore 寫入的批次寫入器，未提供時在結束前自行提交
+        :return: 設計結果
+        """
+        own_writer = writer is None
+        if own_writer:
+            writer = new_batch_writer()
+
+        design_data, locations, current_time = self.build_design_inputs(design_info)
+        with track_stage("design_room"):
+            result = self.designer.design_room(design_data, locations, current_time, design_info.get('engine'))
+        self.finish_design(result, writer)
+
+        if own_writer:
+            with track_stage("firestore_commit"):
+                writer.commit()
+        return result
+
+    def build_design_inputs(self, design_info: Dict[str, Any]):
+        """
+        把設計請求轉換為 RoomDesigner 的輸入。
+
+        :param design_info: 設計請求
+        :return: (DesignData, 各位置環境數據, 當前時間)
+        """
         design_data = DesignData(
             designName=design_info.get('designName', ''),
             length=float(design_info.get('length', 0)),
@@ -60,53 +204,128 @@ class DesignService:
             specialRequest=design_info.get('specialRequest', '')
         )
 
-        locations = {
-            "位置A": Location(temperature=27, humidity=65, sunlight=600),
-            "位置B": Location(temperature=25, humidity=55, sunlight=300),
-            "位置C": Location(temperature=28, humidity=70, sunlight=450),
-            "位置D": Location(temperature=26, humidity=60, sunlight=200)
-        }
+        locations = dict(DEFAULT_LOCATIONS)
 
         current_time = datetime.now()
-        result = self.designer.design_room(design_data, locations, current_time)
-        
-        self.save_design_history(result)
-        self.save_latest_design(result)  # 保存最新設計
-        self.split_latest_design()       # 分割最新設計
-        self.generate_svgs()             # 生成 SVG 圖片
-        
-        return result
+        return design_data, locations, current_time
+
+    def finish_design(self, result: Dict[str, Any], writer: FirestoreBatchWriter):
+        """
+        保存設計歷史，並為每個配置生成 SVG 平面圖。
+
+        :param result: design_room 返回的設計結果
+        :param writer: 收集 Firestore 寫入的批次寫入器
+        """
+        with track_stage("history"):
+            self.save_design_history(result)
+        if self.artifact_sink is not None:
+            self.artifact_sink.submit(self.designer.save_result, result, keep_history=True)  # 保存最新設計
+
+        # 設計結果直接在記憶體中傳給後續步驟，每個設計使用自己的工作目錄
+        workspace = self.new_workspace()
+        with track_stage("split"):
+            config_payloads = self.split_latest_design(design=result, output_dir=workspace)  # 分割最新設計
+        with track_stage("svg"):
+            self.generate_svgs(config_payloads, workspace, writer)  # 生成 SVG 圖片
+        if self.artifact_sink is not None:
+            self.artifact_sink.submit(self.cleanup_workspaces)
+
+    def process_design_request(self, design_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        執行一個完整的設計請求（在工作進程中運行）。
+
+        :param design_info: API 收到的設計請求
+        :return: 包含設計結果的字典
+        """
+        # 設計記錄和 SVG 信息在同一個批次中提交，失敗時也要保存設計記錄
+        writer = new_batch_writer()
+        writer.set(get_db().collection('all_designs').document(design_info.get("designName")), design_info)
+        outcome, engine = "error", "unknown"
+        try:
+            with track_stage("total"):
+                result = self.create_design(design_info, writer)
+            outcome, engine = "success", result.get("meta_info", {}).get("engine", "unknown")
+        finally:
+            with track_stage("firestore_commit"):
+                report = writer.commit()
+            DESIGN_REQUESTS.labels(engine=engine, outcome=outcome).inc()
+            print(f"Firestore 批次提交完成: {report['committed']} 個寫入，{report['round_trips']} 次往返")
+        return {"design": result, "firestore": report, "providers": self.provider_health()}
+
+    def stream_design_request(self, design_info: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        以串流方式執行設計請求，每個配置評分完成後立即產出。
 
-    def get_history_designs(self) -> List[Dict[str, Any]]:
+        :param design_info: API 收到的設計請求
+        :return: (事件名稱, 數據) 的迭代器，依次為 configuration（每個配置一次）、design 和 done
+        """
+        writer = new_batch_writer()
+        writer.set(get_db().collection('all_designs').document(design_info.get("designName")), design_info)
+        outcome, engine = "error", "unknown"
+        start = time.perf_counter()
         try:
-            with open(self.history_file, 'r', encoding='utf-8') as file:
-                return json.load(file)
-        except FileNotFoundError:
-            return []
+            design_data, locations, current_time = self.build_design_inputs(design_info)
+            result = None
+            for event, data in self.designer.stream_design_room(design_data, locations, current_time,
+                                                                design_info.get('engine')):
+                if event == "design":
+                    # 串流期間的耗時包含客戶端讀取的時間，只記錄到設計完成為止
+                    STAGE_SECONDS.labels(stage="design_room").observe(time.perf_counter() - start)
+                    result = data
+                    yield "design", {"design": result}
+                else:
+                    yield event, data
+            self.finish_design(result, writer)
+            outcome, engine = "success", result.get("meta_info", {}).get("engine", "unknown")
+        finally:
+            with track_stage("firestore_commit"):
+                report = writer.commit()
+            DESIGN_REQUESTS.labels(engine=engine, outcome=outcome).inc()
+            print(f"Firestore 批次提交完成: {report['committed']} 個寫入，{report['round_trips']} 次往返")
+        yield "done", {"firestore": report}
 
     def save_design_history(self, design: Dict[str, Any]):
-        history = self.get_history_designs()
-        history.append(design)
-        with open(self.history_file, 'w', encoding='utf-8') as file:
-            json.dump(history, file, ensure_ascii=False, indent=2)
-
-    def save_latest_design(self, design: Dict[str, Any]):
-        """保存最新的設計到指定的 JSON 文件。"""
-        with open(self.latest_design_file, 'w', encoding='utf-8') as file:
-            json.dump(design, file, ensure_ascii=False, indent=2)
+        """把設計追加到歷史日誌，不需要重寫整個文件。"""
+        self.history_log.append(design)
 
     def image_to_base64(self, image_path: str) -> str:
         """將圖片文件轉換為 base64 編碼的字符串。"""
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
-    def split_latest_design(self, shared_keys: List[str] = None, output_dir: str = None):
+    def new_workspace(self) -> str:
+        """為本次設計分配獨立的工作目錄路徑，目錄在第一次寫出文件時才建立。"""
+        workspace_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        return os.path.join(self.output_dir, workspace_id)
+
+    def cleanup_workspaces(self, keep: int = None):
+        """
+        只保留最近的幾個設計工作目錄，刪除較舊的目錄。
+
+        參數:
+            keep (int): 保留的工作目錄數量，預設使用 Config.MAX_DESIGN_WORKSPACES。
         """
-        根據配置分割最新的設計 JSON 文件成多個 JSON 文件。
+        if keep is None:
+            keep = Config.MAX_DESIGN_WORKSPACES
+        workspaces = sorted(
+            entry.path for entry in os.scandir(self.output_dir) if entry.is_dir()
+        )
+        for workspace in workspaces[:max(0, len(workspaces) - keep)]:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    def split_latest_design(self, shared_keys: List[str] = None, output_dir: str = None,
+                            design: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        根據配置分割最新的設計，每個配置一份數據。
+        啟用文件輸出時，分割結果會在背景寫成 JSON 文件。
 
         參數:
             shared_keys (list): 每個分割文件中應包含的共享鍵。
             output_dir (str): 分割後的 JSON 文件將保存到此目錄。
+            design (dict): 要分割的設計結果，未提供時讀取最新的設計文件。
+
+        返回:
+            list: 分割後的配置數據，每個配置一個字典。
         """
         if shared_keys is None:
             shared_keys = ['meta_info', 'design_data', 'room_areas', 'room_ratios',
@@ -114,27 +333,26 @@ class DesignService:
         if output_dir is None:
             output_dir = self.output_dir
 
-        json_file = self.latest_design_file  # 讀取最新的設計文件
-
-        # 步驟 1: 讀取 JSON 文件
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            print(f"文件 '{json_file}' 未找到。無法進行分割。")
-            return
+        # 步驟 1: 取得設計數據
+        if design is not None:
+            data = design
+        else:
+            json_file = self.latest_design_file  # 讀取最新的設計文件
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                print(f"文件 '{json_file}' 未找到。無法進行分割。")
+                return []
 
         # 步驟 2: 獲取配置列表
         configurations = data.get('configurations', [])
         if not configurations:
             print("沒有找到任何配置，無需分割。")
-            return
-
-        # 步驟 3: 創建輸出目錄（如果不存在）
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+            return []
 
-        # 步驟 4: 根據每個配置分割 JSON
+        # 步驟 3: 根據每個配置分割 JSON
+        config_payloads = []
         for idx, config in enumerate(configurations, start=1):
             new_data = {}
 
@@ -143,8 +361,8 @@ class DesignService:
                 if key in data:
                     new_data[key] = data[key]
 
-            # 添加特定的配置
-            new_data['configuration'] = config
+            # 添加特定的配置（複製一份，避免修改設計結果本身）
+            new_data['configuration'] = dict(config)
 
             # 如果配置中有圖片，轉換為 base64
             if 'image' in new_data['configuration']:
@@ -155,19 +373,16 @@ class DesignService:
                 else:
                     print(f"圖片 '{image_path}' 不存在")
 
-            # 生成輸出文件名
-            config_name = config.get('name', f'configuration_{idx}').replace(" ", "_")
-            output_filename = os.path.join(output_dir, f'separated_{config_name}.json')
+            # 在背景保存分割後的 JSON 文件
+            if self.artifact_sink is not None:
+                config_name = config.get('name', f'configuration_{idx}').replace(" ", "_")
+                output_filename = os.path.join(output_dir, f'separated_{config_name}.json')
+                self.artifact_sink.write_json(output_filename, new_data)
 
-            # 可選：打印每個分割後的 JSON 內容
-            print(f"\n分割後的 JSON for {config_name}:")
-            print(json.dumps(new_data, ensure_ascii=False, indent=2))
+            config_payloads.append(new_data)
 
-            # 保存分割後的 JSON 文件
-            with open(output_filename, 'w', encoding='utf-8') as outfile:
-                json.dump(new_data, outfile, ensure_ascii=False, indent=2)
-
-        print(f"\n所有配置已成功分割並保存到 '{output_dir}' 目錄。")
+        print(f"\n設計已分割成 {len(config_payloads)} 個配置。")
+        return config_payloads
 
     def extract_svg(self, content: str) -> str:
         """
@@ -180,149 +395,446 @@ class DesignService:
         else:
             return None
 
-    def generate_svgs(self):
+    def request_svg(self, config_data: Dict[str, Any]) -> str:
+        """
+        請求單個配置的平面圖，返回模型的文字回應。
+        優先使用 Anthropic，失敗或熔斷時切換到 OpenAI（Config.LLM_FAILOVER 開啟時）。
+        每次調用都有自己的超時時間，超時後請求會被取消。
+        """
+        prompt_content = self.default_prompt + "\n\n" + json.dumps(config_data, ensure_ascii=False, indent=2)
+        return self.svg_router.complete(prompt_content, max_tokens=Config.ANTHROPIC_MAX_TOKENS,
+                                        timeout=Config.SVG_CALL_TIMEOUT)
+
+    def render_svg(self, config_data: Dict[str, Any], workspace_id: str) -> str:
+        """
+        生成單個配置的 SVG 文件，內容相同的配置直接使用快取的 SVG。
+
+        參數:
+            config_data (dict): 分割後的配置數據。
+            workspace_id (str): 本次設計的工作目錄名稱，用來區分 SVG 文件名。
+
+        返回:
+            str: SVG 文件路徑，失敗時返回 None。
         """
-        根據分割後的 JSON 文件，使用 Anthropic API 生成 SVG 圖片。
-        將生成的 SVG 保存到指定的目錄，並更新 Firestore 中的設計記錄。
+        config_name = config_data.get('configuration', {}).get('name', 'unknown_configuration')
+        svg_filename = os.path.join(self.svg_dir, f"{workspace_id}_{config_name.replace(' ', '_')}.svg")
+        print(f"\n正在處理配置: {config_name}")
+
+        cache_key = None
+        if self.svg_cache is not None:
+            cache_key = SVGCache.make_key(self.default_prompt, config_data)
+            cached = self.svg_cache.get(cache_key)
+            if cached is not None:
+                print(f"{config_name}: SVG 命中快取（Firestore 文件 {cached['document_id']}）")
+                # 優先沿用已提供服務的 SVG 文件，這樣 svgUrl 保持不變
+                if cached['svg_url']:
+                    existing_file = os.path.join(self.svg_dir, os.path.basename(cached['svg_url']))
+                    if os.path.exists(existing_file):
+                        return existing_file
+                with open(svg_filename, 'w', encoding='utf-8') as svg_file:
+                    svg_file.write(cached['svg'])
+                return svg_filename
+
+        try:
+            with track_stage("svg_request"):
+                ai_response = self.request_svg(config_data)
+            print(f"{config_name}: 模型回應已獲取。")
+        except Exception as e:
+            print(f"{config_name}: 請求 SVG 時出錯: {e}")
+            return None
+
+        # 提取 SVG 代碼
+        svg_code = self.extract_svg(ai_response)
+        if not svg_code:
+            print(f"{config_name}: 未能從模型回應中提取 SVG 代碼。")
+            SVG_EXTRACTION_FAILURES.inc()
+            return None
+
+        # 保存 SVG 文件
+        with open(svg_filename, 'w', encoding='utf-8') as svg_file:
+            svg_file.write(svg_code)
+        print(f"SVG 文件已保存至 {svg_filename}")
+
+        if cache_key is not None:
+            self.svg_cache.put(cache_key, svg_code,
+                               svg_url=f"/svgs/{os.path.basename(svg_filename)}",
+                               document_id=self.svg_document_id(config_data))
+
+        # 可選：將 SVG 轉換為 PNG 或其他格式（cairosvg 導入很慢，需要時在這裡導入）
+        # import cairosvg
+        # cairosvg.svg2png(url=svg_filename, write_to=svg_filename.replace('.svg', '.png'))
+        # print(f"PNG 文件已保存至 {svg_filename.replace('.svg', '.png')}")
+        return svg_filename
+
+    def svg_document_id(self, config_data: Dict[str, Any]) -> str:
+        """返回保存該配置 SVG 的 Firestore 文件 ID。"""
+        design_name = config_data.get('design_data', {}).get('designName') or 'unknown_design'
+        config_name = config_data.get('configuration', {}).get('name', 'unknown_configuration')
+        return f"{design_name}_{config_name}".replace(" ", "_")
+
+    def attach_svg(self, config_data: Dict[str, Any], svg_filename: str, writer: FirestoreBatchWriter):
+        """把 SVG 文件的 URL 和 base64 編碼加入批次寫入。"""
+        document_id = self.svg_document_id(config_data)
+        svg_base64 = self.image_to_base64(svg_filename)
+
+        designs_ref = get_db().collection('all_designs').document(document_id)
+        # 配置的文件事先不存在，使用合併寫入而不是 update
+        writer.set(designs_ref, {
+            'svgBase64': svg_base64,
+            'svgUrl': f"/svgs/{os.path.basename(svg_filename)}"  # 假設您會設置一個靜態路徑來提供 SVG 文件
+        }, merge=True)
+        print(f"SVG 信息已加入 Firestore 設計記錄 {document_id} 的批次寫入。")
+
+    def generate_svgs(self, config_payloads: List[Dict[str, Any]], workspace: str, writer: FirestoreBatchWriter):
         """
-        # 尋找所有分離後的 JSON 文件
-        separated_json_files = glob.glob(os.path.join(self.output_dir, 'separated_*.json'))
+        根據本次設計分割後的配置，使用 Anthropic API 並行生成 SVG 圖片。
+        將生成的 SVG 保存到指定的目錄，Firestore 的更新加入批次寫入器，由調用者提交。
 
-        if not separated_json_files:
-            print("沒有找到分離後的 JSON 文件。")
+        同時進行的請求數量由 Config.SVG_CONCURRENCY 限制；整個階段超過
+        Config.SVG_STAGE_TIMEOUT 時，尚未開始的請求會被取消。某個配置失敗
+        不會影響其他配置。
+
+        參數:
+            config_payloads (list): split_latest_design 返回的配置數據。
+            workspace (str): 本次設計的工作目錄，用來區分 SVG 文件名。
+            writer (FirestoreBatchWriter): 收集 Firestore 寫入的批次寫入器。
+        """
+        if not config_payloads:
+            print("沒有需要生成 SVG 的配置。")
             return
         else:
-            print(f"找到 {len(separated_json_files)} 個分離後的 JSON 文件。")
-
-        # 迴圈處理每個分離後的 JSON 文件
-        for json_file in separated_json_files:
-            # 讀取 JSON 文件
-            with open(json_file, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            print(f"\n正在處理文件: {json_file}")
+            print(f"本次設計共有 {len(config_payloads)} 個配置。")
 
-            # 準備 prompt 內容
-            prompt_content = self.default_prompt + "\n\n" + json.dumps(config_data, ensure_ascii=False, indent=2)
+        workspace_id = os.path.basename(workspace)
+        render_pool = ThreadPoolExecutor(max_workers=Config.SVG_CONCURRENCY)
+        render_futures = {
+            render_pool.submit(self.render_svg, config_data, workspace_id): config_data
+            for config_data in config_payloads
+        }
 
-            # 發送請求到 Anthropic API 使用 Messages API
-            try:
-                response = self.anthropic_client.completions.create(
-                    prompt=anthropic.HUMAN_PROMPT + prompt_content + anthropic.AI_PROMPT,
-                    model="claude-3-opus-20240229",  # 使用支援的模型名稱
-                    max_tokens=2000,  # 設置最大 tokens
-                )
-                ai_response = response['completion']
-                print("Anthropic API 回應已獲取。")
-            except Exception as e:
-                print(f"調用 Anthropic API 時出錯: {e}")
-                continue
-
-            # 提取 SVG 代碼
-            svg_code = self.extract_svg(ai_response)
-            if svg_code:
-                # 生成 SVG 文件名
-                base_name = os.path.splitext(os.path.basename(json_file))[0]
-                svg_filename = os.path.join(self.svg_dir, f"{base_name}.svg")
-
-                # 保存 SVG 文件
-                with open(svg_filename, 'w', encoding='utf-8') as svg_file:
-                    svg_file.write(svg_code)
-                print(f"SVG 文件已保存至 {svg_filename}")
-
-                # 可選：將 SVG 轉換為 PNG 或其他格式
-                # cairosvg.svg2png(url=svg_filename, write_to=svg_filename.replace('.svg', '.png'))
-                # print(f"PNG 文件已保存至 {svg_filename.replace('.svg', '.png')}")
-                
-                # 更新 Firestore 中的設計記錄，添加 SVG 文件的 URL 或 base64 編碼
-                design_name = config_data.get('designName', 'unknown_design')
-                config_name = config_data.get('configuration', {}).get('name', 'unknown_configuration')
-                document_id = f"{design_name}_{config_name}".replace(" ", "_")
-                svg_base64 = self.image_to_base64(svg_filename)
-                
-                designs_ref = db.collection('all_designs').document(document_id)
-                designs_ref.update({
-                    'svgBase64': svg_base64,
-                    'svgUrl': f"/svgs/{os.path.basename(svg_filename)}"  # 假設您會設置一個靜態路徑來提供 SVG 文件
-                })
-                print(f"Firestore 設計記錄已更新，添加了 SVG 信息。")
-            else:
-                print("未能從 Anthropic API 回應中提取 SVG 代碼。")
-# 實例化設計服務
-design_service = DesignService()
-@app.route('/api/designs', methods=['POST'])
-def create_design():
-    design_info = request.json
+        try:
+            for future in as_completed(render_futures, timeout=Config.SVG_STAGE_TIMEOUT):
+                try:
+                    svg_filename = future.result()
+                except Exception as e:
+                    print(f"生成 SVG 時出錯: {e}")
+                    continue
+                if svg_filename:
+                    self.attach_svg(render_futures[future], svg_filename, writer)
+        except FuturesTimeoutError:
+            unfinished = [f for f in render_futures if not f.done()]
+            print(f"SVG 生成超過 {Config.SVG_STAGE_TIMEOUT} 秒，放棄 {len(unfinished)} 個未完成的配置。")
+        finally:
+            render_pool.shutdown(wait=False, cancel_futures=True)
+
+# 設計列表可返回的欄位；svgBase64 體積較大，只有明確要求時才返回
+DESIGN_LIST_FIELDS = ["designName", "length", "width", "rooms", "specialRequest", "windows",
+                      "createdAt", "imageUrl", "svgUrl", "svgBase64"]
+DEFAULT_DESIGN_LIST_FIELDS = [f for f in DESIGN_LIST_FIELDS if f != "svgBase64"]
+
+def encode_cursor(created_at: str, design_id: str) -> str:
+    raw = json.dumps({"createdAt": created_at, "id": design_id}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析 nextCursor，返回快照排序用的 (createdAt, 文件 ID)；格式錯誤時拋出 ValueError、KeyError 或 TypeError。"""
+    decoded = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    return (decoded['createdAt'] or '', decoded['id'])
+
+def parse_fields(fields_param: str) -> List[str]:
+    """解析 fields= 參數，忽略未知欄位；未提供時使用預設欄位。"""
+    if not fields_param:
+        return DEFAULT_DESIGN_LIST_FIELDS
+    requested = [f.strip() for f in fields_param.split(',') if f.strip()]
+    return [f for f in DESIGN_LIST_FIELDS if f in requested]
+
+def list_designs_page(limit: int = None, after: Tuple[str, str] = None, fields: List[str] = None) -> Dict[str, Any]:
+    """
+    按 createdAt 由新到舊分頁列出設計，從 all_designs 快照讀取。
+
+    :param limit: 每頁數量
+    :param after: decode_cursor 解析的上一頁 nextCursor，None 表示第一頁
+    :param fields: 要返回的欄位
+    :return: 包含 designs 和 nextCursor 的字典
+    """
+    if limit is None:
+        limit = Config.HISTORY_PAGE_SIZE
+    if fields is None:
+        fields = DEFAULT_DESIGN_LIST_FIELDS
+
+    page = get_design_snapshot().page(limit, after, fields, defaults={"svgUrl": "", "svgBase64": ""})
+    next_cursor = encode_cursor(*page["next"]) if page["next"] else None
+    return {"designs": page["designs"], "nextCursor": next_cursor}
+
+def build_design_service() -> DesignService:
+    """工作進程初始化時調用，每個進程初始化自己的指標並建立自己的設計服務。"""
+    init_metrics()
+    return DesignService()
+
+@lazy
+def get_design_jobs() -> DesignJobQueue:
+    """設計任務隊列，實際的設計流程在工作進程池中執行。"""
+    # 回放模式的 LocalFirestore 只存在於本進程的記憶體中，任務在本進程的線程中執行，設計列表才能看到任務的寫入
+    return DesignJobQueue(Config.DESIGN_JOB_DB, build_design_service, max_workers=Config.DESIGN_WORKERS,
+                          lease=Config.DESIGN_JOB_LEASE, in_process=Config.REPLAY_MODE == 'replay')
+
+@lazy
+def get_stream_service() -> DesignService:
+    """串流設計在 API 進程中執行，使用這個進程自己的設計服務。"""
+    return DesignService()
+
+@lazy
+def get_serial_ingest() -> SerialIngest:
+    """串口接收服務，只在 Config.SERIAL_INGEST_ENABLED 時由 create_app 啟動。"""
+    return SerialIngest()
+
+def warm_up():
+    """預先建立 Firestore 客戶端、設計列表快照和串流設計服務；失敗時留到第一次使用時重試。"""
+    start = time.perf_counter()
+    try:
+        get_design_snapshot().start()
+        get_stream_service()
+    except Exception as e:
+        print(f"預熱失敗，將在第一次使用時重試: {e}")
+        return
+    print(f"預熱完成，耗時 {time.perf_counter() - start:.2f} 秒")
+
+def create_app(warm_up_clients: bool = None, serial_ingest: bool = None) -> Flask:
+    """
+    建立 Flask 應用。只驗證配置和註冊路由，不等待任何客戶端，應用可以立即接收請求；
+    預熱完成前到達的請求會在第一次使用時自行建立所需的客戶端。
+    部署時作為 WSGI 入口，例如 gunicorn 'API:create_app()'。
+
+    :param warm_up_clients: 是否在背景線程中預熱，預設使用 Config.WARM_UP
+    :param serial_ingest: 是否啟動串口接收，預設使用 Config.SERIAL_INGEST_ENABLED
+    :return: Flask 應用
+    """
+    Config.validate()
+    init_metrics()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    if Config.WARM_UP if warm_up_clients is None else warm_up_clients:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if Config.SERIAL_INGEST_ENABLED if serial_ingest is None else serial_ingest:
+        get_serial_ingest().start()
+    return app
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一個 server-sent event。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 請求可以用 engine 欄位指定佈局引擎
+LAYOUT_ENGINES = ('gpt', 'local')
+
+def new_design_request(design_info: Dict[str, Any]) -> Dict[str, Any]:
+    """補上設計記錄的建立時間和預覽圖。"""
     design_info['createdAt'] = datetime.now().isoformat()
     design_info['imageUrl'] = 'https://placehold.co/600x400?text=' + design_info.get('designName', '')
+    return design_info
 
-    new_design_id = design_info.get("designName")
-    
-    designs_ref = db.collection('all_designs').document(new_design_id)
-    designs_ref.set(design_info)
-
-    result = design_service.create_design(design_info)
-
-    all_designs = []
-    all_designs_stream = db.collection('all_designs').stream()
-    for design in all_designs_stream:
-        design_data = design.to_dict()
-        all_designs.append({
-            'id': design.id,
-            "designName": design_data.get("designName"),
-            "length": design_data.get("length"),
-            "width": design_data.get("width"),
-            "rooms": {
-                "livingRoom": design_data.get("rooms", {}).get("livingRoom"),
-                "bathroom": design_data.get("rooms", {}).get("bathroom"),
-                "bedroom": design_data.get("rooms", {}).get("bedroom"),
-                "kitchen": design_data.get("rooms", {}).get("kitchen"),
-            },
-            "specialRequest": design_data.get("specialRequest"),
-            "windows": {
-                "top": design_data.get("windows", {}).get("top"),
-                "right": design_data.get("windows", {}).get("right"),
-                "bottom": design_data.get("windows", {}).get("bottom"),
-                "left": design_data.get("windows", {}).get("left")
-            },
-            "createdAt": design_data.get("createdAt"),
-            "imageUrl": design_data.get("imageUrl"),
-            "svgUrl": design_data.get("svgUrl", ""),           # 新增：SVG 文件的 URL
-            "svgBase64": design_data.get("svgBase64", "")      # 新增：SVG 的 base64 編碼
-        })
-
-    return jsonify({"design": result, "allDesigns": all_designs}), 201
-
-@app.route('/api/getHistoryDesigns', methods=['GET'])
+@api.route('/api/designs', methods=['POST'])
+def create_design():
+    design_info = new_design_request(request.json)
+    if design_info.get('engine') not in (None,) + LAYOUT_ENGINES:
+        return jsonify({"error": f"engine 必須是 {' 或 '.join(LAYOUT_ENGINES)}"}), 400
+
+    job_id = get_design_jobs().submit(design_info)
+    status_url = f"/api/designs/jobs/{job_id}"
+
+    return jsonify({"jobId": job_id, "status": "queued", "statusUrl": status_url}), 202, {"Location": status_url}
+
+@api.route('/api/designs/stream', methods=['POST'])
+def stream_design():
+    """
+    以 server-sent events 串流設計結果。
+
+    事件:
+        configuration: {"index", "configuration"}，每個配置完成評分後立即發送
+        design: {"design"}，完整的設計結果
+        done: {"firestore"}，SVG 生成和 Firestore 寫入完成
+        error: {"error"}，處理失敗
+    """
+    design_info = new_design_request(request.json)
+    if design_info.get('engine') not in (None,) + LAYOUT_ENGINES:
+        return jsonify({"error": f"engine 必須是 {' 或 '.join(LAYOUT_ENGINES)}"}), 400
+    service = get_stream_service()
+
+    def generate():
+        try:
+            for event, data in service.stream_design_request(design_info):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"串流設計時出錯: {e}")
+            yield format_sse("error", {"error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+score_calculator = ScoreCalculator()
+environment_rules = EnvironmentRules()
+
+def score_assignments(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    批量評估房間分配（what-if 分析），不調用 LLM。
+
+    :param payload: 包含 assignments（房間類型 -> 位置名稱列表的字典列表）、windows，
+                    以及可選的 locations（位置 -> 環境數據）和 time（ISO 格式時間，決定環境規則）
+    :return: 每個分配的分數和效率等級
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("請求內容必須是 JSON 對象")
+    assignments = payload.get('assignments')
+    if not isinstance(assignments, list) or not assignments:
+        raise ValueError("assignments 必須是非空列表")
+
+    if payload.get('locations'):
+        if not isinstance(payload['locations'], dict):
+            raise ValueError("locations 必須是位置名稱到環境數據的字典")
+        locations = {}
+        for name, data in payload['locations'].items():
+            if not isinstance(data, dict):
+                raise ValueError(f"位置 {name} 的環境數據必須是字典")
+            locations[name] = Location(temperature=float(data['temperature']), humidity=float(data['humidity']),
+                                       sunlight=float(data['sunlight']))
+    else:
+        locations = DEFAULT_LOCATIONS
+    location_names = list(locations)
+    location_index = {name: i for i, name in enumerate(location_names)}
+    sensors = {
+        "temperature": [locations[name].temperature for name in location_names],
+        "humidity": [locations[name].humidity for name in location_names],
+        "sunlight": [locations[name].sunlight for name in location_names]
+    }
+
+    current_time = datetime.fromisoformat(payload['time']) if payload.get('time') else datetime.now()
+    rules, season, time_of_day = environment_rules.get_room_environment_rules(current_time)
+    windows = payload.get('windows', {})
+    if not isinstance(windows, dict):
+        raise ValueError("windows 必須是字典")
+
+    # 房間類型和數量相同的分配放在同一批計算
+    groups = {}
+    normalized = []
+    for position, assignment in enumerate(assignments):
+        if not isinstance(assignment, dict) or not assignment:
+            raise ValueError(f"第 {position} 個分配必須是非空字典")
+        indices = {}
+        for room, names in assignment.items():
+            if room not in rules:
+                raise ValueError(f"未知的房間類型: {room}")
+            names = [names] if isinstance(names, str) else names
+            if not names or any(name not in location_index for name in names):
+                raise ValueError(f"第 {position} 個分配中 {room} 的位置無效")
+            indices[room] = [location_index[name] for name in names]
+        normalized.append(indices)
+        shape = tuple((room, len(room_indices)) for room, room_indices in indices.items())
+        groups.setdefault(shape, []).append(position)
+
+    results = [None] * len(assignments)
+    for shape, positions in groups.items():
+        batch = {room: [normalized[p][room] for p in positions] for room, _ in shape}
+        rooms = {room: 0.0 for room, _ in shape}
+        scores = score_calculator.score_batch(rooms, windows, batch, sensors, rules)
+        for i, position in enumerate(positions):
+            total = float(scores["total_score"][i])
+            results[position] = {
+                "total_score": total,
+                "temperature_score": float(scores["temperature_score"][i]),
+                "light_score": float(scores["light_score"][i]),
+                "humidity_score": float(scores["humidity_score"][i]),
+                "energy_efficiency_grade": score_calculator.get_efficiency_grade(total)
+            }
+
+    return {"results": results, "season": season, "time_of_day": time_of_day}
+
+@api.route('/api/score', methods=['POST'])
+def score():
+    """批量評分房間分配，詳見 score_assignments。"""
+    try:
+        result = score_assignments(request.json or {})
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
+@api.route('/api/designs/jobs/<job_id>', methods=['GET'])
+def get_design_job(job_id):
+    job = get_design_jobs().get(job_id)
+    if job is None:
+        return jsonify({"error": "找不到設計任務"}), 404
+    if job["status"] == "succeeded":
+        job["result"]["allDesigns"] = list_designs_page()["designs"]
+    return jsonify(job), 200
+
+@api.route('/api/getHistoryDesigns', methods=['GET'])
 def get_history_designs():
-    all_designs = []
-    all_designs_stream = db.collection('all_designs').stream()
-    for design in all_designs_stream:
-        design_data = design.to_dict()
-        all_designs.append({
-            'id': design.id,
-            "designName": design_data.get("designName"),
-            "length": design_data.get("length"),
-            "width": design_data.get("width"),
-            "rooms": design_data.get("rooms", {}),
-            "specialRequest": design_data.get("specialRequest"),
-            "windows": design_data.get("windows", {}),
-            "createdAt": design_data.get("createdAt"),
-            "imageUrl": design_data.get("imageUrl"),
-            "svgUrl": design_data.get("svgUrl", ""),           # 新增：SVG 文件的 URL
-            "svgBase64": design_data.get("svgBase64", "")      # 新增：SVG 的 base64 編碼
-        })
-    return jsonify(all_designs), 200
-
-@app.route('/', methods=['GET'])
+    """
+    分頁查詢歷史設計。
+
+    查詢參數:
+        limit: 每頁數量（預設 Config.HISTORY_PAGE_SIZE，最多 Config.HISTORY_MAX_PAGE_SIZE）
+        cursor: 上一頁返回的 nextCursor
+        fields: 以逗號分隔的欄位列表，預設不包含 svgBase64
+    """
+    try:
+        limit = int(request.args.get('limit', Config.HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit 必須是整數"}), 400
+    limit = max(1, min(limit, Config.HISTORY_MAX_PAGE_SIZE))
+
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"error": "無效的 cursor"}), 400
+
+    page = list_designs_page(limit, after, parse_fields(request.args.get('fields')))
+    return jsonify(page), 200, {"X-Snapshot-Staleness": f"{get_design_snapshot().staleness_seconds():.1f}"}
+
+@api.route('/api/sensors', methods=['GET'])
+def get_sensors():
+    """
+    各位置最新的溫濕度讀數，直接讀取記憶體中的環形緩衝區，不會等待串口。
+
+    查詢參數:
+        samples: 每個位置附帶的最近讀數筆數，預設 0
+        window: 平均值使用的最近讀數筆數，預設為整個緩衝區
+    """
+    if not get_serial_ingest.is_ready():
+        return jsonify({"error": "串口接收未啟用"}), 503
+    try:
+        samples = max(0, int(request.args.get('samples', 0)))
+        window = int(request.args['window']) if request.args.get('window') else None
+    except ValueError:
+        return jsonify({"error": "samples 和 window 必須是整數"}), 400
+    if window is not None and window <= 0:
+        return jsonify({"error": "window 必須大於 0"}), 400
+    return jsonify(get_serial_ingest().snapshot(min(samples, Config.SERIAL_BUFFER_SIZE), window)), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 抓取端點，匯總所有工作進程的指標。"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@api.route('/', methods=['GET'])
 def home():
     return "Welcome to the Room Design API", 200
 
 # 設置靜態路徑以提供 SVG 文件
-@app.route('/svgs/<filename>', methods=['GET'])
+@api.route('/svgs/<filename>', methods=['GET'])
 def get_svg(filename):
-    return app.send_static_file(os.path.join('svgs', filename))
+    return current_app.send_static_file(os.path.join('svgs', filename))
 
 if __name__ == '__main__':
+    # 使用 reloader 時只在實際提供服務的子進程中預熱和啟動工作進程池
+    serving = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    app = create_app(warm_up_clients=serving and Config.WARM_UP,
+                     serial_ingest=serving and Config.SERIAL_INGEST_ENABLED)
     # 確保 SVG 目錄是靜態路徑的一部分
     app.static_folder = 'svgs'
+    if serving:
+        get_design_jobs().start()
     app.run(debug=True)
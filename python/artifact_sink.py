@@ -0,0 +1,66 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from typing import Any, Callable
+
+
+class ArtifactSink:
+    """
+    在背景線程中寫出設計過程的文件（最新設計、分割後的配置等），
+    讓請求本身不必等待磁碟寫入。所有任務依提交順序執行。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="artifact-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs):
+        """
+        提交一個背景任務。
+
+        :param func: 要執行的函數
+        """
+        self._queue.put((func, args, kwargs))
+
+    def write_json(self, path: str, data: Any):
+        """
+        在背景把數據寫成 JSON 文件，必要時建立目錄。
+
+        :param path: 文件路徑
+        :param data: 要寫入的數據
+        """
+        self.submit(_write_json, path, data)
+
+    def flush(self):
+        """等待目前已提交的任務全部完成。"""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                func, args, kwargs = item
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"寫出設計文件時發生錯誤: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def _write_json(path: str, data: Any):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
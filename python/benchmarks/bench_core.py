@@ -0,0 +1,92 @@
+"""
+計算核心的基準測試。
+
+每個 bench_* 函數接收規模名稱（fixtures.SCALES 的鍵），完成準備工作後 yield 一個無參數的被測函數，
+生成器結束時清理臨時文件。由 run.py 發現和執行。
+"""
+import json
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+
+from benchmarks import fixtures
+from environment_rules import EnvironmentRules
+from history_store import DesignHistoryLog
+from room_calculator import RoomCalculator
+from score_calculator import ScoreCalculator
+from utils import extract_room_locations
+
+
+def bench_calculate_room_areas(scale):
+    calculator = RoomCalculator()
+    data = fixtures.design_data(scale)
+    rng = random.Random(0)
+    yield lambda: calculator.calculate_room_areas(data.rooms, data.length * data.width, rng)
+
+
+def bench_optimize_room_layout(scale):
+    calculator = RoomCalculator()
+    data = fixtures.design_data(scale)
+    room_areas, _ = calculator.calculate_room_areas(data.rooms, data.length * data.width, random.Random(0))
+    yield lambda: calculator.optimize_room_layout(room_areas, data.length, data.width)
+
+
+def bench_calculate_total_score(scale):
+    scorer = ScoreCalculator()
+    data = fixtures.design_data(scale)
+    room_areas, _ = RoomCalculator().calculate_room_areas(data.rooms, data.length * data.width, random.Random(0))
+    rules, _, _ = EnvironmentRules().get_room_environment_rules(fixtures.CURRENT_TIME)
+    rng = random.Random(0)
+    names = list(fixtures.LOCATIONS)
+    placement = {room_type: [rng.choice(names) for _ in range(count)] for room_type, count in data.rooms.items()}
+    temp_data = {room: [fixtures.LOCATIONS[name].temperature for name in chosen] for room, chosen in placement.items()}
+    humidity_data = {room: [fixtures.LOCATIONS[name].humidity for name in chosen] for room, chosen in placement.items()}
+    light_data = {room: [fixtures.LOCATIONS[name].sunlight for name in chosen] for room, chosen in placement.items()}
+    yield lambda: scorer.calculate_total_score(room_areas, data.windows, light_data, temp_data, humidity_data, rules)
+
+
+def bench_extract_room_locations(scale):
+    descriptions = [fixtures.description(scale, seed) for seed in range(16)]
+    yield lambda: [extract_room_locations(description) for description in descriptions]
+
+
+def bench_split_latest_design(scale):
+    # 在 run.py 設置 REPLAY_MODE=replay 之後才導入，不需要 Firebase 和 API 密鑰
+    import API
+
+    result = fixtures.design_result(scale)
+    with tempfile.TemporaryDirectory() as output_dir:
+        service = SimpleNamespace(artifact_sink=None, output_dir=output_dir,
+                                  latest_design_file=os.path.join(output_dir, 'latest_room_design.json'),
+                                  image_to_base64=lambda path: "")
+        yield lambda: API.DesignService.split_latest_design(service, design=result, output_dir=output_dir)
+
+
+def bench_serialize_design_result(scale):
+    result = fixtures.design_result(scale)
+    yield lambda: json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def bench_history_read_page(scale):
+    """從大型歷史記錄的末尾讀取一頁（20 條）。"""
+    result = fixtures.design_result("realistic")
+    line = json.dumps(result, ensure_ascii=False, separators=(',', ':')) + '\n'
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(line * fixtures.SCALES[scale]["history"])
+        log = DesignHistoryLog(path)
+        yield lambda: list(log.iter_from(len(log) - 20))
+
+
+def bench_history_open(scale):
+    """打開已有的歷史記錄（載入索引並檢查尾部）。"""
+    result = fixtures.design_result("realistic")
+    line = json.dumps(result, ensure_ascii=False, separators=(',', ':')) + '\n'
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(line * fixtures.SCALES[scale]["history"])
+        DesignHistoryLog(path)
+        yield lambda: DesignHistoryLog(path)
@@ -0,0 +1,42 @@
+"""
+啟動時間的基準測試：在新的 Python 進程中導入 API 並建立應用，包括解釋器本身的啟動時間。
+
+與規模無關，只在 realistic 規模下執行。子進程繼承 run.py 設置的 REPLAY_MODE=replay，
+在臨時目錄中運行，不需要 Firebase 憑證和 API 密鑰。
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_python(code: str, directory: str):
+    env = dict(os.environ, PYTHONPATH=PYTHON_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    subprocess.run([sys.executable, '-c', code], cwd=directory, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def bench_startup_python(scale):
+    """空的解釋器啟動，作為其他啟動測試的基準。"""
+    with tempfile.TemporaryDirectory() as directory:
+        yield lambda: _run_python('pass', directory)
+
+
+def bench_startup_create_app(scale):
+    """導入 API 並建立應用，不預熱：工作進程可以開始接收請求的時間。"""
+    with tempfile.TemporaryDirectory() as directory:
+        yield lambda: _run_python('import API; API.create_app(warm_up_clients=False)', directory)
+
+
+def bench_startup_first_request(scale):
+    """建立應用並完成第一個需要設計服務的請求（在請求中建立 LLM 客戶端）。"""
+    code = ("import API; client = API.create_app(warm_up_clients=False).test_client(); "
+            "assert client.get('/api/getHistoryDesigns').status_code == 200; API.get_stream_service()")
+    with tempfile.TemporaryDirectory() as directory:
+        yield lambda: _run_python(code, directory)
+
+
+for _bench in (bench_startup_python, bench_startup_create_app, bench_startup_first_request):
+    _bench.scales = ("realistic",)
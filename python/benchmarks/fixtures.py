@@ -0,0 +1,78 @@
+"""基準測試使用的數據。realistic 對應前端的一般請求，large 放大房間數、描述長度和歷史記錄數量。"""
+import random
+from datetime import datetime
+from typing import Any, Dict
+
+from data_models import DesignData, Location
+from environment_rules import EnvironmentRules
+from room_calculator import RoomCalculator
+from score_calculator import ScoreCalculator
+
+SCALES = {
+    "realistic": {"rooms": {"livingRoom": 1, "bedroom": 2, "kitchen": 1, "bathroom": 1},
+                  "configurations": 3, "description_repeat": 1, "history": 200},
+    "large": {"rooms": {"livingRoom": 3, "bedroom": 24, "kitchen": 4, "bathroom": 12},
+              "configurations": 30, "description_repeat": 40, "history": 5000},
+}
+
+LOCATIONS = {
+    "位置A": Location(temperature=27, humidity=65, sunlight=600),
+    "位置B": Location(temperature=25, humidity=55, sunlight=300),
+    "位置C": Location(temperature=28, humidity=70, sunlight=450),
+    "位置D": Location(temperature=26, humidity=60, sunlight=200)
+}
+
+CURRENT_TIME = datetime(2024, 7, 1, 14)
+
+_FILLER = ("客廳面向南方，充分利用自然光，減少白天的照明需求；臥室位於較涼爽的位置，"
+           "夜間通風良好；廚房靠近外牆便於排氣；浴室集中配置以縮短管線。")
+
+
+def design_data(scale: str) -> DesignData:
+    return DesignData("benchmark", 12.0, 9.0, dict(SCALES[scale]["rooms"]),
+                      {"north": True, "south": True}, "需要一個小書房")
+
+
+def description(scale: str, seed: int = 0) -> str:
+    """符合固定格式的配置描述，large 規模重複附加說明文字。"""
+    rng = random.Random(seed)
+    names = list(LOCATIONS)
+    placement = "，".join([
+        f"客廳在{rng.choice(names)}",
+        f"臥室在{rng.choice(names)}",
+        f"廚房在{rng.choice(names)}",
+        f"浴室在{rng.choice(names)}",
+    ])
+    return placement + "。" + _FILLER * SCALES[scale]["description_repeat"]
+
+
+def design_result(scale: str) -> Dict[str, Any]:
+    """與 RoomDesigner.design_room 結構相同的設計結果。"""
+    data = design_data(scale)
+    calculator, scorer = RoomCalculator(), ScoreCalculator()
+    room_areas, ratios = calculator.calculate_room_areas(data.rooms, data.length * data.width, random.Random(0))
+    rules, season, time_of_day = EnvironmentRules().get_room_environment_rules(CURRENT_TIME)
+
+    configurations = []
+    for index in range(SCALES[scale]["configurations"]):
+        scores = {"temperature_score": 40.0, "light_score": 25.0, "humidity_score": 15.0, "total_score": 80.0}
+        configurations.append({
+            "name": f"方案{index + 1}",
+            "description": description(scale, index),
+            "advantages": {key: _FILLER for key in ("client_requirements", "environment_optimization",
+                                                    "space_utilization", "functionality", "innovation")},
+            "considerations": {"energy_efficiency": _FILLER, "comfort": _FILLER},
+            "energy_efficiency_report": scorer.generate_energy_efficiency_report(scores)
+        })
+    return {
+        "meta_info": {"timestamp": CURRENT_TIME.isoformat(), "version": "1.0", "engine": "gpt"},
+        "design_data": data.__dict__,
+        "room_areas": room_areas,
+        "room_ratios": ratios,
+        "locations": {name: location.to_dict() for name, location in LOCATIONS.items()},
+        "environmental_conditions": {"season": season, "time_of_day": time_of_day},
+        "room_environment_rules": rules,
+        "configurations": configurations,
+        "summary": {"total_area": data.length * data.width, "room_count": sum(data.rooms.values()),
+                    "configuration_count": len(configurations), "best_energy_efficiency": 80.0}
+    }
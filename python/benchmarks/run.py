@@ -0,0 +1,152 @@
+"""
+執行基準測試並按 commit 保存結果，用於比較不同版本的性能。
+
+在倉庫根目錄執行：
+
+    python python/benchmarks/run.py                      # 執行全部，結果保存到 results/<commit>.json
+    python python/benchmarks/run.py -k score --scale large
+    python python/benchmarks/run.py --compare 1a2b3c4    # 與某個 commit 的結果比較，變慢超過閾值時返回 1
+
+bench_core 測試計算核心，bench_startup 測試導入 API 和建立應用的時間。
+每個被測函數先用 timeit 的 autorange 決定循環次數（每輪至少 0.2 秒），再重複 --repeat 輪，
+記錄每次調用的最短和中位數耗時。比較時使用中位數。
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import pkgutil
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# 基準測試不連網，API 使用回放模式導入（見 replay_clients）
+os.environ.setdefault('REPLAY_MODE', 'replay')
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from benchmarks.fixtures import SCALES  # noqa: E402
+
+
+def current_commit() -> str:
+    """當前的 commit，工作目錄有未提交的修改時加上 -dirty。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARK_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def discover(keyword: str = None):
+    """找出 benchmarks 目錄下 bench_*.py 中的所有 bench_* 函數。"""
+    for module_info in pkgutil.iter_modules([BENCHMARK_DIR]):
+        if not module_info.name.startswith('bench_'):
+            continue
+        module = importlib.import_module(f'benchmarks.{module_info.name}')
+        for name in sorted(dir(module)):
+            if name.startswith('bench_') and callable(getattr(module, name)):
+                if keyword is None or keyword in name:
+                    yield name[len('bench_'):], getattr(module, name)
+
+
+def measure(function, repeat: int) -> dict:
+    # 被測代碼中的 print 不計入輸出，也避免終端速度影響結果
+    with contextlib.redirect_stdout(io.StringIO()):
+        timer = timeit.Timer(function)
+        number, _ = timer.autorange()
+        number = max(1, number)
+        timings = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {"min": min(timings), "median": statistics.median(timings), "number": number, "repeat": repeat}
+
+
+def run(keyword: str, scales, repeat: int) -> dict:
+    results = {}
+    for name, bench in discover(keyword):
+        # 與規模無關的測試用 scales 屬性限定執行的規模
+        for scale in [scale for scale in scales if scale in getattr(bench, 'scales', scales)]:
+            key = f"{name}[{scale}]"
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator = bench(scale)
+                function = next(generator)
+            try:
+                results[key] = measure(function, repeat)
+            finally:
+                generator.close()
+            print(f"{key:<40} {format_seconds(results[key]['median']):>12}  (min {format_seconds(results[key]['min'])})")
+    return results
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    """打印與基準結果的比較，返回是否有測試變慢超過 threshold 倍。"""
+    regressed = False
+    print(f"\n與 {baseline['commit']} 比較（比值 = 現在 / 基準，超過 {threshold} 視為變慢）")
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"{key:<40} {'新增':>12}")
+            continue
+        ratio = result["median"] / before["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  變慢"
+            regressed = True
+        elif ratio < 1 / threshold:
+            flag = "  變快"
+        print(f"{key:<40} {ratio:>11.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='keyword', help='只執行名稱包含此字串的測試')
+    parser.add_argument('--scale', choices=sorted(SCALES), action='append', help='規模，可重複指定，預設全部')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', metavar='COMMIT', help='與 results/<COMMIT>.json 比較')
+    parser.add_argument('--threshold', type=float, default=1.2, help='判定變慢的比值')
+    parser.add_argument('--no-save', action='store_true', help='不保存結果')
+    args = parser.parse_args()
+
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.node()}",
+        "results": run(args.keyword, args.scale or list(SCALES), args.repeat)
+    }
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n結果已保存到 {path}")
+
+    if args.compare:
+        with open(os.path.join(RESULTS_DIR, f"{args.compare}.json"), 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print(f"注意：基準結果來自另一台機器（{baseline.get('machine')}），比較僅供參考")
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,12 +10,61 @@ class Config:
     GPT_MODEL = "gpt-4"
     MAX_TOKENS = 3000
     TEMPERATURE = 0.7
+    GPT_REQUEST_TIMEOUT = float(os.getenv('GPT_REQUEST_TIMEOUT', '60'))  # 單次請求超時（秒），超時後可改用本地引擎
+    GPT_DEADLINE = float(os.getenv('GPT_DEADLINE', '180'))  # 異步請求包括重試在內的總時限（秒）
+    GPT_BACKOFF_BASE = float(os.getenv('GPT_BACKOFF_BASE', '1'))  # 重試退避的基準等待時間（秒）
+    GPT_BACKOFF_MAX = float(os.getenv('GPT_BACKOFF_MAX', '30'))  # 重試退避的上限（秒）
+    GPT_MAX_CONNECTIONS = int(os.getenv('GPT_MAX_CONNECTIONS', '20'))  # 異步接口連線池大小
+    # 對沖請求（預設關閉）：請求超過最近耗時的 GPT_HEDGE_PERCENTILE 百分位仍未返回時，再發送一個相同的請求
+    GPT_HEDGING = os.getenv('GPT_HEDGING', 'false').lower() == 'true'
+    GPT_HEDGE_PERCENTILE = float(os.getenv('GPT_HEDGE_PERCENTILE', '95'))
+    GPT_HEDGE_MAX_EXTRA = float(os.getenv('GPT_HEDGE_MAX_EXTRA', '0.1'))  # 對沖請求最多佔主請求數量的比例
+    GPT_HEDGE_DEFAULT_DELAY = float(os.getenv('GPT_HEDGE_DEFAULT_DELAY', '20'))  # 耗時樣本不足時的對沖延遲（秒）
+    # prompt 模式：full 為完整的說明式 prompt，compact 把固定說明放在系統消息中、數據壓縮成單行 JSON
+    PROMPT_MODE = os.getenv('PROMPT_MODE', 'full')
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '0'))  # 單次請求 prompt 的 token 上限，0 表示不限制
+
+    # 佈局引擎：gpt 使用 LLM 生成配置，local 使用本地枚舉評分（不需要網路）
+    LAYOUT_ENGINE = os.getenv('LAYOUT_ENGINE', 'gpt')
+    LAYOUT_ENGINE_FALLBACK = os.getenv('LAYOUT_ENGINE_FALLBACK', 'true').lower() == 'true'  # GPT 失敗時改用本地引擎
+    PLACEMENT_TIME_LIMIT = float(os.getenv('PLACEMENT_TIME_LIMIT', '2'))  # 位置很多時分支定界搜索的時間上限（秒）
+
+    # LLM 提供者故障切換：OpenAI 和 Anthropic 互為備用，熔斷中的提供者直接跳過
+    LLM_FAILOVER = os.getenv('LLM_FAILOVER', 'true').lower() == 'true'
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))  # 連續失敗多少次後熔斷
+    BREAKER_RECOVERY_TIMEOUT = float(os.getenv('BREAKER_RECOVERY_TIMEOUT', '30'))  # 熔斷後多久放行探測請求（秒）
+    BREAKER_SLOW_CALL = float(os.getenv('BREAKER_SLOW_CALL', '120'))  # 超過此耗時的請求計為失敗（秒），0 表示不檢查
+    BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '300'))  # 探測請求多久沒有結果就放行下一個探測（秒）
+
+    # 錄製/回放：record 把真實的 LLM 回應寫入 REPLAY_CASSETTE；replay 不連網，從文件回放回應，
+    # 並用記憶體中的 LocalFirestore 代替 Firebase，用於離線測量整個流程的延遲和吞吐量
+    REPLAY_MODE = os.getenv('REPLAY_MODE', 'off')
+    REPLAY_CASSETTE = os.getenv('REPLAY_CASSETTE', 'replay_cassette.jsonl')
+    REPLAY_STRICT = os.getenv('REPLAY_STRICT', 'false').lower() == 'true'  # 只回放完全相同的請求
+    REPLAY_LLM_LATENCY = float(os.getenv('REPLAY_LLM_LATENCY', '0'))  # 回放每個 LLM 請求的模擬延遲（秒）
+    REPLAY_LLM_JITTER = float(os.getenv('REPLAY_LLM_JITTER', '0'))  # 額外的隨機延遲上限（秒）
+    REPLAY_FIRESTORE_LATENCY = float(os.getenv('REPLAY_FIRESTORE_LATENCY', '0'))  # 每次 Firestore 往返的模擬延遲（秒）
+
+    # GPT 回應快取配置（預設關閉）
+    GPT_CACHE_ENABLED = os.getenv('GPT_CACHE_ENABLED', 'false').lower() == 'true'
+    GPT_CACHE_PATH = os.getenv('GPT_CACHE_PATH', 'gpt_cache.sqlite3')
+    GPT_CACHE_TTL = float(os.getenv('GPT_CACHE_TTL', str(7 * 24 * 3600)))  # 快取有效期（秒）
+    GPT_CACHE_MAX_ENTRIES = int(os.getenv('GPT_CACHE_MAX_ENTRIES', '1000'))
 
     # Anthropic API 配置
     ANTHROPIC_API_KEY = os.getenv('Claude_API_KEY')
     ANTHROPIC_MODEL = "claude-3-opus-20240229"  # 根據需要調整模型名稱
     ANTHROPIC_MAX_TOKENS = 2000
 
+    # SVG 生成配置
+    SVG_CONCURRENCY = int(os.getenv('SVG_CONCURRENCY', '3'))  # 同時進行的 Anthropic 請求數量
+    SVG_CALL_TIMEOUT = float(os.getenv('SVG_CALL_TIMEOUT', '120'))  # 單次請求超時（秒）
+    SVG_STAGE_TIMEOUT = float(os.getenv('SVG_STAGE_TIMEOUT', '300'))  # 整個 SVG 階段的期限（秒）
+    SVG_CACHE_ENABLED = os.getenv('SVG_CACHE_ENABLED', 'true').lower() == 'true'
+    SVG_CACHE_DIR = os.getenv('SVG_CACHE_DIR', 'svg_cache')
+    SVG_CACHE_MAX_AGE = float(os.getenv('SVG_CACHE_MAX_AGE', str(30 * 24 * 3600)))  # 快取最長保存時間（秒）
+    SVG_CACHE_MAX_BYTES = int(os.getenv('SVG_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))  # 快取總大小上限
+
     # 房間設計配置
     MIN_ROOM_SIZE = 5.0  # 最小房間尺寸（平方米）
     MAX_ASPECT_RATIO = 2.0  # 最大長寬比
@@ -27,9 +76,43 @@ class Config:
 
     # 結果保存配置
     RESULT_DIRECTORY = "design_results"
+    DESIGN_HISTORY_LOG = os.getenv('DESIGN_HISTORY_LOG', 'design_history.jsonl')  # 追加式設計歷史
+    # 是否在背景寫出 latest_room_design.json 和分割後的配置文件
+    WRITE_DESIGN_ARTIFACTS = os.getenv('WRITE_DESIGN_ARTIFACTS', 'false').lower() == 'true'
+
+    # Prometheus 指標：工作進程和 API 進程共用的多進程數據目錄，設為空字符串時只導出 API 進程自己的指標
+    PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', 'prometheus_metrics')
+
+    # 設計任務配置
+    DESIGN_JOB_DB = os.getenv('DESIGN_JOB_DB', 'design_jobs.sqlite3')
+    DESIGN_WORKERS = int(os.getenv('DESIGN_WORKERS', '2'))  # 工作進程數量
+    DESIGN_JOB_LEASE = float(os.getenv('DESIGN_JOB_LEASE', '120'))  # 任務心跳的租約時間（秒），超過時重新排入
+    MAX_DESIGN_WORKSPACES = int(os.getenv('MAX_DESIGN_WORKSPACES', '5'))  # 保留的設計工作目錄數量
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))  # 歷史設計列表每頁數量
+    HISTORY_MAX_PAGE_SIZE = 100
+    SNAPSHOT_MAX_STALENESS = float(os.getenv('SNAPSHOT_MAX_STALENESS', '60'))  # 監聽器失效時快照的最長有效期（秒）
+    # create_app 後在背景線程中建立 Firestore 客戶端、設計列表快照和設計服務
+    WARM_UP = os.getenv('WARM_UP', 'true').lower() == 'true'
+
+    # AM2120 溫濕度板的串口接收；串口只能被一個進程打開，多進程部署時只在一個進程中開啟
+    SERIAL_INGEST_ENABLED = os.getenv('SERIAL_INGEST_ENABLED', 'false').lower() == 'true'
+    SERIAL_PORT = os.getenv('SERIAL_PORT', 'COM3')
+    SERIAL_BAUDRATE = int(os.getenv('SERIAL_BAUDRATE', '115200'))
+    SERIAL_BUFFER_SIZE = int(os.getenv('SERIAL_BUFFER_SIZE', '256'))  # 每個位置保留的讀數數量
+    SERIAL_LINES_PER_POSITION = int(os.getenv('SERIAL_LINES_PER_POSITION', '4'))  # 沒有位置欄位時每個位置連續的行數
+    SERIAL_RECONNECT_DELAY = float(os.getenv('SERIAL_RECONNECT_DELAY', '5'))  # 串口斷開後重新連線的等待時間（秒）
 
     @classmethod
     def validate(cls):
+        if cls.REPLAY_MODE not in ('off', 'record', 'replay'):
+            raise ValueError(f"REPLAY_MODE must be off, record or replay, got {cls.REPLAY_MODE!r}.")
+
+        # 回放模式不連網，不需要 API 密鑰
+        if cls.REPLAY_MODE == 'replay':
+            if not os.path.exists(cls.RESULT_DIRECTORY):
+                os.makedirs(cls.RESULT_DIRECTORY)
+            return
+
         if not cls.OPENAI_API_KEY:
             raise ValueError("OpenAI API key is not set. Please set it in the .env file.")
 
@@ -41,11 +124,11 @@ class Config:
 
     @classmethod
     def get_openai_api_key(cls):
+        # 回放模式不會發出請求，沒有密鑰時用佔位值建立客戶端
+        if cls.REPLAY_MODE == 'replay' and not cls.OPENAI_API_KEY:
+            return 'replay'
         return cls.OPENAI_API_KEY
 
     @classmethod
     def get_anthropic_api_key(cls):
         return cls.ANTHROPIC_API_KEY
-
-# 在導入時驗證配置
-Config.validate()
@@ -0,0 +1,345 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 任務狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class DesignJobStore:
+    """
+    以 SQLite 保存設計任務，API 進程與工作進程共用同一個資料庫文件。
+
+    工作進程用 claim 原子地把排隊中的任務改為執行中並記下 owner，同一個任務只會被一個進程執行；
+    執行期間定期更新 heartbeat，心跳超過租約時間的執行中任務才會被重新排入。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS design_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    owner TEXT,
+                    heartbeat REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # 舊版本建立的資料庫沒有 owner、heartbeat 和 attempts 欄位
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(design_jobs)")}
+            for name, kind in (("owner", "TEXT"), ("heartbeat", "REAL"), ("attempts", "INTEGER NOT NULL DEFAULT 0")):
+                if name not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE design_jobs ADD COLUMN {name} {kind}")
+                    except sqlite3.OperationalError:  # 其他進程已經加上
+                        pass
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, payload: Dict[str, Any]) -> str:
+        """
+        新增一個排隊中的任務。
+
+        :param payload: 設計請求內容
+        :return: 任務 ID
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO design_jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+        return job_id
+
+    def _set_status(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+                    owner: Optional[str] = None) -> bool:
+        sql = "UPDATE design_jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?"
+        params = [status,
+                  json.dumps(result, ensure_ascii=False) if result is not None else None,
+                  error,
+                  datetime.now().isoformat(),
+                  job_id]
+        if owner is not None:
+            # 租約過期後任務可能已被其他進程接手，只有仍持有任務時才寫入結果
+            sql += " AND owner = ?"
+            params.append(owner)
+        with self._connect() as conn:
+            return conn.execute(sql, params).rowcount > 0
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """
+        原子地認領一個排隊中的任務。
+
+        :param job_id: 任務 ID
+        :param owner: 執行者標識
+        :return: 是否認領成功；任務已被其他進程認領或已結束時返回 False
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE design_jobs SET status = ?, owner = ?, heartbeat = ?, updated_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = ?",
+                (JOB_RUNNING, owner, time.time(), datetime.now().isoformat(), job_id, JOB_QUEUED)
+            )
+        return cursor.rowcount > 0
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """
+        延長執行中任務的租約。
+
+        :return: 是否仍持有任務
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE design_jobs SET heartbeat = ? WHERE id = ? AND status = ? AND owner = ?",
+                (time.time(), job_id, JOB_RUNNING, owner)
+            )
+        return cursor.rowcount > 0
+
+    def mark_succeeded(self, job_id: str, result: Any, owner: Optional[str] = None) -> bool:
+        return self._set_status(job_id, JOB_SUCCEEDED, result=result, owner=owner)
+
+    def mark_failed(self, job_id: str, error: str, owner: Optional[str] = None) -> bool:
+        return self._set_status(job_id, JOB_FAILED, error=error, owner=owner)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢任務狀態。
+
+        :param job_id: 任務 ID
+        :return: 任務字典，找不到時返回 None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, result, error, created_at, updated_at FROM design_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "result": json.loads(row[2]) if row[2] else None,
+            "error": row[3],
+            "createdAt": row[4],
+            "updatedAt": row[5]
+        }
+
+    def get_payload(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM design_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def queued(self) -> List[str]:
+        """
+        返回排隊中的任務 ID，依建立時間排序。
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM design_jobs WHERE status = ? ORDER BY created_at", (JOB_QUEUED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def requeue_expired(self, lease: float, max_attempts: int = 3) -> List[str]:
+        """
+        把心跳超過租約時間的執行中任務（執行它的進程已經退出）重新改為排隊中；
+        已經執行 max_attempts 次的任務改為失敗，避免每次都讓工作進程退出的任務無限重試。
+
+        :param lease: 租約時間（秒）
+        :param max_attempts: 最多執行次數
+        :return: 重新排隊的任務 ID
+        """
+        deadline = time.time() - lease
+        expired = "id = ? AND status = ? AND (heartbeat IS NULL OR heartbeat < ?)"
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, attempts FROM design_jobs WHERE status = ? AND (heartbeat IS NULL OR heartbeat < ?) "
+                "ORDER BY created_at",
+                (JOB_RUNNING, deadline)
+            ).fetchall()
+            requeued = []
+            for job_id, attempts in rows:
+                if attempts >= max_attempts:
+                    conn.execute(
+                        f"UPDATE design_jobs SET status = ?, error = ?, updated_at = ? WHERE {expired}",
+                        (JOB_FAILED, f"工作進程在執行任務時異常退出（已嘗試 {attempts} 次）",
+                         datetime.now().isoformat(), job_id, JOB_RUNNING, deadline)
+                    )
+                    continue
+                cursor = conn.execute(
+                    f"UPDATE design_jobs SET status = ?, owner = NULL, updated_at = ? WHERE {expired}",
+                    (JOB_QUEUED, datetime.now().isoformat(), job_id, JOB_RUNNING, deadline)
+                )
+                if cursor.rowcount:
+                    requeued.append(job_id)
+        return requeued
+
+
+# 每個工作進程各自持有一個設計服務實例
+_worker_service = None
+
+
+def _init_worker(service_factory: Callable[[], Any]):
+    global _worker_service
+    # 在本進程的線程中執行時，每個線程都會調用一次，只需要建立一個服務
+    if _worker_service is None:
+        _worker_service = service_factory()
+
+
+def _keep_alive(store: DesignJobStore, job_id: str, owner: str, interval: float, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            if not store.heartbeat(job_id, owner):
+                return
+        except sqlite3.Error as e:
+            print(f"更新設計任務 {job_id} 的心跳失敗: {e}")
+
+
+def _run_job(db_path: str, job_id: str, lease: float):
+    store = DesignJobStore(db_path)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    # 同一個任務可能被多個 API 進程排入，只有認領成功的進程執行
+    if not store.claim(job_id, owner):
+        return
+    payload = store.get_payload(job_id)
+    stop = threading.Event()
+    threading.Thread(target=_keep_alive, args=(store, job_id, owner, lease / 4, stop), daemon=True).start()
+    try:
+        result = _worker_service.process_design_request(payload)
+        if not store.mark_succeeded(job_id, result, owner):
+            print(f"設計任務 {job_id} 的租約已過期，結果未寫入")
+    except Exception as e:
+        print(f"設計任務 {job_id} 失敗: {e}")
+        store.mark_failed(job_id, str(e), owner)
+    finally:
+        stop.set()
+
+
+class DesignJobQueue:
+    """
+    把設計任務交給工作進程池執行。
+
+    service_factory 必須是可被 pickle 的模組級函數，每個工作進程啟動時調用一次，
+    返回的對象需提供 process_design_request(design_info) 方法。
+    in_process 為 True 時在本進程的線程池中執行，任務可以使用本進程記憶體中的狀態（例如回放模式的 LocalFirestore）。
+    """
+
+    def __init__(self, db_path: str, service_factory: Callable[[], Any], max_workers: int = 2,
+                 lease: float = 120.0, max_attempts: int = 3, in_process: bool = False):
+        self.store = DesignJobStore(db_path)
+        self.service_factory = service_factory
+        self.max_workers = max_workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.in_process = in_process
+        self._executor = None
+        self._lock = threading.RLock()
+        self._last_recovery = 0.0
+
+    def _new_executor(self):
+        if self.in_process:
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="design-job",
+                                      initializer=_init_worker, initargs=(self.service_factory,))
+        # 用 spawn 啟動工作進程（Windows 上的預設），不 fork API 進程：
+        # fork 時預熱線程可能正持有導入鎖或客戶端的鎖，子進程會卡住
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.service_factory,)
+        )
+
+    def start(self):
+        """
+        啟動工作進程池，並排入排隊中的任務和租約已過期的任務。
+        多個 API 進程（例如 gunicorn 的多個 worker）可能排入同一個任務，由 claim 保證只執行一次。
+        """
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = self._new_executor()
+            self._last_recovery = time.monotonic()
+            expired = self.store.requeue_expired(self.lease, self.max_attempts)
+            if expired:
+                print(f"重新排入 {len(expired)} 個租約已過期的設計任務")
+            self._dispatch(self.store.queued())
+
+    def _dispatch(self, job_ids: List[str]):
+        """把任務交給進程池；工作進程異常退出（或初始化失敗）導致進程池損壞時，重新建立進程池後再提交一次。"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    for job_id in job_ids:
+                        self._executor.submit(_run_job, self.store.db_path, job_id, self.lease)
+                    return
+                except BrokenExecutor:
+                    if attempt:
+                        raise
+                    print("設計任務進程池已損壞，重新建立")
+                    self._executor.shutdown(wait=False)
+                    self._executor = self._new_executor()
+                    # 損壞的進程池中尚未執行的任務仍在排隊，一併重新提交
+                    job_ids = list(dict.fromkeys(self.store.queued() + list(job_ids)))
+
+    def _recover(self):
+        """每隔一個租約時間檢查一次，重新排入執行它的進程已經退出的任務。"""
+        with self._lock:
+            if time.monotonic() - self._last_recovery < self.lease:
+                return
+            self._last_recovery = time.monotonic()
+            expired = self.store.requeue_expired(self.lease, self.max_attempts)
+            if expired:
+                print(f"重新排入 {len(expired)} 個租約已過期的設計任務")
+                if self._executor is None:
+                    self.start()
+                else:
+                    self._dispatch(expired)
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """
+        保存任務並交給進程池執行。
+
+        :param payload: 設計請求內容
+        :return: 任務 ID
+        """
+        self.start()
+        self._recover()
+        job_id = self.store.create(payload)
+        try:
+            self._dispatch([job_id])
+        except Exception as e:
+            self.store.mark_failed(job_id, f"無法提交設計任務: {e}")
+            raise
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # 前端會輪詢任務狀態，輪詢時順便回收租約過期的任務，避免任務永遠停在執行中
+        self._recover()
+        return self.store.get(job_id)
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class DesignSnapshot:
+    """
+    all_designs 集合的進程內快照。
+
+    啟動時讀取一次整個集合，之後通過 Firestore 的 on_snapshot 監聽器
+    （或本進程自己的寫入）保持最新。讀取只訪問記憶體，不再每次 stream 集合。
+    監聽器不可用時，若快照超過 max_staleness 秒未同步，讀取時會重新載入整個集合。
+    """
+
+    def __init__(self, collection_ref, max_staleness: float = 60.0):
+        self.collection_ref = collection_ref
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # 按 (createdAt, id) 升序排列的鍵，分頁時從尾部往前讀；
+        # 與 Firestore 的 order_by 相同，沒有 createdAt 的文件不會出現在列表中
+        self._order: List[Tuple[str, str]] = []
+        self._version = 0
+        self._page_cache: Dict[Any, Dict[str, Any]] = {}
+        self._last_synced: Optional[float] = None
+        self._watch = None
+        self._listener_healthy = False
+        self._started = False
+
+    @staticmethod
+    def _sort_key(doc_id: str, data: Dict[str, Any]) -> Tuple[str, str]:
+        return (data.get('createdAt') or '', doc_id)
+
+    def start(self):
+        """載入整個集合並註冊監聽器，只會執行一次。"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.refresh()
+        try:
+            self._watch = self.collection_ref.on_snapshot(self._on_snapshot)
+            self._listener_healthy = True
+        except Exception as e:
+            print(f"無法註冊 all_designs 監聽器，改為定期重新載入: {e}")
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        self._listener_healthy = False
+
+    def refresh(self):
+        """重新讀取整個集合。"""
+        docs = {doc.id: doc.to_dict() for doc in self.collection_ref.stream()}
+        with self._lock:
+            self._docs = docs
+            self._order = sorted(self._sort_key(doc_id, data) for doc_id, data in docs.items()
+                                 if data.get('createdAt'))
+            self._changed()
+            self._last_synced = time.time()
+
+    def _changed(self):
+        self._version += 1
+        self._page_cache.clear()
+
+    def _put(self, doc_id: str, data: Dict[str, Any]):
+        old = self._docs.get(doc_id)
+        if old is not None:
+            old_key = self._sort_key(doc_id, old)
+            index = bisect.bisect_left(self._order, old_key)
+            if index < len(self._order) and self._order[index] == old_key:
+                del self._order[index]
+        self._docs[doc_id] = data
+        if data.get('createdAt'):
+            bisect.insort(self._order, self._sort_key(doc_id, data))
+
+    def _remove(self, doc_id: str):
+        old = self._docs.pop(doc_id, None)
+        if old is None:
+            return
+        old_key = self._sort_key(doc_id, old)
+        index = bisect.bisect_left(self._order, old_key)
+        if index < len(self._order) and self._order[index] == old_key:
+            del self._order[index]
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self._remove(doc.id)
+                    else:
+                        self._put(doc.id, doc.to_dict())
+                if changes:
+                    self._changed()
+                self._last_synced = time.time()
+                self._listener_healthy = True
+        except Exception as e:
+            print(f"更新 all_designs 快照時出錯: {e}")
+            self._listener_healthy = False
+
+    def apply_local_write(self, doc_id: str, data: Dict[str, Any], merge: bool = False):
+        """
+        把本進程對 all_designs 的寫入同步到快照。
+
+        :param doc_id: 文件 ID
+        :param data: 寫入的數據
+        :param merge: 是否與現有數據合併（對應 update / set(merge=True)）
+        """
+        with self._lock:
+            if merge and doc_id in self._docs:
+                data = {**self._docs[doc_id], **data}
+            self._put(doc_id, dict(data))
+            self._changed()
+
+    def staleness_seconds(self) -> float:
+        """
+        快照落後的秒數。監聽器正常串流時為 0；否則為距離上次同步的時間。
+        """
+        if self._last_synced is None:
+            return float('inf')
+        if self._listener_healthy and self._watch is not None and getattr(self._watch, 'is_active', True):
+            return 0.0
+        return time.time() - self._last_synced
+
+    def _ensure_fresh(self):
+        self.start()
+        if self.staleness_seconds() > self.max_staleness:
+            print("all_designs 快照已過期，重新載入")
+            self.refresh()
+
+    def page(self, limit: int, after: Optional[Tuple[str, str]] = None,
+             fields: Optional[List[str]] = None, defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        按 createdAt 由新到舊返回一頁設計。返回的字典會被快取，調用者不應修改。
+
+        :param limit: 每頁數量
+        :param after: 上一頁最後一筆的 (createdAt, id)，None 表示第一頁
+        :param fields: 要返回的欄位，None 表示全部
+        :param defaults: 欄位缺失時使用的預設值
+        :return: 包含 designs 和 next（下一頁起點）的字典
+        """
+        self._ensure_fresh()
+        defaults = defaults or {}
+        if after is not None:
+            after = tuple(after)
+        cache_key = (limit, after, tuple(fields) if fields is not None else None, tuple(sorted(defaults.items())))
+        with self._lock:
+            cached = self._page_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            end = len(self._order) if after is None else bisect.bisect_left(self._order, after)
+            keys = self._order[max(0, end - limit):end][::-1]
+            designs = []
+            for created_at, doc_id in keys:
+                data = self._docs[doc_id]
+                item = {'id': doc_id}
+                item.update(data if fields is None else {f: data.get(f, defaults.get(f)) for f in fields})
+                designs.append(item)
+
+            result = {
+                "designs": designs,
+                "next": keys[-1] if end - limit > 0 and keys else None
+            }
+            if len(self._page_cache) > 64:
+                self._page_cache.clear()
+            self._page_cache[cache_key] = result
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._docs),
+            "version": self._version,
+            "listener_healthy": self._listener_healthy,
+            "staleness_seconds": self.staleness_seconds()
+        }
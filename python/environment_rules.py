@@ -1,20 +1,158 @@
+from array import array
 from datetime import datetime
-from typing import Dict, Tuple, Any
+from math import nan
+from itertools import combinations
+from typing import Dict, Tuple, Any, Iterable
+
+SEASONS = ("spring", "summer", "autumn", "winter")
+TIMES_OF_DAY = ("day", "night")
+ROOM_TYPES = ("livingRoom", "bedroom", "kitchen", "bathroom")
+FACTORS = ("temperature", "humidity", "sunlight")
+# adjust_rules_for_special_conditions 支援的特殊條件
+SPECIAL_CONDITIONS = ("high_humidity_warning", "heat_wave")
+
+SEASON_TEMPS = {
+    "spring": 21.12,
+    "summer": 26.38,
+    "autumn": 23.03,
+    "winter": 16.51
+}
+SEASON_HUMIDITY = {
+    "spring": 79.59,
+    "summer": 80.37,
+    "autumn": 77.98,
+    "winter": 78.42
+}
+
+
+class FrozenDict(dict):
+    """
+    不可修改的字典。仍是 dict 的子類，可以直接 JSON 序列化和按鍵讀取；
+    copy() 返回普通的 dict，用於寫時複製。
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("環境規則表是唯讀的，請先 copy() 再修改")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.items())))
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value: Any) -> Any:
+    """把嵌套的 dict / list 轉換為 FrozenDict / tuple。"""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class RuleTable:
+    """
+    一組預先計算好的房間環境規則。
+
+    rules 是供現有代碼按鍵讀取的 FrozenDict；values 是唯讀的 float64 數組，
+    按 (房間, 因素, [理想值, 下限, 上限]) 排列，供批量計算按索引讀取（見 offset）。
+    """
+
+    __slots__ = ("key", "rules", "values")
+
+    def __init__(self, key: Tuple[str, str, frozenset], rules: FrozenDict):
+        self.key = key
+        self.rules = rules
+        self.values = memoryview(self.pack(rules)).toreadonly()
+
+    @staticmethod
+    def pack(rules: Dict[str, Dict]) -> array:
+        """
+        把規則字典排成 values 的數組格式。
+
+        :param rules: 房間環境規則字典，缺少的房間或因素填 NaN
+        :return: array('d')
+        """
+        values = array('d')
+        for room in ROOM_TYPES:
+            room_rules = rules.get(room, {})
+            for factor in FACTORS:
+                rule = room_rules.get(factor)
+                values.extend((rule["ideal"], rule["range"][0], rule["range"][1]) if rule else (nan, nan, nan))
+        return values
+
+    @staticmethod
+    def offset(room: str, factor: str) -> int:
+        """(room, factor) 的理想值在 values 中的位置，下限和上限緊隨其後。"""
+        return (ROOM_TYPES.index(room) * len(FACTORS) + FACTORS.index(factor)) * 3
+
 
 class EnvironmentRules:
+    """
+    房間環境規則。所有 季節 × 白天/夜晚 × 特殊條件 的組合在第一次建立實例時計算一次，
+    之後的查詢都是 O(1) 的字典查找，返回的規則不可修改，可以在線程之間共享。
+    """
+
+    # (季節, 時間段, 特殊條件集合) -> RuleTable，所有實例共用
+    _tables: Dict[Tuple[str, str, frozenset], RuleTable] = {}
+    # id(規則) -> 規則表的鍵，用來識別預先計算的規則
+    _table_keys: Dict[int, Tuple[str, str, frozenset]] = {}
+
     def __init__(self):
-        self.season_temps = {
-            "spring": 21.12,
-            "summer": 26.38,
-            "autumn": 23.03,
-            "winter": 16.51
-        }
-        self.season_humidity = {
-            "spring": 79.59,
-            "summer": 80.37,
-            "autumn": 77.98,
-            "winter": 78.42
-        }
+        self.season_temps = SEASON_TEMPS
+        self.season_humidity = SEASON_HUMIDITY
+        if not EnvironmentRules._tables:
+            self._build_tables()
+
+    def _build_tables(self):
+        tables = {}
+        for season in SEASONS:
+            for time_of_day in TIMES_OF_DAY:
+                daytime = time_of_day == "day"
+                base = freeze({
+                    "livingRoom": self._get_room_rules(season, daytime, is_living_room=True),
+                    "bedroom": self._get_room_rules(season, daytime, is_bedroom=True),
+                    "kitchen": self._get_room_rules(season, daytime, is_kitchen=True),
+                    "bathroom": self._get_room_rules(season, daytime, is_bathroom=True)
+                })
+                for size in range(len(SPECIAL_CONDITIONS) + 1):
+                    for conditions in combinations(SPECIAL_CONDITIONS, size):
+                        key = (season, time_of_day, frozenset(conditions))
+                        rules = self._apply_conditions(base, conditions)
+                        tables[key] = RuleTable(key, rules)
+        # 字典的賦值是原子的，並發建立實例時最多重複計算一次
+        EnvironmentRules._table_keys = {id(table.rules): key for key, table in tables.items()}
+        EnvironmentRules._tables = tables
+
+    def rule_table(self, season: str, time_of_day: str, special_conditions: Iterable[str] = ()) -> RuleTable:
+        """
+        查找預先計算的規則表。
+
+        :param season: 季節
+        :param time_of_day: "day" 或 "night"
+        :param special_conditions: 啟用的特殊條件名稱
+        :return: RuleTable
+        """
+        return self._tables[(season, time_of_day, frozenset(special_conditions))]
+
+    @classmethod
+    def rule_values(cls, rules: Dict[str, Dict]) -> memoryview:
+        """
+        規則的數組形式，排列與 RuleTable.values 相同。
+
+        :param rules: 房間環境規則字典
+        :return: 預先計算的規則直接返回其 RuleTable.values；其他規則（例如請求中傳入的）臨時打包
+        """
+        key = cls._table_keys.get(id(rules))
+        if key is not None and cls._tables[key].rules is rules:
+            return cls._tables[key].values
+        return memoryview(RuleTable.pack(rules)).toreadonly()
 
     def get_season(self, date: datetime) -> str:
         """
@@ -50,17 +188,8 @@ class EnvironmentRules:
         :return: 房間環境規則、季節和時間段（白天/夜晚）的元組
         """
         season = self.get_season(current_time)
-        daytime = self.is_daytime(current_time)
-        time_of_day = "day" if daytime else "night"
-
-        rules = {
-            "livingRoom": self._get_room_rules(season, daytime, is_living_room=True),
-            "bedroom": self._get_room_rules(season, daytime, is_bedroom=True),
-            "kitchen": self._get_room_rules(season, daytime, is_kitchen=True),
-            "bathroom": self._get_room_rules(season, daytime, is_bathroom=True)
-        }
-
-        return rules, season, time_of_day
+        time_of_day = "day" if self.is_daytime(current_time) else "night"
+        return self.rule_table(season, time_of_day).rules, season, time_of_day
 
     def _get_room_rules(self, season: str, daytime: bool, 
                         is_living_room: bool = False, is_bedroom: bool = False, 
@@ -131,31 +260,43 @@ class EnvironmentRules:
 
     def adjust_rules_for_special_conditions(self, rules: dict[str, Any], special_conditions: dict[str, Any]) -> dict[str, Any]:
         """
-        根據特殊條件調整環境規則。
+        根據特殊條件調整環境規則。不修改傳入的規則，返回新的唯讀規則；
+        未受影響的部分與原規則共用。
 
         :param rules: 原始環境規則
         :param special_conditions: 特殊條件字典
         :return: 調整後的環境規則
         """
-        adjusted_rules = rules.copy()
-
-        if special_conditions.get("high_humidity_warning"):
-            for room in adjusted_rules:
-                adjusted_rules[room]["humidity"]["ideal"] -= 5
-                adjusted_rules[room]["humidity"]["range"] = (
-                    adjusted_rules[room]["humidity"]["range"][0] - 5,
-                    adjusted_rules[room]["humidity"]["range"][1] - 5
-                )
-
-        if special_conditions.get("heat_wave"):
-            for room in adjusted_rules:
-                adjusted_rules[room]["temperature"]["ideal"] += 2
-                adjusted_rules[room]["temperature"]["range"] = (
-                    adjusted_rules[room]["temperature"]["range"][0] + 2,
-                    adjusted_rules[room]["temperature"]["range"][1] + 2
-                )
-
-        return adjusted_rules
+        conditions = tuple(name for name in SPECIAL_CONDITIONS if special_conditions.get(name))
+        key = self._table_keys.get(id(rules))
+        if key is not None and self._tables[key].rules is rules and not key[2].intersection(conditions):
+            return self.rule_table(key[0], key[1], key[2].union(conditions)).rules
+        return self._apply_conditions(rules, conditions)
+
+    @staticmethod
+    def _apply_conditions(rules: dict[str, Any], conditions: Iterable[str]) -> FrozenDict:
+        """寫時複製：只重建被調整的因素，其餘部分直接共用。"""
+        shifts = {}
+        for name in conditions:
+            if name == "high_humidity_warning":
+                shifts["humidity"] = shifts.get("humidity", 0) - 5
+            elif name == "heat_wave":
+                shifts["temperature"] = shifts.get("temperature", 0) + 2
+        if not shifts:
+            return freeze(rules)
+
+        adjusted = {}
+        for room, room_rules in rules.items():
+            room_adjusted = dict(room_rules)
+            for factor, shift in shifts.items():
+                rule = room_rules[factor]
+                room_adjusted[factor] = FrozenDict({
+                    **rule,
+                    "ideal": rule["ideal"] + shift,
+                    "range": (rule["range"][0] + shift, rule["range"][1] + shift)
+                })
+            adjusted[room] = freeze(room_adjusted)
+        return FrozenDict(adjusted)
 
     def validate_environment_data(self, environment_data: dict[str, Any], rules: dict[str, Any]) -> dict[str, Any]:
         """
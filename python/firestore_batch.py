@@ -0,0 +1,88 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as gexc
+
+# Firestore 單個 WriteBatch 最多 500 個寫入
+MAX_BATCH_OPS = 500
+
+# 可以重試的暫時性錯誤
+RETRYABLE_ERRORS = (
+    gexc.Aborted,
+    gexc.DeadlineExceeded,
+    gexc.InternalServerError,
+    gexc.ServiceUnavailable,
+    gexc.TooManyRequests,
+)
+
+
+class FirestoreBatchWriter:
+    """
+    收集一個設計產生的所有 Firestore 寫入，最後用 WriteBatch 一次提交。
+
+    寫入按 MAX_BATCH_OPS 分組；每組遇到暫時性錯誤時以指數退避重試，
+    重試失敗或遇到非暫時性錯誤的組會記錄在提交報告中，不影響其他組。
+    db 可以是 firestore.client()，也可以是 LocalFirestore。
+    on_commit(kind, doc_ref, data, merge) 在每個寫入成功提交後調用，kind 為 "set" 或 "update"。
+    """
+
+    def __init__(self, db, max_attempts: int = 3, retry_delay: float = 0.5,
+                 on_commit: Optional[Callable[[str, Any, Dict[str, Any], bool], None]] = None):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_commit = on_commit
+        self._ops: List[Tuple[str, Any, Dict[str, Any], bool]] = []
+
+    def set(self, doc_ref, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", doc_ref, data, merge))
+
+    def update(self, doc_ref, data: Dict[str, Any]):
+        self._ops.append(("update", doc_ref, data, False))
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def _commit_chunk(self, ops: List[Tuple[str, Any, Dict[str, Any], bool]], report: Dict[str, Any]):
+        """提交一組寫入；最終失敗時拋出最後一個錯誤。"""
+        for attempt in range(1, self.max_attempts + 1):
+            batch = self.db.batch()
+            for kind, doc_ref, data, merge in ops:
+                if kind == "set":
+                    batch.set(doc_ref, data, merge=merge)
+                else:
+                    batch.update(doc_ref, data)
+            try:
+                report["round_trips"] += 1
+                batch.commit()
+                return
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                print(f"Firestore 批次提交失敗（第 {attempt} 次）: {e}. {delay} 秒後重試...")
+                time.sleep(delay)
+
+    def commit(self) -> Dict[str, Any]:
+        """
+        提交所有已收集的寫入。
+
+        :return: 提交報告，包含成功寫入數、網路往返次數和失敗的文件
+        """
+        ops, self._ops = self._ops, []
+        report = {"committed": 0, "round_trips": 0, "failed": []}
+        for start in range(0, len(ops), MAX_BATCH_OPS):
+            chunk = ops[start:start + MAX_BATCH_OPS]
+            try:
+                self._commit_chunk(chunk, report)
+                report["committed"] += len(chunk)
+                if self.on_commit is not None:
+                    for kind, doc_ref, data, merge in chunk:
+                        self.on_commit(kind, doc_ref, data, merge)
+            except Exception as e:
+                report["failed"].append({
+                    "document_ids": [doc_ref.id for _, doc_ref, _, _ in chunk],
+                    "error": str(e)
+                })
+                print(f"Firestore 批次提交失敗，{len(chunk)} 個寫入未保存: {e}")
+        return report
@@ -1,31 +1,192 @@
-from openai import OpenAI
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Iterator, Set
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from hedging import HedgePolicy, hedged_async, hedged_call
+from metrics import LLM_RETRIES
+from llm_cache import LLMResponseCache
+from llm_json import loads_lenient
+from llm_retry import backoff_delay, is_retryable
+from token_counter import count_message_tokens, count_tokens, check_budget
+import asyncio
 import time
 import json
 
-class GPTInterface:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+DEFAULT_SYSTEM_PROMPT = "You are a professional room designer."
+
+class BaseGPTInterface:
+    """同步和異步 GPT 接口共用的請求參數、快取和 token 用量記錄。"""
+
+    def __init__(self, cache: Optional[LLMResponseCache] = None, prompt_token_budget: Optional[int] = None,
+                 hedge_policy: Optional[HedgePolicy] = None):
+        self.cache = cache
+        self.prompt_token_budget = prompt_token_budget
+        # 設置後非串流請求使用對沖模式，見 hedging.HedgePolicy
+        self.hedge_policy = hedge_policy
+        self.last_usage: Dict[str, Any] = {}
+
+    def _request_params(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                        enforce_budget: bool = True) -> Dict[str, Any]:
+        params = {
+            "model": Config.GPT_MODEL,
+            "max_tokens": max_tokens or Config.MAX_TOKENS,
+            "temperature": Config.TEMPERATURE,
+            "messages": [
+                {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        # 發送前計算 prompt 的 token 數，超出預算時不發送
+        prompt_tokens = count_message_tokens(params["messages"], params["model"])
+        if enforce_budget:
+            check_budget(prompt_tokens, self.prompt_token_budget)
+        self.last_usage = {"prompt_tokens": prompt_tokens, "completion_tokens": None, "estimated": True}
+        return params
+
+    def _record_usage(self, usage, content: str, model: str, source: str = "api"):
+        """記錄並打印本次請求的 token 用量；API 沒有返回用量時使用估算值。"""
+        if usage is not None:
+            self.last_usage = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "estimated": False
+            }
+        else:
+            self.last_usage["completion_tokens"] = count_tokens(content, model)
+        self.last_usage["source"] = source
+        print(f"GPT token 用量（{source}）: prompt {self.last_usage['prompt_tokens']}，"
+              f"completion {self.last_usage['completion_tokens']}"
+              + ("（估算）" if self.last_usage["estimated"] else ""))
+
+    def _cache_key(self, params: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return LLMResponseCache.make_key(params["model"], params["messages"], params["max_tokens"], params["temperature"])
+
+
+class GPTInterface(BaseGPTInterface):
+    def __init__(self, api_key: str, cache: Optional[LLMResponseCache] = None, timeout: Optional[float] = None,
+                 prompt_token_budget: Optional[int] = None, hedge_policy: Optional[HedgePolicy] = None):
+        super().__init__(cache, prompt_token_budget, hedge_policy)
+        from openai import OpenAI  # SDK 導入很慢，建立客戶端時才載入
+
+        self.client = OpenAI(api_key=api_key, timeout=timeout) if timeout else OpenAI(api_key=api_key)
+        self._hedge_executor = None
+
+    def _complete(self, params: Dict[str, Any]):
+        """發送一次非串流請求；啟用對沖時可能同時發送兩個相同的請求。"""
+        if self.hedge_policy is None:
+            return self.client.chat.completions.create(**params)
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=Config.GPT_MAX_CONNECTIONS,
+                                                      thread_name_prefix="gpt-hedge")
+        return hedged_call(lambda: self.client.chat.completions.create(**params), self.hedge_policy,
+                           self._hedge_executor)
+
+    def complete_once(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                      timeout: Optional[float] = None) -> str:
+        """
+        發送一次請求，不重試，也不使用快取、對沖和 prompt token 預算。
+        用於提供者路由轉發的其他階段請求（例如 SVG），它們的長度和耗時與佈局請求不同，
+        不應影響佈局請求的對沖延遲和預算。
+
+        :param prompt: 提示
+        :param system_prompt: 系統消息
+        :param max_tokens: 回應的最大 token 數，None 表示使用 Config.MAX_TOKENS
+        :param timeout: 本次請求的超時（秒）
+        :return: 回應文本
+        """
+        params = self._request_params(prompt, system_prompt, max_tokens, enforce_budget=False)
+        if timeout:
+            params["timeout"] = timeout
+        response = self.client.chat.completions.create(**params)
+        content = response.choices[0].message.content
+        self._record_usage(getattr(response, "usage", None), content, params["model"])
+        return content
+
+    def chat_with_gpt(self, prompt: str, max_attempts: int = 3, retry_delay: float = Config.GPT_BACKOFF_BASE,
+                      system_prompt: Optional[str] = None) -> str:
+        params = self._request_params(prompt, system_prompt)
+        model = params["model"]
+
+        cache_key = self._cache_key(params)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print("GPT 回應命中快取")
+                self._record_usage(None, cached, model, source="cache")
+                return cached
+
+        for attempt in range(max_attempts):
+            try:
+                response = self._complete(params)
+                content = response.choices[0].message.content
+                self._record_usage(getattr(response, "usage", None), content, model)
+                if cache_key is not None:
+                    self.cache.put(cache_key, content)
+                return content
+            except Exception as e:
+                if attempt < max_attempts - 1 and is_retryable(e):
+                    delay = backoff_delay(attempt, e, retry_delay, Config.GPT_BACKOFF_MAX)
+                    print(f"嘗試 {attempt + 1} 失敗: {str(e)}. {delay:.1f} 秒後重試...")
+                    LLM_RETRIES.labels(provider="openai").inc()
+                    time.sleep(delay)
+                else:
+                    raise Exception(f"無法完成請求: {str(e)}") from e
+
+    def stream_chat_with_gpt(self, prompt: str, max_attempts: int = 3, retry_delay: float = Config.GPT_BACKOFF_BASE,
+                             system_prompt: Optional[str] = None) -> Iterator[str]:
+        """
+        以串流方式調用 GPT，邊生成邊返回文本片段。
+
+        只有在建立串流時失敗才會重試；一旦開始輸出，中途的錯誤直接拋出。
+
+        :param prompt: 提示
+        :param system_prompt: 系統消息，未提供時使用預設的設計師角色
+        :return: 文本片段的迭代器
+        """
+        params = self._request_params(prompt, system_prompt)
+
+        cache_key = self._cache_key(params)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print("GPT 回應命中快取")
+                self._record_usage(None, cached, params["model"], source="cache")
+                yield cached
+                return
 
-    def chat_with_gpt(self, prompt: str, max_attempts: int = 3, retry_delay: int = 5) -> str:
         for attempt in range(max_attempts):
             try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4",  
-                    messages=[
-                        {"role": "system", "content": "You are a professional room designer."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=3000,
-                    temperature=0.7,
+                stream = self.client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **params
                 )
-                return response.choices[0].message.content
+                break
             except Exception as e:
-                if attempt < max_attempts - 1:
-                    print(f"嘗試 {attempt + 1} 失敗: {str(e)}. {retry_delay} 秒後重試...")
-                    time.sleep(retry_delay)
+                if attempt < max_attempts - 1 and is_retryable(e):
+                    delay = backoff_delay(attempt, e, retry_delay, Config.GPT_BACKOFF_MAX)
+                    print(f"嘗試 {attempt + 1} 失敗: {str(e)}. {delay:.1f} 秒後重試...")
+                    LLM_RETRIES.labels(provider="openai").inc()
+                    time.sleep(delay)
                 else:
-                    raise Exception(f"無法完成請求: {str(e)}")
+                    raise Exception(f"無法完成請求: {str(e)}") from e
+
+        parts = []
+        usage = None
+        for chunk in stream:
+            # 最後一個片段沒有 choices，只帶有整個請求的 token 用量
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+        content = ''.join(parts)
+        self._record_usage(usage, content, params["model"])
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
 
 
     def generate_room_design(self, design_requirements: dict[str, Any], environment_data: dict[str, Any]) -> str:
@@ -117,7 +278,7 @@ class GPTInterface:
         }}
         """
         response = self.chat_with_gpt(prompt)
-        return json.loads(response)
+        return self.parse_gpt_response(response)
 
     def suggest_improvements(self, design: str, analysis: dict[str, Any]) -> List[dict[str, str]]:
         """
@@ -156,7 +317,7 @@ class GPTInterface:
         ]
         """
         response = self.chat_with_gpt(prompt)
-        return json.loads(response)
+        return self.parse_gpt_response(response)
 
     def parse_gpt_response(self, response: str) -> dict[str, Any]:
         """
@@ -165,18 +326,123 @@ class GPTInterface:
         :param response: GPT 的原始回應字符串
         :return: 解析後的 JSON 對象
         """
+        value = loads_lenient(response)
+        if value is None:
+            print("無法解析 GPT 回應中的 JSON")
+            return {"error": "Invalid JSON response", "raw_response": response}
+        return value
+
+
+class AsyncGPTInterface(BaseGPTInterface):
+    """
+    基於 AsyncOpenAI 的異步 GPT 接口，一個進程內可以同時處理多個設計而不佔用線程。
+
+    所有請求共用一個 HTTP 連線池；失敗時按 llm_retry 的規則以帶抖動的指數退避重試，
+    並遵守服務端的 Retry-After。deadline 限制包括重試在內的總時長。
+    取消調用 chat 的任務即可中止請求；cancel_all 取消所有進行中的請求。
+    """
+
+    def __init__(self, api_key: str, cache: Optional[LLMResponseCache] = None, timeout: Optional[float] = None,
+                 prompt_token_budget: Optional[int] = None, max_connections: int = Config.GPT_MAX_CONNECTIONS,
+                 http_client: Optional['httpx.AsyncClient'] = None, hedge_policy: Optional[HedgePolicy] = None):
+        super().__init__(cache, prompt_token_budget, hedge_policy)
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        self.http_client = http_client or DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        # 重試由 chat 自己控制，關閉 SDK 內建的重試
+        options = {"api_key": api_key, "http_client": self.http_client, "max_retries": 0}
+        if timeout:
+            options["timeout"] = timeout
+        self.client = AsyncOpenAI(**options)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def chat(self, prompt: str, system_prompt: Optional[str] = None, max_attempts: int = 3,
+                   deadline: Optional[float] = Config.GPT_DEADLINE,
+                   retry_delay: float = Config.GPT_BACKOFF_BASE) -> str:
+        """
+        異步調用 GPT。
+
+        :param prompt: 提示
+        :param system_prompt: 系統消息，未提供時使用預設的設計師角色
+        :param max_attempts: 最多嘗試次數
+        :param deadline: 包括重試在內的總時限（秒），None 表示不限制
+        :param retry_delay: 退避的基準等待時間（秒）
+        :return: GPT 的回應文本
+        :raises TimeoutError: 超過 deadline 時
+        """
+        task = asyncio.current_task()
+        self._tasks.add(task)
         try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            print("警告：GPT 回應不是有效的 JSON 格式。嘗試修復...")
-            # 這裡可以添加一些基本的修復邏輯，例如:
-            # - 移除不合法的控制字符
-            # - 處理未閉合的括號
-            # - 處理缺少逗號的情況
-            # 但要注意，這種修復可能不總是成功或正確
-            cleaned_response = response.replace('\n', '').replace('\r', '').strip()
+            if deadline is None:
+                return await self._chat(prompt, system_prompt, max_attempts, None, retry_delay)
+            loop = asyncio.get_running_loop()
+            expires = loop.time() + deadline
             try:
-                return json.loads(cleaned_response)
-            except json.JSONDecodeError as e:
-                print(f"無法修復 JSON: {str(e)}")
-                return {"error": "Invalid JSON response", "raw_response": response}
\ No newline at end of file
+                async with asyncio.timeout_at(expires):
+                    return await self._chat(prompt, system_prompt, max_attempts, expires, retry_delay)
+            except TimeoutError:
+                raise TimeoutError(f"GPT 請求超過 {deadline} 秒的時限")
+        finally:
+            self._tasks.discard(task)
+
+    async def _chat(self, prompt: str, system_prompt: Optional[str], max_attempts: int,
+                    expires: Optional[float], retry_delay: float) -> str:
+        params = self._request_params(prompt, system_prompt)
+        cache_key = self._cache_key(params)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                print("GPT 回應命中快取")
+                self._record_usage(None, cached, params["model"], source="cache")
+                return cached
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(max_attempts):
+            try:
+                response = await self._complete(params)
+                content = response.choices[0].message.content
+                self._record_usage(getattr(response, "usage", None), content, params["model"])
+                if cache_key is not None:
+                    await asyncio.to_thread(self.cache.put, cache_key, content)
+                return content
+            except Exception as e:
+                if attempt >= max_attempts - 1 or not is_retryable(e):
+                    raise Exception(f"無法完成請求: {str(e)}") from e
+                delay = backoff_delay(attempt, e, retry_delay, Config.GPT_BACKOFF_MAX)
+                # 等待後已經沒有時間完成請求時直接放棄
+                if expires is not None and loop.time() + delay >= expires:
+                    raise Exception(f"無法完成請求: {str(e)}（重試等待 {delay:.1f} 秒會超過時限）") from e
+                print(f"嘗試 {attempt + 1} 失敗: {str(e)}. {delay:.1f} 秒後重試...")
+                LLM_RETRIES.labels(provider="openai").inc()
+                await asyncio.sleep(delay)
+
+    async def _complete(self, params: Dict[str, Any]):
+        """發送一次非串流請求；啟用對沖時落後的請求會被取消。"""
+        if self.hedge_policy is None:
+            return await self.client.chat.completions.create(**params)
+        return await hedged_async(lambda: self.client.chat.completions.create(**params), self.hedge_policy)
+
+    def cancel_all(self) -> int:
+        """
+        取消所有進行中的 chat 請求。
+
+        :return: 被取消的請求數量
+        """
+        tasks = [task for task in self._tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def aclose(self):
+        """取消進行中的請求並關閉連線池。"""
+        self.cancel_all()
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
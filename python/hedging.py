@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor
+from concurrent.futures import wait as wait_futures
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class LatencyTracker:
+    """保存最近 window 次請求的耗時，用來估計延遲的百分位數。線程安全。"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        計算最近請求耗時的百分位數（最近秩法）。
+
+        :param percent: 0 到 100 之間的百分位
+        :return: 耗時（秒），沒有樣本時返回 None
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, -(-len(samples) * percent // 100))
+        return samples[int(rank) - 1]
+
+
+class HedgePolicy:
+    """
+    對沖請求的策略：第一個請求在最近耗時的 percentile 百分位內還沒有返回時，再發送一個相同的請求。
+
+    額外花費用令牌桶限制：每個主請求增加 max_extra_ratio 個令牌（最多累積 burst 個），
+    每個對沖請求消耗一個，因此長期來看對沖請求不超過主請求的 max_extra_ratio 倍。
+    樣本少於 min_samples 時使用 default_delay，延遲總是限制在 [min_delay, max_delay] 內。
+    """
+
+    def __init__(self, tracker: Optional[LatencyTracker] = None, percentile: float = 95,
+                 max_extra_ratio: float = 0.1, min_samples: int = 20, default_delay: float = 10.0,
+                 min_delay: float = 0.5, max_delay: float = 60.0, burst: float = 2.0):
+        self.tracker = tracker or LatencyTracker()
+        self.percentile = percentile
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "denied": 0}
+
+    def delay(self) -> float:
+        """目前應等待多久才發送對沖請求（秒）。"""
+        if len(self.tracker) < self.min_samples:
+            value = self.default_delay
+        else:
+            value = self.tracker.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def on_request(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.max_extra_ratio)
+
+    def try_hedge(self) -> bool:
+        """在花費上限內時佔用一個令牌並返回 True。"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.stats["hedges"] += 1
+                return True
+            self.stats["denied"] += 1
+            return False
+
+    def on_result(self, seconds: float, hedge_won: bool):
+        """
+        記錄一次請求的結果。
+
+        :param seconds: 主請求的耗時；對沖請求勝出時主請求還沒完成，
+                        傳入從主請求發出到返回的時間，這是主請求耗時的下限
+        :param hedge_won: 是否由對沖請求返回結果
+        """
+        self.tracker.record(seconds)
+        if hedge_won:
+            with self._lock:
+                self.stats["hedge_wins"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["delay"] = round(self.delay(), 3)
+        stats["samples"] = len(self.tracker)
+        return stats
+
+
+async def hedged_async(call: Callable[[], Awaitable[Any]], policy: HedgePolicy) -> Any:
+    """
+    以對沖方式執行異步請求，返回最先成功的結果，並取消另一個請求。
+
+    :param call: 每次調用都發起一個新請求的協程函數
+    :param policy: 對沖策略
+    :return: 最先成功的請求結果；兩個請求都失敗時拋出主請求的異常
+    """
+    policy.on_request()
+    start = time.perf_counter()
+    primary = asyncio.ensure_future(call())
+    tasks = [primary]
+    try:
+        delay = policy.delay()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done and policy.try_hedge():
+            print(f"GPT 請求超過 {delay:.1f} 秒未返回，發送對沖請求")
+            tasks.append(asyncio.ensure_future(call()))
+
+        pending = set(tasks)
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda item: item is not primary):
+                if task.exception() is None:
+                    # 延遲分佈描述的是主請求；只記錄對沖請求自己的耗時會讓百分位數越來越低
+                    policy.on_result(time.perf_counter() - start, task is not primary)
+                    return task.result()
+                if first_error is None or task is primary:
+                    first_error = task.exception()
+        raise first_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def hedged_call(call: Callable[[], Any], policy: HedgePolicy, executor: Executor) -> Any:
+    """
+    以對沖方式執行同步請求。
+
+    兩個請求都在 executor 中執行；同步請求無法從外部中止，
+    落後的請求若還沒開始就被取消，已經開始的會在背景完成，結果被丟棄。
+
+    :param call: 每次調用都發起一個新請求的函數
+    :param policy: 對沖策略
+    :param executor: 執行請求的線程池
+    :return: 最先成功的請求結果；兩個請求都失敗時拋出主請求的異常
+    """
+    policy.on_request()
+    start = time.perf_counter()
+    primary = executor.submit(call)
+    futures = [primary]
+    try:
+        delay = policy.delay()
+        done, _ = wait_futures([primary], timeout=delay)
+        if not done and policy.try_hedge():
+            print(f"GPT 請求超過 {delay:.1f} 秒未返回，發送對沖請求")
+            futures.append(executor.submit(call))
+
+        pending = set(futures)
+        first_error = None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda item: item is not primary):
+                if future.exception() is None:
+                    policy.on_result(time.perf_counter() - start, future is not primary)
+                    return future.result()
+                if first_error is None or future is primary:
+                    first_error = future.exception()
+        raise first_error
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,258 @@
+import json
+import os
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 每條記錄在索引文件中佔 8 個字節（起始偏移量）
+_OFFSET_TYPECODE = 'Q'
+_OFFSET_SIZE = array(_OFFSET_TYPECODE).itemsize
+
+
+class DesignHistoryLog:
+    """
+    只追加的設計歷史記錄，使用 JSON Lines 格式保存，並以偏移量索引支援按位置讀取。
+
+    - log_path: 每行一個設計的 .jsonl 文件
+    - log_path + '.idx': 每條記錄的起始偏移量（8 字節無符號整數）
+
+    追加操作是 O(1)：只寫入一行和一個偏移量，並 fsync。多個進程通過文件鎖串行追加。
+    某個進程寫到一半崩潰時，文件尾部會留下不完整的行；啟動時和每次追加前（持有鎖時）
+    都會截斷它，並補上已完整寫入但還沒有索引的記錄。讀取只按索引中的偏移量進行。
+    """
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.index_path = log_path + '.idx'
+        self.lock_path = log_path + '.lock'
+        self._lock = threading.Lock()
+        self._offsets = array(_OFFSET_TYPECODE)
+        with self._locked():
+            self._recover()
+
+    @contextmanager
+    def _locked(self):
+        """同時持有線程鎖和跨進程的文件鎖。"""
+        with self._lock:
+            with open(self.lock_path, 'a+b') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    else:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _sync_index(self):
+        """讀入其他進程追加的索引條目。"""
+        known_bytes = len(self._offsets) * _OFFSET_SIZE
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if index_size <= known_bytes:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(known_bytes)
+            data = f.read()
+        usable = len(data) - len(data) % _OFFSET_SIZE
+        self._offsets.frombytes(data[:usable])
+
+    def _recover(self):
+        """載入索引，並確保日誌和索引一致。"""
+        if not os.path.exists(self.log_path):
+            open(self.log_path, 'ab').close()
+
+        log_size = os.path.getsize(self.log_path)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % _OFFSET_SIZE
+            self._offsets.frombytes(data[:usable])
+
+        # 去掉指向文件末尾之後的偏移量
+        while self._offsets and self._offsets[-1] >= log_size:
+            self._offsets.pop()
+
+        self._repair_tail()
+        self._write_index()
+
+    def _repair_tail(self) -> bool:
+        """
+        從最後一個已索引的記錄之後開始掃描，補上完整行的索引並截斷不完整的尾行。
+        調用方需持有鎖。
+
+        :return: 是否補上了新的索引（需要重寫索引文件）
+        """
+        with open(self.log_path, 'rb+') as f:
+            log_size = f.seek(0, os.SEEK_END)
+            if self._offsets:
+                f.seek(self._offsets[-1])
+                f.readline()
+            else:
+                f.seek(0)
+            position = f.tell()
+            if position >= log_size:
+                return False
+            indexed = len(self._offsets)
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b'\n'):
+                    print(f"歷史記錄尾部有不完整的記錄，截斷於偏移量 {position}")
+                    f.truncate(position)
+                    break
+                self._offsets.append(position)
+                position += len(line)
+        return len(self._offsets) > indexed
+
+    def _write_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            self._offsets.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, design: Dict[str, Any]) -> int:
+        """
+        追加一個設計。
+
+        :param design: 設計結果字典
+        :return: 新記錄的位置（從 0 開始）
+        """
+        with self._locked():
+            self._sync_index()
+            if self._repair_tail():
+                self._write_index()
+            return self._append_unlocked([design])
+
+    def _append_unlocked(self, designs: List[Dict[str, Any]]) -> int:
+        """一次寫入多條記錄並 fsync，返回最後一條記錄的位置。調用方需持有鎖。"""
+        lines = [(json.dumps(design, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+                 for design in designs]
+        with open(self.log_path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        offsets = array(_OFFSET_TYPECODE)
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line)
+        with open(self.index_path, 'ab') as f:
+            offsets.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._offsets.extend(offsets)
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        self._sync_index()
+        return len(self._offsets)
+
+    def get(self, position: int) -> Optional[Dict[str, Any]]:
+        """
+        按位置讀取單個設計。
+
+        :param position: 記錄位置，支援負數（-1 表示最新）
+        :return: 設計字典，超出範圍時返回 None
+        """
+        self._sync_index()
+        try:
+            offset = self._offsets[position]
+        except IndexError:
+            return None
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def iter_from(self, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        從指定位置開始逐條讀取設計，不會一次載入整個文件。
+        只讀取開始時已索引的記錄，之後追加的記錄和未索引的殘留行都不會被讀到。
+
+        :param start: 起始位置，支援負數（-1 表示最新）
+        """
+        self._sync_index()
+        end = len(self._offsets)
+        if start < 0:
+            start = max(0, start + end)
+        if start >= end:
+            return
+        with open(self.log_path, 'rb') as f:
+            for position in range(start, end):
+                offset = self._offsets[position]
+                if f.tell() != offset:
+                    f.seek(offset)
+                yield json.loads(f.readline())
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        一次性把舊的 design_history.json（JSON 數組）導入日誌，
+        導入後舊文件改名為 .migrated，避免重複導入。
+
+        導入前把日誌當時的大小寫入 json_path + '.migrating' 標記，舊文件改名後才刪除標記。
+        遷移中途崩潰時舊文件和標記都還在，下次遷移先把日誌截斷回標記的位置再重新導入，不會重複記錄。
+
+        :param json_path: 舊歷史文件路徑
+        :return: 導入的設計數量
+        """
+        marker_path = json_path + '.migrating'
+        with self._locked():
+            # 其他進程可能已經完成遷移
+            if not os.path.exists(json_path):
+                if os.path.exists(marker_path):  # 改名後、刪除標記前崩潰
+                    os.remove(marker_path)
+                return 0
+            self._sync_index()
+            if os.path.exists(marker_path):
+                self._rollback_migration(marker_path)
+            elif self._repair_tail():
+                self._write_index()
+            with open(json_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+            self._write_marker(marker_path, os.path.getsize(self.log_path))
+            if history:
+                self._append_unlocked(history)
+            os.replace(json_path, json_path + '.migrated')
+            os.remove(marker_path)
+        print(f"已將 {len(history)} 筆設計從 {json_path} 遷移到 {self.log_path}")
+        return len(history)
+
+    @staticmethod
+    def _write_marker(marker_path: str, offset: int):
+        tmp_path = marker_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, marker_path)
+
+    def _rollback_migration(self, marker_path: str):
+        """把日誌和索引截斷回上次未完成的遷移開始前的位置。調用方需持有鎖。"""
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            offset = json.load(f)["offset"]
+        with open(self.log_path, 'rb+') as f:
+            if f.seek(0, os.SEEK_END) > offset:
+                f.truncate(offset)
+                f.flush()
+                os.fsync(f.fileno())
+        while self._offsets and self._offsets[-1] >= offset:
+            self._offsets.pop()
+        self._write_index()
+        print(f"上次的歷史記錄遷移沒有完成，日誌已截斷回偏移量 {offset}，重新導入")
@@ -0,0 +1,196 @@
+import itertools
+import math
+from typing import Any, Dict, Iterator, List, Tuple
+
+from data_models import DesignData, Location
+from score_calculator import ScoreCalculator
+from placement_optimizer import PlacementOptimizer
+
+ROOM_NAMES = {
+    "livingRoom": "客廳",
+    "bedroom": "臥室",
+    "kitchen": "廚房",
+    "bathroom": "浴室"
+}
+
+# 每個分項的滿分，用來判斷配置的主要特點
+COMPONENT_MAX = {
+    "temperature_score": 50,
+    "light_score": 30,
+    "humidity_score": 20
+}
+
+COMPONENT_THEMES = {
+    "temperature_score": "溫度適應",
+    "light_score": "自然採光",
+    "humidity_score": "濕度平衡"
+}
+
+# (房間類型, 在該類型中的序號)
+Slot = Tuple[str, int]
+
+
+class LocalLayoutEngine:
+    """
+    不調用 LLM 的本地佈局引擎。
+
+    枚舉房間到位置的分配，用 ScoreCalculator 評分，返回得分最高且互不相同的配置，
+    配置的格式與 GPT 生成的相同（description 使用「客廳在位置A」的固定格式）。
+    房間總數不超過位置數時，每個位置只放一個房間；否則允許多個房間共用位置。
+    候選分配超過 max_candidates 時改用 PlacementOptimizer 的分支定界搜索，最多搜索 time_limit 秒。
+    """
+
+    def __init__(self, score_calculator: ScoreCalculator = None, max_candidates: int = 50000,
+                 time_limit: float = None):
+        self.score_calculator = score_calculator or ScoreCalculator()
+        self.optimizer = PlacementOptimizer(self.score_calculator)
+        self.max_candidates = max_candidates
+        self.time_limit = time_limit
+
+    def generate_configurations(self, design_data: DesignData, locations: dict[str, Location],
+                                room_areas: dict[str, float], room_environment_rules: dict[str, Any],
+                                top_k: int = 3) -> List[dict[str, Any]]:
+        """
+        生成得分最高的 top_k 個配置。
+
+        :param design_data: 設計數據
+        :param locations: 各位置的環境數據
+        :param room_areas: 房間面積字典
+        :param room_environment_rules: 房間環境規則字典
+        :param top_k: 返回的配置數量
+        :return: 與 GPT 配置格式相同的配置列表，已包含 energy_efficiency_report
+        """
+        slots = self._slots(design_data.rooms)
+        if not slots or not locations:
+            return []
+
+        location_names = sorted(locations)
+        counts = {room_type: sum(1 for slot in slots if slot[0] == room_type) for room_type in ROOM_NAMES
+                  if any(slot[0] == room_type for slot in slots)}
+        exclusive = len(slots) <= len(location_names)
+
+        if self._candidate_count(counts, len(location_names), exclusive) > self.max_candidates:
+            search = self.optimizer.optimize(counts, design_data.windows, locations, room_environment_rules,
+                                             top_k=top_k, time_limit=self.time_limit, exclusive=exclusive)
+            if not search["optimal"]:
+                print(f"佈局搜索在 {search['elapsed']} 秒內未完成，與最優解的差距最多 {search['gap']} 分")
+            scored = [
+                (-result["scores"]["total_score"],
+                 {room_type: tuple(result["room_locations"][room_type]) for room_type in counts},
+                 result["scores"])
+                for result in search["assignments"]
+            ]
+        else:
+            scored = []
+            for assignment in self._candidates(counts, location_names, exclusive):
+                scores = self.score_assignment(assignment, design_data, locations, room_areas, room_environment_rules)
+                scored.append((-scores["total_score"], assignment, scores))
+        # 同分時按分配本身排序，保證結果可重現
+        scored.sort(key=lambda item: (item[0], sorted(item[1].items())))
+
+        configurations = []
+        for rank, (_, assignment, scores) in enumerate(scored[:top_k], start=1):
+            configurations.append(self._build_configuration(rank, assignment, scores, design_data, locations))
+        return configurations
+
+    @staticmethod
+    def _slots(rooms: dict[str, int]) -> List[Slot]:
+        return [(room_type, index) for room_type in ROOM_NAMES for index in range(rooms.get(room_type, 0))]
+
+    @staticmethod
+    def _candidates(counts: dict[str, int], location_names: List[str], exclusive: bool) -> Iterator[Dict[str, Tuple[str, ...]]]:
+        """
+        產出互不相同的分配：房間類型 -> 已排序的位置元組。
+        同類型房間之間交換位置視為同一個分配。
+        """
+        room_types = list(counts)
+
+        def assign(index: int, used: frozenset) -> Iterator[Dict[str, Tuple[str, ...]]]:
+            if index == len(room_types):
+                yield {}
+                return
+            room_type = room_types[index]
+            if exclusive:
+                options = itertools.combinations([name for name in location_names if name not in used], counts[room_type])
+            else:
+                options = itertools.combinations_with_replacement(location_names, counts[room_type])
+            for option in options:
+                for rest in assign(index + 1, used | frozenset(option) if exclusive else used):
+                    yield {room_type: option, **rest}
+
+        yield from assign(0, frozenset())
+
+    @staticmethod
+    def _candidate_count(counts: dict[str, int], location_count: int, exclusive: bool) -> int:
+        total = 1
+        remaining = location_count
+        for count in counts.values():
+            if exclusive:
+                total *= math.comb(remaining, count)
+                remaining -= count
+            else:
+                total *= math.comb(location_count + count - 1, count)
+        return total
+
+    def score_assignment(self, assignment: Dict[str, Tuple[str, ...]], design_data: DesignData,
+                         locations: dict[str, Location], room_areas: dict[str, float],
+                         room_environment_rules: dict[str, Any]) -> dict[str, float]:
+        """
+        用 ScoreCalculator 計算一個分配的分數。
+
+        :param assignment: 房間類型 -> 位置元組
+        :return: calculate_total_score 的結果
+        """
+        temp_data = {room_type: [locations[name].temperature for name in names] for room_type, names in assignment.items()}
+        humidity_data = {room_type: [locations[name].humidity for name in names] for room_type, names in assignment.items()}
+        light_data = {room_type: [locations[name].sunlight for name in names] for room_type, names in assignment.items()}
+        return self.score_calculator.calculate_total_score(
+            room_areas, design_data.windows, light_data, temp_data, humidity_data, room_environment_rules
+        )
+
+    def _build_configuration(self, rank: int, assignment: Dict[str, Tuple[str, ...]], scores: dict[str, float],
+                             design_data: DesignData, locations: dict[str, Location]) -> dict[str, Any]:
+        strongest = max(COMPONENT_MAX, key=lambda key: scores[key] / COMPONENT_MAX[key])
+        theme = COMPONENT_THEMES[strongest]
+
+        # 固定格式的位置描述，extract_room_locations 可以從中取回分配
+        placement = "，".join(
+            f"{ROOM_NAMES[room_type]}在{name}" + (f"（{names.count(name)} 間）" if names.count(name) > 1 else "")
+            for room_type, names in assignment.items() for name in sorted(set(names))
+        )
+        details = "；".join(
+            f"{name}（溫度 {locations[name].temperature}°C，濕度 {locations[name].humidity}%，光照 {locations[name].sunlight} 勒克斯）"
+            f"安排{ROOM_NAMES[room_type]}"
+            for room_type, names in assignment.items() for name in sorted(set(names))
+        )
+        description = (
+            f"{placement}。"
+            f"此方案以{theme}為主要特點：{details}。"
+            f"房間位置由本地佈局引擎根據各位置的環境數據和房間環境規則評分選出，總分 {scores['total_score']}。"
+        )
+
+        report = self.score_calculator.generate_energy_efficiency_report(scores)
+        return {
+            "name": f"方案{rank}：{theme}優先配置",
+            "description": description,
+            "advantages": {
+                "client_requirements": f"滿足{_describe_rooms(design_data.rooms)}的房間需求。"
+                                       + (f"特殊要求：{design_data.specialRequest}" if design_data.specialRequest else ""),
+                "environment_optimization": "；".join(report["explanation"]),
+                "space_utilization": "每個房間都安排在環境條件最接近其理想值的位置。",
+                "functionality": "房間分配只依據可量測的環境數據，結果可重現。",
+                "innovation": "由本地引擎在所有可行分配中搜索得出，不依賴語言模型。"
+            },
+            "considerations": {
+                "energy_efficiency": f"溫度 {scores['temperature_score']} / 50，光照 {scores['light_score']} / 30，"
+                                     f"濕度 {scores['humidity_score']} / 20。",
+                "comfort": "實際舒適度仍受隔熱、通風和家具擺放影響。"
+            },
+            "room_locations": {room_type: list(names) for room_type, names in assignment.items()},
+            "engine": "local",
+            "energy_efficiency_report": report
+        }
+
+
+def _describe_rooms(rooms: dict[str, int]) -> str:
+    return "、".join(f"{ROOM_NAMES.get(room_type, room_type)} {count} 間" for room_type, count in rooms.items() if count)
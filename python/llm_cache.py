@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+
+class LLMResponseCache:
+    """
+    以 SQLite 保存 LLM 回應的磁碟快取，多個進程可以共用同一個文件。
+
+    快取鍵是模型、訊息、max_tokens 和 temperature 的 SHA-256 雜湊。
+    條目超過 ttl_seconds 視為過期；條目數超過 max_entries 時，
+    依最近使用時間淘汰最舊的條目（LRU）。
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 1000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO llm_cache_stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> str:
+        """
+        生成快取鍵。
+
+        :param model: 模型名稱
+        :param messages: 發送給模型的訊息列表
+        :param max_tokens: 最大 token 數
+        :param temperature: 溫度參數
+        :return: 十六進位的 SHA-256 雜湊字符串
+        """
+        canonical = json.dumps(
+            {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        讀取快取的回應，未命中或已過期時返回 None。
+
+        :param key: 快取鍵
+        :return: 快取的回應字符串
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                conn.execute("UPDATE llm_cache_stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.execute("UPDATE llm_cache_stats SET value = value + 1 WHERE name = 'hits'")
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        寫入回應，並在超出容量時淘汰最久未使用的條目。
+
+        :param key: 快取鍵
+        :param response: 模型回應
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回命中、未命中次數和目前條目數。
+        """
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM llm_cache_stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hit_rate": counters.get("hits", 0) / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+            conn.execute("UPDATE llm_cache_stats SET value = 0")
@@ -0,0 +1,257 @@
+import json
+import re
+from typing import Any, List, Optional
+
+# ```json ... ``` 之類的 markdown 代碼塊標記
+_FENCE_RE = re.compile(r'```[a-zA-Z]*')
+# "configurations": [ 的開頭，或者整個回應直接是一個數組
+_CONFIGURATIONS_RE = re.compile(r'"configurations"\s*:\s*\[')
+_BARE_ARRAY_RE = re.compile(r'\s*(?:```[a-zA-Z]*\s*)?\[')
+
+_CLOSING = {'{': '}', '[': ']'}
+
+
+def strip_fences(text: str) -> str:
+    """移除 markdown 代碼塊標記。"""
+    return _FENCE_RE.sub('', text)
+
+
+def remove_trailing_commas(text: str) -> str:
+    """
+    移除 } 或 ] 之前多餘的逗號，字符串內的內容保持不變。
+
+    :param text: JSON 文本
+    :return: 移除尾隨逗號後的文本
+    """
+    result = []
+    pending_comma = None  # 尚未確定是否保留的逗號及其後的空白
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            result.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in '}]':
+                result.extend(pending_comma)
+            pending_comma = None
+        if char == ',':
+            pending_comma = [char]
+        else:
+            result.append(char)
+            if char == '"':
+                in_string = True
+    if pending_comma is not None:
+        result.extend(pending_comma)
+    return ''.join(result)
+
+
+def close_truncated(text: str) -> Optional[str]:
+    """
+    補全被截斷的 JSON：閉合未結束的字符串和括號。
+    若最後一個值不完整，退回到上一個逗號再補全。
+
+    :param text: 可能被截斷的 JSON 文本
+    :return: 可以解析的文本，無法補全時返回 None
+    """
+    stack = []
+    cut_points = []  # 逗號的位置，截斷到這裡可以丟掉不完整的最後一項
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSING:
+            stack.append(char)
+        elif char in '}]':
+            if stack:
+                stack.pop()
+        elif char == ',' and stack:
+            cut_points.append((i, list(stack)))
+
+    candidates = []
+    tail = text[:-1] if escaped else text
+    candidates.append(tail + ('"' if in_string else '') + ''.join(_CLOSING[c] for c in reversed(stack)))
+    for position, open_stack in reversed(cut_points):
+        candidates.append(text[:position] + ''.join(_CLOSING[c] for c in reversed(open_stack)))
+
+    for candidate in candidates:
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def loads_lenient(text: str) -> Any:
+    """
+    盡量解析 LLM 輸出的 JSON：容忍代碼塊標記、前後說明文字、尾隨逗號和截斷。
+
+    :param text: LLM 的原始回應
+    :return: 解析後的對象，無法解析時返回 None
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    cleaned = strip_fences(text)
+    starts = [i for i in (cleaned.find('{'), cleaned.find('[')) if i != -1]
+    if not starts:
+        return None
+    cleaned = remove_trailing_commas(cleaned[min(starts):])
+
+    # 去掉最後一個閉合括號之後的說明文字
+    decoder = json.JSONDecoder()
+    try:
+        value, _ = decoder.raw_decode(cleaned)
+        return value
+    except json.JSONDecodeError:
+        pass
+
+    completed = close_truncated(cleaned.rstrip())
+    if completed is None:
+        return None
+    return json.loads(completed)
+
+
+class ConfigurationStreamParser:
+    """
+    增量解析 LLM 回應中的 "configurations" 數組（或整個回應就是數組的情況）。
+
+    每次 feed 一段文本，返回剛好閉合的元素；只掃描新到的字符。
+    元素內的尾隨逗號會被修復；回應結束時調用 close()，可以取回被截斷的最後一個元素。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self._pos = 0              # 下一個要掃描的字符位置
+        self._started = False      # 已經找到數組的開頭
+        self._depth = 0            # 數組內的嵌套深度
+        self._in_string = False
+        self._escaped = False
+        self._element_start = None
+        self._closed = False       # 數組已結束
+        self.elements: List[Any] = []
+
+    def _find_array_start(self) -> Optional[int]:
+        match = _CONFIGURATIONS_RE.search(self.buffer)
+        if match:
+            return match.end()
+        match = _BARE_ARRAY_RE.match(self.buffer)
+        if match:
+            return match.end()
+        return None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        加入一段新的回應文本。
+
+        :param chunk: 新收到的文本
+        :return: 新完成的元素列表
+        """
+        self.buffer += chunk
+        if self._closed:
+            return []
+        if not self._started:
+            start = self._find_array_start()
+            if start is None:
+                return []
+            self._started = True
+            self._pos = start
+
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSING:
+                if self._depth == 0:
+                    self._element_start = i
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    self._closed = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    element = self._parse_element(buffer[self._element_start:i + 1])
+                    if element is not None:
+                        completed.append(element)
+                    self._element_start = None
+        self._pos = len(buffer)
+        self.elements.extend(completed)
+        return completed
+
+    def close(self) -> List[Any]:
+        """
+        結束解析。若最後一個元素被截斷，嘗試補全後返回。
+
+        :return: 補全的元素列表（最多一個）
+        """
+        recovered = []
+        if not self._closed and self._element_start is not None:
+            completed = close_truncated(remove_trailing_commas(self.buffer[self._element_start:]).rstrip())
+            if completed is not None:
+                print("警告：回應被截斷，已補全最後一個配置")
+                recovered.append(json.loads(completed))
+        self._closed = True
+        self._element_start = None
+        self.elements.extend(recovered)
+        return recovered
+
+    @staticmethod
+    def _parse_element(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return json.loads(remove_trailing_commas(text))
+        except json.JSONDecodeError as e:
+            print(f"無法解析配置: {e}")
+            return None
+
+
+def parse_configurations(text: str) -> List[Any]:
+    """
+    從完整的 LLM 回應中取出 configurations 數組。
+
+    :param text: LLM 的原始回應
+    :return: 配置列表，找不到時返回空列表
+    """
+    parser = ConfigurationStreamParser()
+    parser.feed(text)
+    parser.close()
+    if parser.elements:
+        return parser.elements
+
+    value = loads_lenient(text)
+    if isinstance(value, dict) and isinstance(value.get('configurations'), list):
+        return value['configurations']
+    if isinstance(value, list):
+        return value
+    return []
@@ -0,0 +1,216 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from gpt_interface import GPTInterface
+from llm_retry import is_client_error
+from metrics import LLM_FAILOVERS, LLM_REQUEST_SECONDS
+
+
+class AllProvidersFailed(Exception):
+    """所有提供者都失敗或被熔斷。"""
+
+
+class CircuitBreaker:
+    """
+    單個 LLM 提供者的熔斷器。
+
+    連續失敗 failure_threshold 次後打開，recovery_timeout 秒內的請求直接拒絕；
+    之後進入半開狀態，只放行一個探測請求，成功則關閉，失敗則重新打開。
+    耗時超過 slow_call_threshold 的成功請求也計為失敗，提供者變慢時同樣會被熔斷。
+    探測請求沒有結果就結束時（例如串流被放棄）調用 release_probe；
+    超過 probe_timeout 秒仍沒有結果的探測也視為已結束，下一個調用者可以重新探測。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 30.0,
+                 slow_call_threshold: Optional[float] = None, probe_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "slow_calls": 0, "last_latency": None,
+                      "last_error": None}
+
+    def allow(self) -> bool:
+        """判斷是否可以發送請求；半開狀態下只有第一個調用者獲得探測機會。"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.probe_timeout):
+                self._probing = True
+                self._probe_started = now
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.stats["last_latency"] = round(latency, 3)
+            if self.slow_call_threshold is not None and latency > self.slow_call_threshold:
+                self.stats["slow_calls"] += 1
+                self._failure(f"請求耗時 {latency:.1f} 秒")
+                return
+            self.stats["successes"] += 1
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self._failure(str(error))
+
+    def release_probe(self):
+        """請求沒有結果就結束（被放棄或在客戶端被拒絕），不改變狀態，只讓出探測機會。"""
+        with self._lock:
+            self._probing = False
+
+    def _failure(self, reason: str):
+        self.stats["failures"] += 1
+        self.stats["last_error"] = reason
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.stats}
+
+
+class LLMProvider(ABC):
+    """LLM 提供者的共同接口：一次請求、不重試，重試和切換由 ProviderRouter 負責。"""
+
+    name = "provider"
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker or CircuitBreaker()
+
+    @abstractmethod
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None) -> str:
+        """發送一次請求並返回回應文本。"""
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    通過 GPTInterface 調用 OpenAI。
+
+    預設沿用它的快取、token 預算和對沖設置（佈局請求）；direct=True 時直接發送請求，
+    使用調用方的 max_tokens 和 timeout（SVG 等其他階段）。
+    """
+
+    name = "openai"
+
+    def __init__(self, gpt_interface: GPTInterface, breaker: Optional[CircuitBreaker] = None, direct: bool = False):
+        super().__init__(breaker)
+        self.gpt_interface = gpt_interface
+        self.direct = direct
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None) -> str:
+        if self.direct:
+            return self.gpt_interface.complete_once(prompt, system_prompt, max_tokens, timeout)
+        return self.gpt_interface.chat_with_gpt(prompt, max_attempts=1, system_prompt=system_prompt)
+
+
+class AnthropicProvider(LLMProvider):
+    """調用 Anthropic Messages API。"""
+
+    name = "anthropic"
+
+    def __init__(self, client, model: str, max_tokens: int, breaker: Optional[CircuitBreaker] = None):
+        super().__init__(breaker)
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None) -> str:
+        params = {
+            "model": self.model,
+            "max_tokens": max_tokens or self.max_tokens,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if system_prompt:
+            params["system"] = system_prompt
+        if timeout:
+            params["timeout"] = timeout
+        response = self.client.messages.create(**params)
+        return "".join(block.text for block in response.content if block.type == "text")
+
+
+class ProviderRouter:
+    """
+    按優先順序嘗試多個提供者：熔斷中的提供者直接跳過，失敗時立即切換到下一個。
+
+    同一個提供者對象可以出現在多個路由中（例如佈局用 OpenAI 優先、SVG 用 Anthropic 優先），
+    它們共用熔斷器，一個階段發現的故障另一個階段也能立即避開。
+    """
+
+    def __init__(self, providers: List[LLMProvider]):
+        self.providers = providers
+        self.last_provider: Optional[str] = None
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None) -> str:
+        """
+        發送請求並返回第一個成功的提供者的回應。
+
+        :param prompt: 提示
+        :param system_prompt: 系統消息
+        :param max_tokens: 回應的最大 token 數，None 表示使用提供者的預設值
+        :param timeout: 單次請求的超時（秒）
+        :return: 回應文本
+        :raises AllProvidersFailed: 所有提供者都失敗或被熔斷時
+        """
+        errors = []
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: 熔斷中")
+                continue
+            start = time.perf_counter()
+            try:
+                content = provider.complete(prompt, system_prompt, max_tokens, timeout)
+            except Exception as e:
+                if is_client_error(e):
+                    # 請求本身無效，不代表提供者故障；仍然交給下一個提供者嘗試
+                    provider.breaker.release_probe()
+                else:
+                    provider.breaker.record_failure(e)
+                LLM_REQUEST_SECONDS.labels(provider=provider.name, outcome="failure").observe(time.perf_counter() - start)
+                print(f"{provider.name} 請求失敗，切換到下一個提供者: {e}")
+                errors.append(f"{provider.name}: {e}")
+                continue
+            except BaseException:
+                # 被中斷時沒有結果，不能一直佔著探測機會
+                provider.breaker.release_probe()
+                raise
+            elapsed = time.perf_counter() - start
+            provider.breaker.record_success(elapsed)
+            LLM_REQUEST_SECONDS.labels(provider=provider.name, outcome="success").observe(elapsed)
+            if provider is not self.providers[0]:
+                print(f"請求已由備用提供者 {provider.name} 完成")
+                LLM_FAILOVERS.labels(provider=provider.name).inc()
+            self.last_provider = provider.name
+            return content
+        raise AllProvidersFailed("所有 LLM 提供者都無法完成請求: " + "；".join(errors))
+
+    def health(self) -> Dict[str, Any]:
+        """各提供者熔斷器的狀態。"""
+        return {provider.name: provider.breaker.snapshot() for provider in self.providers}
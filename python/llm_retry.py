@@ -0,0 +1,116 @@
+import random
+import sys
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# 這些 HTTP 狀態碼表示暫時性錯誤，稍後重試可能成功
+RETRYABLE_STATUS = {408, 409, 429}
+# 這些 HTTP 狀態碼表示請求本身無效，換一個時間或同一個提供者的其他請求不受影響
+INVALID_REQUEST_STATUS = {400, 413, 422}
+
+
+def _connection_errors() -> tuple:
+    # SDK 導入很慢，這裡不主動導入；錯誤來自某個 SDK 時它必然已經載入
+    errors = (ConnectionError, TimeoutError)
+    for name in ('openai', 'anthropic'):
+        module = sys.modules.get(name)
+        if module is not None:
+            errors += (module.APIConnectionError,)
+    return errors
+
+
+def _local_errors() -> tuple:
+    # 回放模式下錄製文件缺少對應請求（replay_clients.ReplayMiss）也是本地錯誤，與提供者無關
+    errors = (ValueError, TypeError)
+    module = sys.modules.get('replay_clients')
+    if module is not None:
+        errors += (module.ReplayMiss,)
+    return errors
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    判斷 LLM 請求的錯誤是否值得重試。
+
+    429、408、409 和 5xx 以及連線錯誤、超時可以重試；其他 4xx（參數錯誤、認證失敗等）重試也不會成功。
+
+    :param error: 請求拋出的異常
+    :return: 是否重試
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(error, _connection_errors())
+
+
+def is_client_error(error: Exception) -> bool:
+    """
+    判斷錯誤是否由請求本身造成，而不是提供者故障：發送前在本地被拒絕（例如超出 token 預算、
+    回放時錄製文件中沒有對應請求）或被服務端判定為無效請求。這類錯誤不應該計入熔斷器。
+
+    :param error: 請求拋出的異常，會沿 __cause__ 查找被包裝的原始異常
+    :return: 是否為客戶端錯誤
+    """
+    local_errors = _local_errors()
+    while error is not None:
+        if isinstance(error, local_errors):
+            return True
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status in INVALID_REQUEST_STATUS
+        error = error.__cause__
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    讀取錯誤回應中的 retry-after-ms 或 Retry-After 標頭。
+
+    :param error: 請求拋出的異常
+    :return: 服務端要求等待的秒數，沒有標頭時返回 None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None, base: float = 1.0, cap: float = 30.0,
+                  rng: Optional[random.Random] = None) -> float:
+    """
+    計算第 attempt 次失敗後的等待時間。
+
+    使用 full jitter 的指數退避：在 [0, min(cap, base * 2^attempt)] 中隨機取值，
+    避免多個請求在同一時刻一起重試；服務端給出 Retry-After 時至少等待該時長。
+
+    :param attempt: 已失敗的次數減一（第一次失敗為 0）
+    :param error: 請求拋出的異常，用於讀取 Retry-After
+    :param base: 基準等待時間（秒）
+    :param cap: 退避上限（秒）
+    :param rng: 隨機數生成器，未提供時使用 random 模組
+    :return: 等待秒數
+    """
+    rng = rng or random
+    delay = rng.uniform(0, min(cap, base * (2 ** attempt)))
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
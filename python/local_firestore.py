@@ -0,0 +1,204 @@
+import copy
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from google.api_core import exceptions as gexc
+
+
+class LocalFirestore:
+    """
+    與 firestore.Client 介面相容的記憶體資料庫，用於離線測試和基準測試。
+
+    只實作本專案用到的部分：collection / document / set / update / get / stream、
+    select / order_by / start_after / limit、batch 和 on_snapshot。
+    每次 set、update、get、stream 或 batch.commit 都算一次網路往返，
+    可以用 latency 模擬往返延遲，用 fail_next_commits 模擬暫時性錯誤。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self.fail_next_commits = 0
+        self._collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._listeners: Dict[str, List[Callable]] = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> 'LocalQuery':
+        with self._lock:
+            self._collections.setdefault(name, {})
+        return LocalQuery(self, name)
+
+    def batch(self) -> 'LocalWriteBatch':
+        return LocalWriteBatch(self)
+
+    def _apply(self, ops: List[tuple]):
+        """原子地套用一組寫入，並通知監聽器。"""
+        with self._lock:
+            for kind, doc_ref, data, merge in ops:
+                if kind == "update" and doc_ref.id not in self._collections[doc_ref.collection_name]:
+                    raise gexc.NotFound(f"No document to update: {doc_ref.path}")
+            changes = {}
+            for kind, doc_ref, data, merge in ops:
+                docs = self._collections[doc_ref.collection_name]
+                existed = doc_ref.id in docs
+                if kind == "update" or merge:
+                    docs[doc_ref.id] = {**docs.get(doc_ref.id, {}), **copy.deepcopy(data)}
+                else:
+                    docs[doc_ref.id] = copy.deepcopy(data)
+                changes.setdefault(doc_ref.collection_name, []).append(
+                    ("MODIFIED" if existed else "ADDED", doc_ref)
+                )
+            for collection_name, collection_changes in changes.items():
+                self._notify(collection_name, collection_changes)
+
+    def _notify(self, collection_name: str, changes: List[tuple]):
+        listeners = self._listeners.get(collection_name, [])
+        if not listeners:
+            return
+        change_objects = [
+            SimpleNamespace(type=SimpleNamespace(name=change_type), document=doc_ref.get(_count=False))
+            for change_type, doc_ref in changes
+        ]
+        docs = list(LocalQuery(self, collection_name).stream(_count=False))
+        for callback in listeners:
+            callback(docs, change_objects, time.time())
+
+
+class LocalDocumentSnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]], fields: Optional[List[str]] = None):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+        self._fields = fields
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        if self._data is None:
+            return None
+        if self._fields is None:
+            return copy.deepcopy(self._data)
+        return {f: copy.deepcopy(self._data[f]) for f in self._fields if f in self._data}
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class LocalDocumentReference:
+    def __init__(self, client: LocalFirestore, collection_name: str, doc_id: str):
+        self._client = client
+        self.collection_name = collection_name
+        self.id = doc_id
+        self.path = f"{collection_name}/{doc_id}"
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._client._round_trip()
+        self._client._apply([("set", self, data, merge)])
+
+    def update(self, data: Dict[str, Any]):
+        self._client._round_trip()
+        self._client._apply([("update", self, data, False)])
+
+    def get(self, _count: bool = True) -> LocalDocumentSnapshot:
+        if _count:
+            self._client._round_trip()
+        with self._client._lock:
+            data = self._client._collections[self.collection_name].get(self.id)
+            return LocalDocumentSnapshot(self.id, copy.deepcopy(data))
+
+
+class LocalQuery:
+    """集合引用兼查詢對象，每個方法都返回新的查詢。"""
+
+    def __init__(self, client: LocalFirestore, collection_name: str, fields: Optional[List[str]] = None,
+                 orders: Optional[List[tuple]] = None, after: Optional[Dict[str, Any]] = None,
+                 max_results: Optional[int] = None):
+        self._client = client
+        self.collection_name = collection_name
+        self._fields = fields
+        self._orders = orders or []
+        self._after = after
+        self._limit = max_results
+
+    def _copy(self, **changes) -> 'LocalQuery':
+        params = dict(fields=self._fields, orders=self._orders, after=self._after, max_results=self._limit)
+        params.update(changes)
+        return LocalQuery(self._client, self.collection_name, **params)
+
+    def document(self, doc_id: str) -> LocalDocumentReference:
+        return LocalDocumentReference(self._client, self.collection_name, doc_id)
+
+    def select(self, field_paths: List[str]) -> 'LocalQuery':
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> 'LocalQuery':
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def start_after(self, values: Dict[str, Any]) -> 'LocalQuery':
+        return self._copy(after=values)
+
+    def limit(self, count: int) -> 'LocalQuery':
+        return self._copy(max_results=count)
+
+    def stream(self, _count: bool = True):
+        if _count:
+            self._client._round_trip()
+        with self._client._lock:
+            items = [(doc_id, copy.deepcopy(data))
+                     for doc_id, data in self._client._collections[self.collection_name].items()]
+
+        for field, direction in reversed(self._orders):
+            # 與 Firestore 相同，缺少排序欄位的文件不會出現在結果中
+            items = [item for item in items if field in item[1]]
+            items.sort(key=lambda item: item[1][field], reverse=str(direction).upper().endswith("DESCENDING"))
+
+        if self._after is not None and self._orders:
+            field, direction = self._orders[0]
+            descending = str(direction).upper().endswith("DESCENDING")
+            pivot = self._after[field]
+            items = [item for item in items if (item[1][field] < pivot if descending else item[1][field] > pivot)]
+
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            yield LocalDocumentSnapshot(doc_id, data, self._fields)
+
+    def on_snapshot(self, callback: Callable) -> SimpleNamespace:
+        with self._client._lock:
+            self._client._listeners.setdefault(self.collection_name, []).append(callback)
+        docs = list(self.stream(_count=False))
+        callback(docs, [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=d) for d in docs], time.time())
+
+        def unsubscribe():
+            with self._client._lock:
+                self._client._listeners[self.collection_name].remove(callback)
+            watch.is_active = False
+
+        watch = SimpleNamespace(is_active=True, unsubscribe=unsubscribe)
+        return watch
+
+
+class LocalWriteBatch:
+    def __init__(self, client: LocalFirestore):
+        self._client = client
+        self._ops: List[tuple] = []
+
+    def set(self, doc_ref: LocalDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", doc_ref, data, merge))
+
+    def update(self, doc_ref: LocalDocumentReference, data: Dict[str, Any]):
+        self._ops.append(("update", doc_ref, data, False))
+
+    def commit(self):
+        self._client._round_trip()
+        if self._client.fail_next_commits > 0:
+            self._client.fail_next_commits -= 1
+            raise gexc.ServiceUnavailable("simulated transient failure")
+        self._client._apply(self._ops)
+        self._ops = []
@@ -0,0 +1,145 @@
+"""
+Prometheus 指標：設計流程各階段的耗時直方圖和錯誤計數器，由 API 的 /metrics 端點導出。
+
+設計任務在工作進程中執行，所以使用 prometheus_client 的多進程模式：
+每個進程把指標寫入 Config.PROMETHEUS_MULTIPROC_DIR，/metrics 匯總所有進程的數據。
+導入這個模塊沒有副作用：API 進程（create_app）和每個工作進程啟動時調用 init_metrics，
+設置環境變量、建立目錄、刪除已結束進程留下的文件，然後才導入 prometheus_client。
+調用 init_metrics 之前，以及未安裝 prometheus_client 時，所有指標都是空操作。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from config import Config
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == 'nt':  # Windows 上無法安全地探測，保留文件
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_stale_files(directory: str):
+    """刪除已結束進程留下的指標文件（文件名形如 counter_<pid>.db），避免上次運行的數據被重複匯總。"""
+    for name in os.listdir(directory):
+        pid = name[:-len('.db')].rsplit('_', 1)[-1] if name.endswith('.db') else ''
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# init_metrics 之後為 prometheus_client 模塊，未初始化或未安裝時為 None
+_client = None
+_initialized = False
+_init_lock = threading.Lock()
+_metrics = []
+
+
+class _Metric:
+    """
+    指標的佔位對象，可以在模塊級別建立並被其他模塊導入。
+    init_metrics 之後轉發到 prometheus_client 的同名指標，之前為空操作。
+    """
+
+    def __init__(self, kind: str, name: str, documentation: str, labels: Tuple[str, ...] = (), **kwargs):
+        self._args = (kind, name, documentation, labels, kwargs)
+        self._metric = None
+        _metrics.append(self)
+
+    def _bind(self, client):
+        kind, name, documentation, labels, kwargs = self._args
+        self._metric = getattr(client, kind)(name, documentation, labels, **kwargs)
+
+    def labels(self, *args, **kwargs):
+        if self._metric is None:
+            return self
+        return self._metric.labels(*args, **kwargs)
+
+    def inc(self, amount: float = 1):
+        if self._metric is not None:
+            self._metric.inc(amount)
+
+    def observe(self, value: float):
+        if self._metric is not None:
+            self._metric.observe(value)
+
+
+def init_metrics():
+    """
+    初始化指標，每個進程調用一次，重複調用不會重新初始化。
+    多進程模式的環境變量必須在導入 prometheus_client 之前設置，所以在這裡才導入。
+    """
+    global _client, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        _initialized = True
+        if Config.PROMETHEUS_MULTIPROC_DIR:
+            os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', Config.PROMETHEUS_MULTIPROC_DIR)
+            os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+            _remove_stale_files(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+        try:
+            import prometheus_client
+        except ImportError:  # 未安裝時不導出指標
+            print("未安裝 prometheus_client，不導出指標")
+            return
+        for metric in _metrics:
+            metric._bind(prometheus_client)
+        _client = prometheus_client
+
+
+# LLM 調用動輒數十秒，桶的上限要覆蓋 SVG 階段的期限
+_STAGE_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = _Metric(
+    'Histogram', 'design_stage_seconds', '設計流程各階段的耗時', ('stage',), buckets=_STAGE_BUCKETS
+)
+LLM_REQUEST_SECONDS = _Metric(
+    'Histogram', 'llm_request_seconds', '單次 LLM 請求的耗時', ('provider', 'outcome'), buckets=_STAGE_BUCKETS
+)
+DESIGN_REQUESTS = _Metric('Counter', 'design_requests_total', '完成的設計請求數量', ('engine', 'outcome'))
+LLM_RETRIES = _Metric('Counter', 'llm_retries_total', 'LLM 請求的重試次數', ('provider',))
+LLM_FAILOVERS = _Metric('Counter', 'llm_failovers_total', '切換到備用 LLM 提供者的次數', ('provider',))
+PARSE_FAILURES = _Metric('Counter', 'llm_parse_failures_total', 'LLM 回應中沒有有效配置的次數', ('stage',))
+SVG_EXTRACTION_FAILURES = _Metric('Counter', 'svg_extraction_failures_total', '模型回應中提取不到 SVG 代碼的次數')
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """記錄 with 區塊的耗時到 design_stage_seconds{stage}，區塊拋出異常時同樣記錄。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    生成 Prometheus 文本格式的指標。
+
+    :return: (內容, Content-Type)
+    """
+    if _client is None:
+        message = '# metrics are not initialized\n' if not _initialized else '# prometheus_client is not installed\n'
+        return message.encode(), _CONTENT_TYPE
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = _client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return _client.generate_latest(registry), _client.CONTENT_TYPE_LATEST
+    return _client.generate_latest(), _client.CONTENT_TYPE_LATEST
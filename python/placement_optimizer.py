@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from data_models import Location
+from environment_rules import EnvironmentRules, RuleTable
+from score_calculator import ScoreCalculator
+
+# 比較分數時的容差，避免浮點誤差導致錯誤剪枝
+_EPSILON = 1e-9
+
+# 每處理多少個節點檢查一次時間限制
+_CLOCK_INTERVAL = 256
+
+
+class PlacementOptimizer:
+    """
+    房間位置分配的分支定界優化器，找出 calculate_total_score 最高的前 k 個分配。
+
+    ScoreCalculator 的溫度、光照和濕度分數都是「基準分 + 各房間貢獻之和」再截斷，
+    每個房間的貢獻又是該類房間各個位置讀數分數的平均，所以可以拆成每個房間的獨立貢獻。
+    每個分項的分數不超過 min(上限, 基準分 + 貢獻之和)，對任意一組分項 S，
+    總分不超過「S 以外分項的上限 + S 內分項的基準分 + 已分配貢獻 + 剩餘房間在 S 上的最大聯合貢獻」；
+    取所有 S 中最小的值作為子樹的上界，上界不超過目前第 k 名的分支會被剪掉。
+
+    在 time_limit 內搜索完畢時結果是精確的；超時則返回目前最好的結果，
+    並報告未搜索部分的上界和與第 k 名之間的差距。
+    """
+
+    def __init__(self, score_calculator: ScoreCalculator = None):
+        self.score_calculator = score_calculator or ScoreCalculator()
+
+    def optimize(self, rooms: dict[str, int], windows: dict[str, bool], locations: dict[str, Location],
+                 room_environment_rules: dict[str, Any], top_k: int = 3, time_limit: Optional[float] = None,
+                 exclusive: Optional[bool] = None) -> dict[str, Any]:
+        """
+        搜索得分最高的 top_k 個分配。
+
+        :param rooms: 房間數量字典
+        :param windows: 窗戶位置字典
+        :param locations: 各位置的環境數據
+        :param room_environment_rules: 房間環境規則字典（EnvironmentRules.get_room_environment_rules 的結果）
+        :param top_k: 返回的分配數量
+        :param time_limit: 搜索時間上限（秒），None 表示不限制
+        :param exclusive: 每個位置是否最多放一個房間；None 表示房間總數不超過位置數時為 True
+        :return: 包含 assignments（每項有 room_locations 和 scores）、optimal、upper_bound、gap、nodes、elapsed 的字典
+        """
+        start = time.perf_counter()
+        location_names = sorted(locations)
+        counts = {room_type: count for room_type, count in rooms.items() if count > 0}
+        for room_type in counts:
+            if room_type not in room_environment_rules:
+                raise ValueError(f"缺少 {room_type} 的環境規則")
+        slot_count = sum(counts.values())
+        if exclusive is None:
+            exclusive = slot_count <= len(location_names)
+        if not counts or not location_names or (exclusive and slot_count > len(location_names)):
+            return self._report([], True, float('-inf'), 0, start)
+
+        contributions = self._contributions(counts, locations, location_names, room_environment_rules)
+        window_bonus = len([w for w in windows.values() if w]) * 1.5
+
+        def objective(temp: float, light: float, humidity: float) -> float:
+            return (max(10, min(50 + temp, 50))
+                    + max(5, min(30, 30 + light + window_bonus))
+                    + max(5, min(20 + humidity, 20)))
+
+        # 各分項的 (基準分, 下限, 上限)
+        limits = [(50, 10, 50), (30 + window_bonus, 5, 30), (20, 5, 20)]
+        # 下限截斷會讓分數高於「基準分 + 貢獻」，用所有房間取最小貢獻時的差額補上，保證上界成立
+        slack = []
+        for component, (base, low, _) in enumerate(limits):
+            lowest = sum(min(contributions[room_type][component]) * count for room_type, count in counts.items())
+            slack.append(max(0.0, low - (base + lowest)))
+        subsets = [subset for size in (1, 2, 3) for subset in itertools.combinations(range(3), size)]
+
+        # 貢獻差異最大的房間類型先分配，讓上界更早收緊
+        order = sorted(counts, key=lambda room_type: -self._spread(contributions[room_type]))
+        slots = [room_type for room_type in order for _ in range(counts[room_type])]
+        # 每種房間在每組分項上的聯合貢獻，以及按聯合貢獻從大到小排列的位置索引
+        joint = {
+            room_type: {subset: [sum(contributions[room_type][c][i] for c in subset) for i in range(len(location_names))]
+                        for subset in subsets}
+            for room_type in counts
+        }
+        ranked = {
+            room_type: {subset: sorted(range(len(location_names)), key=lambda i, values=values: -values[i])
+                        for subset, values in joint[room_type].items()}
+            for room_type in counts
+        }
+
+        def upper_bound(depth: int, used: int, partial: Tuple[float, float, float]) -> float:
+            """已分配 depth 個房間、已用位置為 used 時整棵子樹的上界。"""
+            bound = sum(cap for _, _, cap in limits)
+            for subset in subsets:
+                remaining = 0.0
+                for room_type in slots[depth:]:
+                    for index in ranked[room_type][subset]:
+                        if not (exclusive and used >> index & 1):
+                            remaining += joint[room_type][subset][index]
+                            break
+                value = remaining + sum(
+                    limits[c][0] + slack[c] + partial[c] if c in subset else limits[c][2] for c in range(3)
+                )
+                bound = min(bound, value)
+            return bound
+
+        best: List[Tuple[float, Tuple[int, ...]]] = []  # 最小堆，保存前 k 名 (分數, 分配)
+
+        def threshold() -> float:
+            return best[0][0] if len(best) >= top_k else float('-inf')
+
+        root_bound = upper_bound(0, 0, (0.0, 0.0, 0.0))
+        # 深度優先的顯式堆疊，元素為 (上界, 分配, 溫度和, 光照和, 濕度和, 已用位置位元組)
+        stack = [(root_bound, (), 0.0, 0.0, 0.0, 0)]
+        nodes = 0
+        popped = 0
+        timed_out = False
+        while stack:
+            popped += 1
+            if time_limit is not None and popped % _CLOCK_INTERVAL == 0 and time.perf_counter() - start > time_limit:
+                timed_out = True
+                break
+            bound, assignment, temp, light, humidity, used = stack.pop()
+            if bound <= threshold() + _EPSILON:
+                continue
+            nodes += 1
+
+            depth = len(assignment)
+            if depth == len(slots):
+                score = objective(temp, light, humidity)
+                if len(best) < top_k:
+                    heapq.heappush(best, (score, assignment))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, assignment))
+                continue
+
+            room_type = slots[depth]
+            # 同類房間的位置按索引遞增分配，交換同類房間不產生新的分配
+            first = assignment[-1] if depth > 0 and slots[depth - 1] == room_type else 0
+            if exclusive and depth > 0 and slots[depth - 1] == room_type:
+                first += 1
+            children = []
+            for index in range(first, len(location_names)):
+                if exclusive and used >> index & 1:
+                    continue
+                values = contributions[room_type]
+                child_temp = temp + values[0][index]
+                child_light = light + values[1][index]
+                child_humidity = humidity + values[2][index]
+                child_used = used | (1 << index)
+                child_bound = upper_bound(depth + 1, child_used, (child_temp, child_light, child_humidity))
+                if child_bound > threshold() + _EPSILON:
+                    children.append((child_bound, assignment + (index,), child_temp, child_light, child_humidity, child_used))
+            # 上界最大的子節點最後入棧、最先展開
+            children.sort(key=lambda child: child[0])
+            stack.extend(children)
+
+        open_bound = max((node[0] for node in stack), default=float('-inf')) if timed_out else float('-inf')
+        results = []
+        for _, assignment in sorted(best, key=lambda item: (-item[0], item[1])):
+            room_locations = {}
+            for room_type, index in zip(slots, assignment):
+                room_locations.setdefault(room_type, []).append(location_names[index])
+            room_locations = {room_type: room_locations[room_type] for room_type in counts}
+            results.append({
+                "room_locations": room_locations,
+                "scores": self._exact_scores(room_locations, windows, locations, room_environment_rules)
+            })
+        results.sort(key=lambda result: -result["scores"]["total_score"])
+        return self._report(results, not timed_out, open_bound, nodes, start, top_k)
+
+    def _contributions(self, counts: dict[str, int], locations: dict[str, Location], location_names: List[str],
+                       room_environment_rules: dict[str, Any]) -> Dict[str, List[List[float]]]:
+        """
+        每種房間的單個房間放在每個位置時，對溫度、光照、濕度原始分數的貢獻。
+        與 ScoreCalculator 的公式相同，平均值拆成每個房間各佔 1/count。
+        """
+        calculator = self.score_calculator
+        values = EnvironmentRules.rule_values(room_environment_rules)
+        contributions = {}
+        for room_type, count in counts.items():
+            rows = []
+            for factor, attribute, slope, capped, weight in (
+                ("temperature", "temperature", 20, False, calculator.room_importance.get(room_type, 0.1) * 5),
+                ("sunlight", "sunlight", 16, True, calculator.room_light_importance[room_type] * 3),
+                ("humidity", "humidity", 16, True, calculator.room_humidity_importance[room_type] * 2),
+            ):
+                offset = RuleTable.offset(room_type, factor)
+                ideal, low, high = values[offset:offset + 3]
+                value_range = high - low
+                row = []
+                for name in location_names:
+                    difference = abs(getattr(locations[name], attribute) - ideal) / value_range
+                    if capped:
+                        difference = min(difference, 1)
+                    row.append((max(2, 10 - difference * slope) - 6) * weight / count)
+                rows.append(row)
+            contributions[room_type] = rows
+        return contributions
+
+    @staticmethod
+    def _spread(rows: List[List[float]]) -> float:
+        return sum(max(row) - min(row) for row in rows)
+
+    def _exact_scores(self, room_locations: dict[str, List[str]], windows: dict[str, bool],
+                      locations: dict[str, Location], room_environment_rules: dict[str, Any]) -> dict[str, float]:
+        """用 calculate_total_score 計算最終分數，保證與其他路徑的結果一致。"""
+        temp_data = {room_type: [locations[name].temperature for name in names] for room_type, names in room_locations.items()}
+        humidity_data = {room_type: [locations[name].humidity for name in names] for room_type, names in room_locations.items()}
+        light_data = {room_type: [locations[name].sunlight for name in names] for room_type, names in room_locations.items()}
+        rooms = {room_type: 0.0 for room_type in room_locations}
+        return self.score_calculator.calculate_total_score(
+            rooms, windows, light_data, temp_data, humidity_data, room_environment_rules
+        )
+
+    @staticmethod
+    def _report(results: List[dict[str, Any]], finished: bool, open_bound: float, nodes: int, start: float,
+                top_k: int = 0) -> dict[str, Any]:
+        kth_score = results[-1]["scores"]["total_score"] if len(results) >= top_k and results else float('-inf')
+        if finished:
+            upper_bound = results[0]["scores"]["total_score"] if results else None
+            gap = 0.0
+        else:
+            best_found = results[0]["scores"]["total_score"] if results else float('-inf')
+            upper_bound = round(max(open_bound, best_found), 2)
+            gap = round(max(0.0, upper_bound - kth_score), 2) if results else None
+        return {
+            "assignments": results,
+            "optimal": finished or gap == 0.0,
+            "upper_bound": upper_bound,
+            "gap": gap,
+            "nodes": nodes,
+            "elapsed": round(time.perf_counter() - start, 4)
+        }
@@ -0,0 +1,215 @@
+"""
+離線測量整個設計流程的延遲和吞吐量：預設為串流端點 POST /api/designs/stream；
+--endpoint jobs 時經過 POST /api/designs 的設計任務，輪詢任務狀態直到完成，並確認設計出現在 /api/getHistoryDesigns 中。
+
+LLM 回應從錄製文件回放，Firestore 使用記憶體中的 LocalFirestore，不需要網路和 API 密鑰；
+回放模式下設計任務在本進程的線程中執行，與 API 共用同一個 LocalFirestore。
+先用 REPLAY_MODE=record 正常運行服務錄製回應，然後執行：
+
+    python python/replay_benchmark.py --requests 20 --concurrency 4 --llm-latency 2
+
+延遲參數會覆蓋 REPLAY_LLM_LATENCY、REPLAY_LLM_JITTER 和 REPLAY_FIRESTORE_LATENCY。
+服務在臨時目錄中運行，設計歷史、SVG 快取、任務資料庫和指標文件都寫在臨時目錄，結束後刪除，不修改工作目錄。
+
+錄製文件為空時直接退出。以下情況的請求計為失敗：串流中出現 error 事件或沒有 done、
+設計實際使用的佈局引擎不是請求的引擎（LLM 請求失敗後回退到本地引擎）、任何配置缺少 SVG；
+jobs 模式下任務失敗或設計列表中找不到設計同樣計為失敗。
+回放缺少對應請求（ReplayMiss）時會表現為前兩種情況之一，總次數另外報告。
+有失敗的請求時以狀態碼 1 退出。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_REQUEST = {
+    "designName": "benchmark",
+    "length": 12,
+    "width": 9,
+    "rooms": {"livingRoom": 1, "bedroom": 2, "kitchen": 1, "bathroom": 1},
+    "windows": {"north": True, "south": True},
+    "specialRequest": "需要一個小書房"
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def read_events(response):
+    """逐個解析 server-sent events，產出 (事件名稱, 數據)。"""
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            message, buffer = buffer.split('\n\n', 1)
+            event, data = None, None
+            for part in message.splitlines():
+                if part.startswith('event: '):
+                    event = part[len('event: '):]
+                elif part.startswith('data: '):
+                    data = json.loads(part[len('data: '):])
+            if event:
+                yield event, data
+
+
+def missing_svgs(service, db, design: dict) -> int:
+    """設計中沒有寫入 SVG 的配置數量。"""
+    missing = 0
+    for config in design.get("configurations", []):
+        document_id = service.svg_document_id({"design_data": design.get("design_data", {}), "configuration": config})
+        # 檢查用的讀取不計入 Firestore 往返次數
+        data = db.collection('all_designs').document(document_id).get(_count=False).to_dict() or {}
+        if not data.get("svgUrl"):
+            missing += 1
+    return missing
+
+
+def run_request(client, index: int, expected_engine: str, service, db) -> dict:
+    payload = dict(SAMPLE_REQUEST, designName=f"benchmark_{index}")
+    start = time.perf_counter()
+    first_configuration = None
+    events = []
+    design = None
+    with client.post('/api/designs/stream', json=payload, buffered=False) as response:
+        for event, data in read_events(response):
+            events.append(event)
+            if event == 'configuration' and first_configuration is None:
+                first_configuration = time.perf_counter() - start
+            elif event == 'design':
+                design = data["design"]
+    latency = time.perf_counter() - start
+
+    completed = 'done' in events and 'error' not in events and design is not None and "error" not in design
+    engine = design.get("meta_info", {}).get("engine") if design else None
+    fallback = completed and engine != expected_engine
+    svg_missing = missing_svgs(service, db, design) if completed else 0
+    return {
+        "latency": latency,
+        "first_configuration": first_configuration,
+        "fallback": fallback,
+        "svg_missing": svg_missing,
+        "ok": completed and not fallback and not svg_missing
+    }
+
+
+def listed(client, design_name: str) -> bool:
+    """設計是否出現在歷史設計列表中。"""
+    cursor = None
+    while True:
+        response = client.get('/api/getHistoryDesigns', query_string={"limit": 100, **({"cursor": cursor} if cursor else {})})
+        page = response.get_json()
+        if any(design.get("designName") == design_name for design in page["designs"]):
+            return True
+        cursor = page.get("nextCursor")
+        if not cursor:
+            return False
+
+
+def run_job_request(client, index: int, expected_engine: str, service, db, poll_interval: float = 0.05) -> dict:
+    payload = dict(SAMPLE_REQUEST, designName=f"benchmark_job_{index}")
+    start = time.perf_counter()
+    status_url = client.post('/api/designs', json=payload).get_json()["statusUrl"]
+    while True:
+        job = client.get(status_url).get_json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(poll_interval)
+    latency = time.perf_counter() - start
+
+    design = job["result"]["design"] if job["status"] == "succeeded" else None
+    completed = design is not None and "error" not in design and listed(client, payload["designName"])
+    engine = design.get("meta_info", {}).get("engine") if design else None
+    fallback = completed and engine != expected_engine
+    svg_missing = missing_svgs(service, db, design) if completed else 0
+    return {
+        "latency": latency,
+        "first_configuration": None,
+        "fallback": fallback,
+        "svg_missing": svg_missing,
+        "ok": completed and not fallback and not svg_missing
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--endpoint', choices=('stream', 'jobs'), default='stream')
+    parser.add_argument('--llm-latency', type=float)
+    parser.add_argument('--llm-jitter', type=float)
+    parser.add_argument('--firestore-latency', type=float)
+    parser.add_argument('--cassette')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    # Config 在導入時讀取環境變量，必須在導入 API 之前設置
+    os.environ['REPLAY_MODE'] = 'replay'
+    for name, value in (('REPLAY_LLM_LATENCY', args.llm_latency), ('REPLAY_LLM_JITTER', args.llm_jitter),
+                        ('REPLAY_FIRESTORE_LATENCY', args.firestore_latency), ('REPLAY_CASSETTE', args.cassette)):
+        if value is not None:
+            os.environ[name] = str(value)
+    # 錄製文件相對於目前的工作目錄，切換到臨時目錄之前轉換為絕對路徑
+    os.environ['REPLAY_CASSETTE'] = os.path.abspath(os.environ.get('REPLAY_CASSETTE', 'replay_cassette.jsonl'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        os.chdir(directory)
+        try:
+            return run(args)
+        finally:
+            os.chdir(original_directory)
+
+
+def run(args) -> int:
+    import API
+    from config import Config
+
+    app = API.create_app(warm_up_clients=False)
+    service = API.get_stream_service()  # 建立服務的時間不計入請求延遲
+    cassette = service.cassette
+    if not len(cassette):
+        sys.exit(f"錄製文件 {cassette.path} 不存在或沒有任何回應，請先用 REPLAY_MODE=record 錄製")
+    expected_engine = SAMPLE_REQUEST.get("engine") or Config.LAYOUT_ENGINE
+    db = API.get_db()
+
+    start = time.perf_counter()
+    run_one = run_job_request if args.endpoint == 'jobs' else run_request
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda index: run_one(app.test_client(), index, expected_engine, service, db),
+                                range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [r["latency"] for r in results]
+    firsts = [r["first_configuration"] for r in results if r["first_configuration"] is not None]
+    summary = {
+        "endpoint": args.endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "failed": sum(1 for r in results if not r["ok"]),
+        "engine_fallbacks": sum(1 for r in results if r["fallback"]),
+        "svg_failures": sum(r["svg_missing"] for r in results),
+        "replay_misses": cassette.misses,
+        "throughput_rps": round(args.requests / elapsed, 3),
+        "latency_p50": round(percentile(latencies, 50), 4),
+        "latency_p95": round(percentile(latencies, 95), 4),
+        "latency_max": round(max(latencies), 4),
+        "first_configuration_p50": round(percentile(firsts, 50), 4) if firsts else None,
+        "firestore_round_trips": db.round_trips
+    }
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+    else:
+        for key, value in summary.items():
+            print(f"{key:>24}: {value}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+# 請求中的時間戳（例如 meta_info.timestamp）每次都不同，計算鍵之前先去掉
+_TIMESTAMP_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?')
+
+# 這些參數不影響回應內容
+_VOLATILE_PARAMS = ("timeout", "stream", "stream_options")
+
+# 回放串流時每個片段的字符數
+_STREAM_CHUNK_SIZE = 40
+
+
+class ReplayMiss(KeyError):
+    """嚴格回放模式下，錄製文件中沒有對應的請求。"""
+
+
+class Cassette:
+    """
+    錄製的 LLM 請求和回應，保存為 JSONL 文件，每行一個 {key, provider, response}。
+
+    鍵是提供者名稱和請求參數（去掉超時、串流選項和時間戳）的 SHA-256 雜湊。
+    非嚴格模式下，找不到完全相同的請求時依次使用同一提供者的其他錄製回應，
+    這樣季節、隨機面積分配不同的請求也能回放，適合測量延遲和吞吐量。
+    """
+
+    def __init__(self, path: str, strict: bool = False):
+        self.path = path
+        self.strict = strict
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_provider: Dict[str, List[Dict[str, Any]]] = {}
+        self._cycles: Dict[str, Iterator[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.misses = 0  # 拋出 ReplayMiss 的次數
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _add(self, entry: Dict[str, Any]):
+        if entry["key"] not in self._entries:
+            self._by_provider.setdefault(entry["provider"], []).append(entry)
+            self._cycles.pop(entry["provider"], None)
+        self._entries[entry["key"]] = entry
+
+    @staticmethod
+    def make_key(provider: str, params: Dict[str, Any]) -> str:
+        request = {k: v for k, v in params.items() if k not in _VOLATILE_PARAMS}
+        canonical = json.dumps({"provider": provider, "request": request}, ensure_ascii=False, sort_keys=True,
+                               separators=(",", ":"), default=str)
+        return hashlib.sha256(_TIMESTAMP_RE.sub("", canonical).encode("utf-8")).hexdigest()
+
+    def record(self, provider: str, params: Dict[str, Any], response: Dict[str, Any]):
+        """保存一次請求的回應，追加寫入文件。"""
+        entry = {"key": self.make_key(provider, params), "provider": provider, "response": response}
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._add(entry)
+            # 多個工作進程可能同時錄製，整行用一次 write 追加，避免行內容交錯
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def lookup(self, provider: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        查找請求的錄製回應。
+
+        :raises ReplayMiss: 沒有可用的錄製回應時
+        """
+        key = self.make_key(provider, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and not self.strict and self._by_provider.get(provider):
+                if provider not in self._cycles:
+                    self._cycles[provider] = itertools.cycle(self._by_provider[provider])
+                entry = next(self._cycles[provider])
+            if entry is None:
+                self.misses += 1
+        if entry is None:
+            raise ReplayMiss(f"錄製文件 {self.path} 中沒有 {provider} 的對應請求")
+        return entry["response"]
+
+
+class SimulatedLatency:
+    """回放時模擬的請求延遲：latency 秒加上 [0, jitter] 內的隨機值。"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            return self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def wait(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+def _openai_response(content: str, usage: Optional[Dict[str, int]]) -> SimpleNamespace:
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(**usage) if usage else None
+    )
+
+
+def _usage_dict(usage) -> Optional[Dict[str, int]]:
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+
+class _RecordingCompletions:
+    def __init__(self, completions, cassette: Cassette):
+        self._completions = completions
+        self._cassette = cassette
+
+    def create(self, **params):
+        if not params.get("stream"):
+            response = self._completions.create(**params)
+            self._cassette.record("openai", params, {
+                "content": response.choices[0].message.content,
+                "usage": _usage_dict(getattr(response, "usage", None))
+            })
+            return response
+        return self._record_stream(params, self._completions.create(**params))
+
+    def _record_stream(self, params: Dict[str, Any], stream) -> Iterator[Any]:
+        parts, usage = [], None
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._cassette.record("openai", params, {"content": "".join(parts), "usage": _usage_dict(usage)})
+
+
+class _ReplayCompletions:
+    def __init__(self, cassette: Cassette, latency: SimulatedLatency):
+        self._cassette = cassette
+        self._latency = latency
+
+    def create(self, **params):
+        response = self._cassette.lookup("openai", params)
+        self._latency.wait()
+        if not params.get("stream"):
+            return _openai_response(response["content"], response.get("usage"))
+        return self._stream(response)
+
+    @staticmethod
+    def _stream(response: Dict[str, Any]) -> Iterator[SimpleNamespace]:
+        content = response["content"] or ""
+        for start in range(0, len(content), _STREAM_CHUNK_SIZE):
+            delta = SimpleNamespace(content=content[start:start + _STREAM_CHUNK_SIZE])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        usage = response.get("usage")
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(**usage) if usage else None)
+
+
+class RecordingOpenAI:
+    """包裝真實的 OpenAI 客戶端，轉發請求並把回應寫入錄製文件。"""
+
+    def __init__(self, client, cassette: Cassette):
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(client.chat.completions, cassette))
+
+
+class ReplayOpenAI:
+    """不連網的 OpenAI 客戶端替身，從錄製文件返回回應（支援串流）。"""
+
+    def __init__(self, cassette: Cassette, latency: Optional[SimulatedLatency] = None):
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(cassette, latency or SimulatedLatency()))
+
+
+def _anthropic_response(text: str) -> SimpleNamespace:
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)])
+
+
+class _RecordingMessages:
+    def __init__(self, messages, cassette: Cassette):
+        self._messages = messages
+        self._cassette = cassette
+
+    def create(self, **params):
+        response = self._messages.create(**params)
+        text = "".join(block.text for block in response.content if block.type == "text")
+        self._cassette.record("anthropic", params, {"text": text})
+        return response
+
+
+class _ReplayMessages:
+    def __init__(self, cassette: Cassette, latency: SimulatedLatency):
+        self._cassette = cassette
+        self._latency = latency
+
+    def create(self, **params):
+        response = self._cassette.lookup("anthropic", params)
+        self._latency.wait()
+        return _anthropic_response(response["text"])
+
+
+class RecordingAnthropic:
+    """包裝真實的 Anthropic 客戶端，轉發請求並把回應寫入錄製文件。"""
+
+    def __init__(self, client, cassette: Cassette):
+        self.messages = _RecordingMessages(client.messages, cassette)
+
+
+class ReplayAnthropic:
+    """不連網的 Anthropic 客戶端替身，從錄製文件返回回應。"""
+
+    def __init__(self, cassette: Cassette, latency: Optional[SimulatedLatency] = None):
+        self.messages = _ReplayMessages(cassette, latency or SimulatedLatency())
@@ -16,12 +16,14 @@ class RoomCalculator:
             "bathroom": {"min": 1.0, "max": 1.3, "ideal": 1.1}
         }
 
-    def calculate_room_areas(self, rooms: dict[str, int], total_area: float) -> Tuple[dict[str, float], dict[str, float]]:
+    def calculate_room_areas(self, rooms: dict[str, int], total_area: float,
+                             rng: random.Random = None) -> Tuple[dict[str, float], dict[str, float]]:
         """
         計算房間面積和動態比例。
 
         :param rooms: 房間數量字典
         :param total_area: 總面積
+        :param rng: 隨機數生成器，傳入固定種子的生成器可得到可重現的結果
         :return: 房間面積字典和動態比例字典的元組
         """
         total_rooms = sum(rooms.values())
@@ -31,7 +33,7 @@ class RoomCalculator:
             min_val = self.area_ratio_rules[room_type]["min"]
             max_val = self.area_ratio_rules[room_type]["max"]
             ideal_val = self.area_ratio_rules[room_type]["ideal"]
-            dynamic_ratios[room_type] = self._calculate_dynamic_ratio(min_val, max_val, ideal_val, count, total_rooms)
+            dynamic_ratios[room_type] = self._calculate_dynamic_ratio(min_val, max_val, ideal_val, count, total_rooms, rng)
 
         total_ratio = sum(dynamic_ratios.values())
         if total_ratio > 0.9:
@@ -46,7 +48,8 @@ class RoomCalculator:
 
         return room_areas, dynamic_ratios
 
-    def _calculate_dynamic_ratio(self, min_val: float, max_val: float, ideal_val: float, room_count: int, total_rooms: int) -> float:
+    def _calculate_dynamic_ratio(self, min_val: float, max_val: float, ideal_val: float, room_count: int, total_rooms: int,
+                                 rng: random.Random = None) -> float:
         """
         計算動態比例。
 
@@ -55,10 +58,12 @@ class RoomCalculator:
         :param ideal_val: 理想比例
         :param room_count: 房間數量
         :param total_rooms: 總房間數量
+        :param rng: 隨機數生成器，未提供時使用全域 random
         :return: 計算得到的動態比例
         """
+        rng = rng or random
         base_ratio = ideal_val * room_count
-        variation = (random.random() - 0.5) * (max_val - min_val) * 0.2 * room_count
+        variation = (rng.random() - 0.5) * (max_val - min_val) * 0.2 * room_count
         ratio = base_ratio + variation
         return max(min_val * room_count, min(max_val * room_count, ratio))
 
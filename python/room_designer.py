@@ -1,61 +1,321 @@
 import json
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Iterator
 from datetime import datetime
-from gpt_interface import GPTInterface
+from gpt_interface import AsyncGPTInterface, GPTInterface
+from llm_cache import LLMResponseCache
+from hedging import HedgePolicy
+from llm_providers import OpenAIProvider, ProviderRouter
+from llm_retry import is_client_error
 from environment_rules import EnvironmentRules
 from room_calculator import RoomCalculator
 from score_calculator import ScoreCalculator
+from layout_engine import LocalLayoutEngine
 from data_models import DesignData, Location
-from utils import extract_room_locations, repair_json
+from utils import extract_room_locations
+from llm_json import ConfigurationStreamParser, parse_configurations
 from config import Config
+from metrics import PARSE_FAILURES, track_stage
+import asyncio
 import os
+import random
+import time
+
+# 精簡模式的固定前綴：角色、輸出結構和描述格式都不隨請求變化，作為系統消息發送，
+# 每次請求的 prompt 只包含壓縮後的數據
+COMPACT_PROMPT_PREFIX = """你是資深建築設計師 Alex Chen，專精空間規劃、永續設計、智能家居集成、人體工學、光線與空氣流通優化。
+任務：根據用戶消息中的 JSON 數據，提供三種獨特且高度節能的房間佈局方案。
+數據欄位：design（名稱、長寬 m、房間數量、窗戶、特殊要求）、season、time（day/night）、areas（房間面積 m²）、ratios（面積比例）、
+locations（位置 -> [溫度°C, 濕度%, 光照勒克斯]）、rules（房間 -> 因素 -> [理想值, 下限, 上限]）。
+房間只限客廳、臥室、浴室和廚房，特殊要求中的其他空間應整合到這些房間中。
+description 必須先用固定格式寫出每個房間的位置：「客廳在位置X」「臥室在位置X,Y」「廚房在位置X」「浴室在位置X,Y」，X、Y 為 locations 中的位置字母；然後說明房間安排如何利用環境數據節能。
+只輸出有效的 JSON：{"configurations":[{"name":"","description":"","advantages":{"client_requirements":"","environment_optimization":"","space_utilization":"","functionality":"","innovation":""},"considerations":{"energy_efficiency":"","comfort":""}}]}，
+包含三個配置，字符串用雙引號，不要註釋或尾隨逗號。"""
 
 class RoomDesigner:
     def __init__(self, api_key):
-        self.gpt_interface = GPTInterface(Config.get_openai_api_key())
+        cache = None
+        if Config.GPT_CACHE_ENABLED:
+            cache = LLMResponseCache(Config.GPT_CACHE_PATH, Config.GPT_CACHE_TTL, Config.GPT_CACHE_MAX_ENTRIES)
+        # 同步和異步接口共用一個對沖策略，耗時統計和額外花費上限是合併計算的
+        self.hedge_policy = None
+        if Config.GPT_HEDGING:
+            self.hedge_policy = HedgePolicy(percentile=Config.GPT_HEDGE_PERCENTILE,
+                                            max_extra_ratio=Config.GPT_HEDGE_MAX_EXTRA,
+                                            default_delay=Config.GPT_HEDGE_DEFAULT_DELAY)
+        self.gpt_interface = GPTInterface(Config.get_openai_api_key(), cache=cache, timeout=Config.GPT_REQUEST_TIMEOUT,
+                                          prompt_token_budget=Config.PROMPT_TOKEN_BUDGET, hedge_policy=self.hedge_policy)
+        self._async_gpt_interface = None
+        # 設置後佈局請求經過提供者路由（OpenAI 失敗或熔斷時切換到備用提供者），由 DesignService 設置
+        self.layout_router: ProviderRouter = None
 
         self.environment_rules = EnvironmentRules()
         self.room_calculator = RoomCalculator()
         self.score_calculator = ScoreCalculator()
+        self.layout_engine = LocalLayoutEngine(self.score_calculator, time_limit=Config.PLACEMENT_TIME_LIMIT)
         self.result_filename = 'latest_room_design.json'
         self.history_folder = 'design_history'
 
    
-    def design_room(self, design_data: DesignData, locations: dict[str, Location], current_time: datetime) -> dict[str, Any]:
+    def design_room(self, design_data: DesignData, locations: dict[str, Location], current_time: datetime,
+                    engine: str = None) -> dict[str, Any]:
+        """
+        生成房間設計。
+
+        :param design_data: 設計數據
+        :param locations: 各位置的環境數據
+        :param current_time: 當前時間
+        :param engine: 'gpt' 或 'local'，未提供時使用 Config.LAYOUT_ENGINE
+        :return: 設計結果
+        """
+        engine = self._resolve_engine(engine)
+        context = self._prepare_design(design_data, current_time, seeded=engine == 'local')
+
+        if engine == 'local':
+            configurations = self.generate_local_configurations(design_data, locations, context)
+        else:
+            try:
+                prompt, system_prompt = self.build_prompt(design_data, locations, current_time, context)
+                with track_stage("gpt"):
+                    gpt_response = self._complete_layout(prompt, system_prompt)
+                with track_stage("parse"):
+                    configurations = self.process_gpt_response(gpt_response)
+            except Exception as e:
+                if not Config.LAYOUT_ENGINE_FALLBACK:
+                    raise
+                print(f"GPT 生成配置失敗: {e}")
+                configurations = []
+            configurations, engine = self._score_gpt_configurations(configurations, design_data, locations, context)
+
+        return self._build_result(design_data, locations, current_time, context, configurations, engine)
+
+    async def design_room_async(self, design_data: DesignData, locations: dict[str, Location], current_time: datetime,
+                                engine: str = None) -> dict[str, Any]:
+        """
+        design_room 的異步版本，GPT 請求通過 AsyncGPTInterface 發送，多個設計可以在同一個事件循環中並行生成。
+
+        :param design_data: 設計數據
+        :param locations: 各位置的環境數據
+        :param current_time: 當前時間
+        :param engine: 'gpt' 或 'local'，未提供時使用 Config.LAYOUT_ENGINE
+        :return: 設計結果
+        """
+        engine = self._resolve_engine(engine)
+        context = self._prepare_design(design_data, current_time, seeded=engine == 'local')
+
+        if engine == 'local':
+            configurations = await asyncio.to_thread(self.generate_local_configurations, design_data, locations, context)
+        else:
+            try:
+                prompt, system_prompt = self.build_prompt(design_data, locations, current_time, context)
+                with track_stage("gpt"):
+                    gpt_response = await self.async_gpt_interface.chat(prompt, system_prompt=system_prompt)
+                with track_stage("parse"):
+                    configurations = self.process_gpt_response(gpt_response)
+            except Exception as e:
+                if not Config.LAYOUT_ENGINE_FALLBACK:
+                    raise
+                print(f"GPT 生成配置失敗: {e}")
+                configurations = []
+            configurations, engine = self._score_gpt_configurations(configurations, design_data, locations, context)
+
+        return self._build_result(design_data, locations, current_time, context, configurations, engine)
+
+    @property
+    def async_gpt_interface(self) -> AsyncGPTInterface:
+        """第一次使用時才建立異步接口，它的連線池綁定在當時的事件循環上。"""
+        if self._async_gpt_interface is None:
+            self._async_gpt_interface = AsyncGPTInterface(
+                Config.get_openai_api_key(), cache=self.gpt_interface.cache, timeout=Config.GPT_REQUEST_TIMEOUT,
+                prompt_token_budget=Config.PROMPT_TOKEN_BUDGET, hedge_policy=self.hedge_policy
+            )
+        return self._async_gpt_interface
+
+    def _score_gpt_configurations(self, configurations: list[dict[str, Any]], design_data: DesignData,
+                                  locations: dict[str, Location], context: dict[str, Any]) -> Tuple[list[dict[str, Any]], str]:
+        """為 GPT 生成的配置評分；沒有配置且允許回退時改用本地引擎。返回 (配置列表, 實際使用的引擎)。"""
+        with track_stage("scoring"):
+            for config in configurations:
+                self.score_configuration(config, design_data, locations, context)
+
+        if not configurations and Config.LAYOUT_ENGINE_FALLBACK:
+            print("改用本地佈局引擎生成配置")
+            return self.generate_local_configurations(design_data, locations, context), 'local'
+        return configurations, 'gpt'
+
+    @staticmethod
+    def _resolve_engine(engine: str = None) -> str:
+        engine = engine or Config.LAYOUT_ENGINE
+        if engine not in ('gpt', 'local'):
+            raise ValueError(f"未知的佈局引擎: {engine}")
+        return engine
+
+    def generate_local_configurations(self, design_data: DesignData, locations: dict[str, Location],
+                                      context: dict[str, Any]) -> list[dict[str, Any]]:
+        """用本地佈局引擎生成已評分的配置，不調用 LLM。"""
+        with track_stage("local_engine"):
+            return self.layout_engine.generate_configurations(
+                design_data, locations, context['room_areas'], context['room_environment_rules']
+            )
+
+    def stream_design_room(self, design_data: DesignData, locations: dict[str, Location],
+                           current_time: datetime, engine: str = None) -> Iterator[Tuple[str, dict[str, Any]]]:
+        """
+        以串流方式生成設計：GPT 每完成一個配置就立即評分並產出。
+
+        :param design_data: 設計數據
+        :param locations: 各位置的環境數據
+        :param current_time: 當前時間
+        :param engine: 'gpt' 或 'local'，未提供時使用 Config.LAYOUT_ENGINE
+        :return: (事件名稱, 數據) 的迭代器；每個配置產出一次 "configuration"，最後產出一次 "design"
+        """
+        engine = self._resolve_engine(engine)
+        context = self._prepare_design(design_data, current_time, seeded=engine == 'local')
+        configurations = []
+
+        if engine == 'gpt':
+            try:
+                for config in self._stream_gpt_configurations(design_data, locations, current_time, context):
+                    configurations.append(config)
+                    yield "configuration", {"index": len(configurations) - 1, "configuration": config}
+            except Exception as e:
+                # 已經送出的配置無法撤回，只有在還沒有輸出時才改用本地引擎
+                if configurations or not Config.LAYOUT_ENGINE_FALLBACK:
+                    raise
+                print(f"GPT 串流生成配置失敗: {e}")
+
+            if not configurations and Config.LAYOUT_ENGINE_FALLBACK:
+                print("改用本地佈局引擎生成配置")
+                engine = 'local'
+
+        if engine == 'local':
+            for config in self.generate_local_configurations(design_data, locations, context):
+                configurations.append(config)
+                yield "configuration", {"index": len(configurations) - 1, "configuration": config}
+
+        yield "design", self._build_result(design_data, locations, current_time, context, configurations, engine)
+
+    def _stream_gpt_configurations(self, design_data: DesignData, locations: dict[str, Location],
+                                   current_time: datetime, context: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        """邊接收 GPT 的串流回應邊產出已評分的配置。"""
+        prompt, system_prompt = self.build_prompt(design_data, locations, current_time, context)
+        parser = ConfigurationStreamParser()
+        chunks = []
+
+        def completed_configs():
+            for chunk in self._stream_layout(prompt, system_prompt):
+                chunks.append(chunk)
+                yield from parser.feed(chunk)
+            yield from parser.close()
+            # 串流中沒有解析出任何配置時，退回到完整回應的解析
+            if not parser.elements:
+                yield from parse_configurations(''.join(chunks))
+
+        for config in completed_configs():
+            if not self.is_valid_configuration(config):
+                print(f"忽略無效的配置: {config}")
+                PARSE_FAILURES.labels(stage="layout").inc()
+                continue
+            self.score_configuration(config, design_data, locations, context)
+            yield config
+
+    def _complete_layout(self, prompt: str, system_prompt: str = None) -> str:
+        if self.layout_router is None:
+            return self.gpt_interface.chat_with_gpt(prompt, system_prompt=system_prompt)
+        return self.layout_router.complete(prompt, system_prompt)
+
+    def _stream_layout(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """
+        以串流方式取得佈局回應。
+
+        使用提供者路由時，只有 OpenAI 的熔斷器允許時才串流；串流還沒開始輸出就失敗，
+        或者 OpenAI 正在熔斷中，改由其他提供者一次性返回完整回應。
+        """
+        router = self.layout_router
+        if router is None:
+            yield from self.gpt_interface.stream_chat_with_gpt(prompt, system_prompt=system_prompt)
+            return
+
+        primary = router.providers[0]
+        if isinstance(primary, OpenAIProvider) and primary.breaker.allow():
+            start = time.perf_counter()
+            started = settled = False
+            try:
+                for chunk in self.gpt_interface.stream_chat_with_gpt(prompt, max_attempts=1, system_prompt=system_prompt):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                settled = True
+                if is_client_error(e):
+                    primary.breaker.release_probe()
+                else:
+                    primary.breaker.record_failure(e)
+                if started:
+                    raise
+                print(f"OpenAI 串流失敗，切換到備用提供者: {e}")
+            else:
+                settled = True
+                primary.breaker.record_success(time.perf_counter() - start)
+                return
+            finally:
+                # 客戶端斷開或調用方放棄生成器時串流沒有結果，讓出半開狀態的探測機會
+                if not settled:
+                    primary.breaker.release_probe()
+            yield ProviderRouter(router.providers[1:]).complete(prompt, system_prompt)
+            return
+        yield router.complete(prompt, system_prompt)
+
+    def _prepare_design(self, design_data: DesignData, current_time: datetime, seeded: bool = False) -> dict[str, Any]:
+        """
+        計算面積分配和環境規則，供生成 prompt 和評分使用。
+
+        :param seeded: 是否讓相同的設計輸入得到相同的面積分配（本地引擎需要可重現的結果）
+        """
         total_area = design_data.length * design_data.width
-        room_areas, dynamic_ratios = self.room_calculator.calculate_room_areas(design_data.rooms, total_area)
+        # 啟用快取、錄製或回放時讓相同的設計輸入得到相同的面積分配，從而產生相同的 prompt
+        rng = None
+        if seeded or self.gpt_interface.cache is not None or Config.REPLAY_MODE != 'off':
+            rng = random.Random(json.dumps(design_data.to_dict(), ensure_ascii=False, sort_keys=True))
+        room_areas, dynamic_ratios = self.room_calculator.calculate_room_areas(design_data.rooms, total_area, rng)
 
         room_environment_rules, season, time_of_day = self.environment_rules.get_room_environment_rules(current_time)
+        return {
+            "total_area": total_area,
+            "room_areas": room_areas,
+            "dynamic_ratios": dynamic_ratios,
+            "room_environment_rules": room_environment_rules,
+            "season": season,
+            "time_of_day": time_of_day
+        }
 
-        prompt = self.generate_gpt_prompt(design_data, room_areas, dynamic_ratios, locations, current_time)
-        gpt_response = self.gpt_interface.chat_with_gpt(prompt)
-        configurations = self.process_gpt_response(gpt_response)
+    def score_configuration(self, config: dict[str, Any], design_data: DesignData,
+                            locations: dict[str, Location], context: dict[str, Any]):
+        """根據配置描述中的房間位置計算能源效率報告，寫入 config['energy_efficiency_report']。"""
+        room_locations = extract_room_locations(config['description'])
+        temp_data, humidity_data, light_data = self.assign_environment_data(room_locations, locations)
+        scores = self.score_calculator.calculate_total_score(
+            context['room_areas'], design_data.windows, light_data, temp_data, humidity_data, context['room_environment_rules']
+        )
+        config['energy_efficiency_report'] = self.score_calculator.generate_energy_efficiency_report(scores)
 
+    def _build_result(self, design_data: DesignData, locations: dict[str, Location], current_time: datetime,
+                      context: dict[str, Any], configurations: list[dict[str, Any]], engine: str = 'gpt') -> dict[str, Any]:
         match configurations:
             case list() as valid_configs if valid_configs:
-                for config in valid_configs:
-                    room_locations = extract_room_locations(config['description'])
-                    temp_data, humidity_data, light_data = self.assign_environment_data(room_locations, locations)
-                    scores = self.score_calculator.calculate_total_score(
-                        room_areas, design_data.windows, light_data, temp_data, humidity_data, room_environment_rules
-                    )
-                    config['energy_efficiency_report'] = self.score_calculator.generate_energy_efficiency_report(scores)
-                
                 summary = {
-                    "total_area": total_area,
+                    "total_area": context['total_area'],
                     "room_count": sum(design_data.rooms.values()),
                     "configuration_count": len(valid_configs),
                     "best_energy_efficiency": max(config['energy_efficiency_report']['total_score'] for config in valid_configs)
                 }
                 
                 result = {
-                    "meta_info": {"timestamp": current_time.isoformat(), "version": "1.0"},
+                    "meta_info": {"timestamp": current_time.isoformat(), "version": "1.0", "engine": engine},
                     "design_data": design_data.__dict__,
-                    "room_areas": room_areas,
-                    "room_ratios": dynamic_ratios,
+                    "room_areas": context['room_areas'],
+                    "room_ratios": context['dynamic_ratios'],
                     "locations": {k: v.to_dict() for k, v in locations.items()},
-                    "environmental_conditions": {"season": season, "time_of_day": time_of_day},
-                    "room_environment_rules": room_environment_rules,
+                    "environmental_conditions": {"season": context['season'], "time_of_day": context['time_of_day']},
+                    "room_environment_rules": context['room_environment_rules'],
                     "configurations": valid_configs,
                     "summary": summary
                 }
@@ -67,9 +327,54 @@ class RoomDesigner:
                     "timestamp": current_time.isoformat()
                 }
 
-        self.save_result(result, keep_history=True)
         return result
     
+    def build_prompt(self, design_data: DesignData, locations: dict[str, Location], current_time: datetime,
+                     context: dict[str, Any]) -> Tuple[str, str]:
+        """
+        按 Config.PROMPT_MODE 生成 prompt。
+
+        :return: (用戶消息, 系統消息)；完整模式的系統消息為 None，使用 GPTInterface 的預設角色
+        """
+        if Config.PROMPT_MODE == 'compact':
+            return self.generate_compact_prompt(design_data, locations, context), COMPACT_PROMPT_PREFIX
+        if Config.PROMPT_MODE != 'full':
+            raise ValueError(f"未知的 prompt 模式: {Config.PROMPT_MODE}")
+        prompt = self.generate_gpt_prompt(design_data, context['room_areas'], context['dynamic_ratios'], locations, current_time)
+        return prompt, None
+
+    def generate_compact_prompt(self, design_data: DesignData, locations: dict[str, Location],
+                                context: dict[str, Any]) -> str:
+        """
+        生成精簡模式的 prompt：只包含最小化的 JSON 數據，說明和輸出格式在 COMPACT_PROMPT_PREFIX 中。
+
+        :param design_data: 設計數據
+        :param locations: 各位置的環境數據
+        :param context: _prepare_design 的結果
+        :return: 單行 JSON 字符串
+        """
+        data = {
+            "design": {
+                "name": design_data.designName,
+                "size": [design_data.length, design_data.width],
+                "rooms": {room_type: count for room_type, count in design_data.rooms.items() if count},
+                "windows": design_data.windows,
+                "special": design_data.specialRequest
+            },
+            "season": context['season'],
+            "time": context['time_of_day'],
+            "areas": {room_type: round(area, 2) for room_type, area in context['room_areas'].items()},
+            "ratios": {room_type: round(ratio, 2) for room_type, ratio in context['dynamic_ratios'].items()},
+            "locations": {name: [round(data.temperature, 2), round(data.humidity, 2), round(data.sunlight, 2)]
+                          for name, data in locations.items()},
+            "rules": {
+                room_type: {factor: [info['ideal'], *info['range']] for factor, info in room_rules.items()}
+                for room_type, room_rules in context['room_environment_rules'].items()
+                if design_data.rooms.get(room_type)
+            }
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
     def generate_gpt_prompt(self, design_data: DesignData, room_areas: dict, dynamic_ratios: dict, locations: dict[str, Location], current_time: datetime):
         character = self.generate_gpt_character()
         environment_rules, season, time_of_day = self.environment_rules.get_room_environment_rules(current_time)
@@ -151,20 +456,18 @@ class RoomDesigner:
 
     def process_gpt_response(self, gpt_response: str) -> list[dict[str, Any]]:
         print("Raw GPT response:", gpt_response)  # 打印原始響應
-        try:
-            parsed_response = json.loads(gpt_response)
-            print("Parsed response:", parsed_response)  # 打印解析後的響應
-            
-            if 'configurations' in parsed_response and isinstance(parsed_response['configurations'], list):
-                configurations = parsed_response['configurations']
-                print("Extracted configurations:", configurations)  # 打印提取的配置
-                return configurations
-            else:
-                print("No valid 'configurations' found in the response")
-                return []
-        except json.JSONDecodeError as e:
-            print(f"JSON 解析錯誤: {e}")
-            return []
+        configurations = [config for config in parse_configurations(gpt_response) if self.is_valid_configuration(config)]
+        if not configurations:
+            print("No valid 'configurations' found in the response")
+            PARSE_FAILURES.labels(stage="layout").inc()
+        return configurations
+
+    @staticmethod
+    def is_valid_configuration(config: Any) -> bool:
+        """配置至少要有字符串類型的 name 和 description 才能評分。"""
+        return (isinstance(config, dict)
+                and isinstance(config.get('name'), str)
+                and isinstance(config.get('description'), str))
 
     def process_configuration(self, config, design_data: DesignData, total_room_areas: dict, locations: dict[str, Location], room_environment_rules: dict):
         room_locations = extract_room_locations(config['description'])
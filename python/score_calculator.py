@@ -1,5 +1,7 @@
 from typing import Dict, List, Any
 
+from environment_rules import EnvironmentRules, FACTORS, ROOM_TYPES
+
 class ScoreCalculator:
     def __init__(self):
         self.room_importance = {
@@ -125,6 +127,81 @@ class ScoreCalculator:
 
         return max(5, min(score, 20))  # 確保分數在 5-20 之間
 
+    def score_batch(self, rooms: dict[str, float], windows: dict[str, bool], assignments: dict[str, Any],
+                    sensors: dict[str, Any], room_environment_rules: dict[str, Dict]) -> dict[str, Any]:
+        """
+        一次計算多個候選分配的分數，結果與 calculate_total_score 相同。
+
+        :param rooms: 房間面積字典（只用到房間類型）
+        :param windows: 窗戶位置字典
+        :param assignments: 房間類型 -> 形狀為 (N, k) 的位置索引數組，k 為該類型的房間數量
+        :param sensors: 'temperature'、'humidity'、'sunlight' -> 形狀為 (L,) 的各位置讀數
+        :param room_environment_rules: 房間環境規則字典
+        :return: total_score、temperature_score、light_score、humidity_score -> 形狀為 (N,) 的數組
+        """
+        import numpy as np  # 只有批量評分需要 numpy
+
+        sensor_arrays = {factor: np.asarray(sensors[factor], dtype=float) for factor in ("temperature", "humidity", "sunlight")}
+        indices = {}
+        for room in rooms:
+            if room not in assignments:
+                raise ValueError(f"缺少 {room} 的位置分配")
+            room_indices = np.asarray(assignments[room], dtype=np.intp)
+            if room_indices.ndim == 1:
+                room_indices = room_indices[:, None]
+            if room_indices.ndim != 2 or room_indices.shape[1] == 0:
+                raise ValueError(f"{room} 的位置分配必須是 (N, k) 數組且 k > 0")
+            indices[room] = room_indices
+        candidate_counts = {room_indices.shape[0] for room_indices in indices.values()}
+        if len(candidate_counts) > 1:
+            raise ValueError("每種房間的候選數量必須相同")
+        count = candidate_counts.pop() if candidate_counts else 0
+        # (房間, 因素) -> [理想值, 下限, 上限]，預先計算的規則不複製
+        bounds = np.frombuffer(EnvironmentRules.rule_values(room_environment_rules), dtype=float)
+        bounds = bounds.reshape(len(ROOM_TYPES), len(FACTORS), 3)
+
+        def average_room_score(room: str, factor: str, slope: float, capped: bool):
+            ideal, low, high = bounds[ROOM_TYPES.index(room), FACTORS.index(factor)].tolist()
+            value_range = high - low
+            readings = sensor_arrays[factor][indices[room]]
+            difference = np.abs(readings - ideal) / value_range
+            if capped:
+                difference = np.minimum(difference, 1)
+            reading_scores = np.maximum(2, 10 - difference * slope)
+            # 與逐個累加的標量版本保持相同的加法順序
+            room_score = reading_scores[:, 0]
+            for column in range(1, reading_scores.shape[1]):
+                room_score = room_score + reading_scores[:, column]
+            return room_score / reading_scores.shape[1]
+
+        temp_score = np.full(count, 50.0)
+        light_score = np.full(count, 30.0)
+        humidity_score = np.full(count, 20.0)
+        for room in rooms:
+            if room in room_environment_rules:
+                temp_score = temp_score + (average_room_score(room, "temperature", 20, False) - 6) * self.room_importance.get(room, 0.1) * 5
+            else:
+                print(f"警告: 缺少 {room} 的環境規則或溫度數據")
+            light_score = light_score + (average_room_score(room, "sunlight", 16, True) - 6) * self.room_light_importance[room] * 3
+            humidity_score = humidity_score + (average_room_score(room, "humidity", 16, True) - 6) * self.room_humidity_importance[room] * 2
+
+        temp_score = np.clip(temp_score, 10, 50)
+        window_bonus = len([w for w in windows.values() if w]) * 1.5
+        light_score = np.maximum(5, np.minimum(30, light_score + window_bonus))
+        humidity_score = np.clip(humidity_score, 5, 20)
+        total_score = temp_score + light_score + humidity_score
+
+        def rounded(values):
+            # 使用 Python 的 round，保證與標量版本的結果一致
+            return np.array([round(value, 2) for value in values.tolist()], dtype=float)
+
+        return {
+            "total_score": rounded(total_score),
+            "temperature_score": rounded(temp_score),
+            "light_score": rounded(light_score),
+            "humidity_score": rounded(humidity_score)
+        }
+
     def get_efficiency_grade(self, score: float) -> str:
         """
         根據得分獲取效率等級。
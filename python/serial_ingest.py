@@ -0,0 +1,265 @@
+"""
+AM2120 溫濕度板的串口接收服務。
+
+專用的讀取線程一直打開串口，逐行解析板子送出的 {"humidity": .., "temperature": ..}，
+寫入每個位置各自的環形緩衝區。緩衝區用固定大小的 array 保存，寫入和讀取只在鎖內複製數字，
+API 讀取時不會等待串口。串口斷開時每隔 reconnect_delay 秒重新連線。
+
+每行可以帶 "position" 欄位指定位置；沒有時與 terminal.py 相同，
+按順序每 lines_per_position 行換一個位置（位置A、位置B、位置C、位置D 循環）。
+
+單獨執行時持續打印各位置的最新讀數：
+
+    python python/serial_ingest.py --port COM3
+"""
+import argparse
+import json
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+try:
+    import serial
+except ImportError:  # 只有連接開發板的機器需要 pyserial
+    serial = None
+
+POSITIONS = ('位置A', '位置B', '位置C', '位置D')
+
+
+class SensorRingBuffer:
+    """
+    固定容量的讀數環形緩衝區，寫滿後覆蓋最舊的讀數。
+
+    時間戳、濕度和溫度分別存放在三個預先分配的 array('d') 中，寫入不分配記憶體。
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity 必須大於 0")
+        self.capacity = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._humidity = array('d', bytes(8 * capacity))
+        self._temperature = array('d', bytes(8 * capacity))
+        self._next = 0  # 下一次寫入的位置
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, humidity: float, temperature: float, timestamp: float = None):
+        with self._lock:
+            index = self._next
+            self._timestamps[index] = time.time() if timestamp is None else timestamp
+            self._humidity[index] = humidity
+            self._temperature[index] = temperature
+            self._next = (index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _indices(self, n: int) -> List[int]:
+        n = min(n, self._count)
+        return [(self._next - n + i) % self.capacity for i in range(n)]
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        """最新的讀數，沒有數據時返回 None。"""
+        with self._lock:
+            if not self._count:
+                return None
+            index = (self._next - 1) % self.capacity
+            return {"timestamp": self._timestamps[index], "humidity": self._humidity[index],
+                    "temperature": self._temperature[index]}
+
+    def recent(self, n: int) -> List[Dict[str, float]]:
+        """
+        最近的 n 筆讀數，按時間由舊到新。
+
+        :param n: 筆數，超過已有數量時返回全部
+        :return: 讀數列表
+        """
+        with self._lock:
+            return [{"timestamp": self._timestamps[i], "humidity": self._humidity[i],
+                     "temperature": self._temperature[i]} for i in self._indices(n)]
+
+    def mean(self, n: int = None) -> Optional[Dict[str, float]]:
+        """
+        最近 n 筆讀數的平均濕度和溫度，用來平滑感測器的抖動。
+
+        :param n: 筆數，預設為全部
+        :return: {"humidity", "temperature"}，沒有數據時返回 None
+        """
+        with self._lock:
+            indices = self._indices(self.capacity if n is None else n)
+            if not indices:
+                return None
+            return {"humidity": sum(self._humidity[i] for i in indices) / len(indices),
+                    "temperature": sum(self._temperature[i] for i in indices) / len(indices)}
+
+
+def parse_reading(line: str) -> Optional[Dict[str, Any]]:
+    """
+    解析一行串口輸出。
+
+    :param line: 去掉換行的一行文字
+    :return: {"humidity", "temperature"}，有 position 欄位時一併返回；格式不符時返回 None
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        reading = {"humidity": float(data["humidity"]), "temperature": float(data["temperature"])}
+    except (KeyError, TypeError, ValueError):
+        return None
+    if isinstance(data.get("position"), str):
+        reading["position"] = data["position"]
+    return reading
+
+
+class SerialIngest:
+    """
+    在背景線程中持續讀取串口並把讀數寫入各位置的環形緩衝區。
+
+    serial_factory 用來建立串口對象，預設為 serial.Serial；需要提供 readline() 和 close()。
+    """
+
+    def __init__(self, port: str = Config.SERIAL_PORT, baudrate: int = Config.SERIAL_BAUDRATE,
+                 capacity: int = Config.SERIAL_BUFFER_SIZE, positions=POSITIONS,
+                 lines_per_position: int = Config.SERIAL_LINES_PER_POSITION,
+                 reconnect_delay: float = Config.SERIAL_RECONNECT_DELAY, serial_factory=None):
+        if serial_factory is None and serial is None:
+            raise RuntimeError("未安裝 pyserial，無法讀取串口")
+        self.port = port
+        self.baudrate = baudrate
+        self.positions = tuple(positions)
+        self.lines_per_position = lines_per_position
+        self.reconnect_delay = reconnect_delay
+        self.serial_factory = serial_factory or (lambda: serial.Serial(port, baudrate, timeout=1))
+        self.buffers = {position: SensorRingBuffer(capacity) for position in self.positions}
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._serial = None
+        self._sequence = 0  # 沒有 position 欄位的讀數的順序編號
+        self.stats = {"lines": 0, "readings": 0, "parse_errors": 0, "reconnects": 0,
+                      "connected": False, "last_error": None, "last_reading_at": None}
+
+    def start(self):
+        """啟動讀取線程，重複調用不會啟動第二個線程。"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"serial-ingest-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._serial = self.serial_factory()
+                self.stats["connected"] = True
+                print(f"已連接串口 {self.port}（{self.baudrate} baud）")
+                self._read_loop()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                print(f"串口 {self.port} 讀取失敗，{self.reconnect_delay} 秒後重新連線: {e}")
+            finally:
+                self.stats["connected"] = False
+                self._close()
+            if self._stop.wait(self.reconnect_delay):
+                break
+            self.stats["reconnects"] += 1
+
+    def _read_loop(self):
+        # readline 的超時（1 秒）保證能及時響應 stop
+        while not self._stop.is_set():
+            raw = self._serial.readline()
+            if not raw:
+                continue
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self.handle_line(line)
+
+    def _close(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+            self._serial = None
+
+    def handle_line(self, line: str) -> bool:
+        """
+        解析一行並寫入對應位置的緩衝區。
+
+        :param line: 一行串口輸出
+        :return: 是否為有效讀數
+        """
+        self.stats["lines"] += 1
+        reading = parse_reading(line)
+        if reading is None:
+            self.stats["parse_errors"] += 1
+            return False
+        position = reading.get("position")
+        if position is None:
+            position = self.positions[(self._sequence // self.lines_per_position) % len(self.positions)]
+            self._sequence += 1
+        buffer = self.buffers.get(position)
+        if buffer is None:
+            self.stats["parse_errors"] += 1
+            return False
+        now = time.time()
+        buffer.append(reading["humidity"], reading["temperature"], now)
+        self.stats["readings"] += 1
+        self.stats["last_reading_at"] = now
+        return True
+
+    def snapshot(self, samples: int = 0, window: int = None) -> Dict[str, Any]:
+        """
+        各位置的最新讀數和平均值，供 API 直接返回。
+
+        :param samples: 每個位置附帶的最近讀數筆數，0 表示不附帶
+        :param window: 平均值使用的最近讀數筆數，預設為整個緩衝區
+        :return: 包含 running、stats 和 positions 的字典
+        """
+        positions = {}
+        for position, buffer in self.buffers.items():
+            positions[position] = {"count": len(buffer), "latest": buffer.latest(), "mean": buffer.mean(window)}
+            if samples:
+                positions[position]["recent"] = buffer.recent(samples)
+        return {"port": self.port, "running": self.running, "stats": dict(self.stats), "positions": positions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', default=Config.SERIAL_PORT)
+    parser.add_argument('--baudrate', type=int, default=Config.SERIAL_BAUDRATE)
+    parser.add_argument('--interval', type=float, default=5.0, help='打印間隔（秒）')
+    args = parser.parse_args()
+
+    ingest = SerialIngest(args.port, args.baudrate)
+    ingest.start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            for position, data in ingest.snapshot()["positions"].items():
+                print(f"{position}: {data['latest']}")
+    except KeyboardInterrupt:
+        ingest.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+# 每次請求都會變化、但不影響平面圖內容的欄位
+VOLATILE_KEYS = ('meta_info',)
+
+
+class SVGCache:
+    """
+    以內容雜湊為鍵的 SVG 平面圖存儲。
+
+    SVG 代碼保存在 store_dir/<key>.svg，索引（大小、時間、Firestore 引用）
+    保存在 store_dir/index.sqlite3。條目超過 max_age_seconds 會被刪除；
+    總大小超過 max_bytes 時，依最近使用時間淘汰最舊的條目。
+    """
+
+    def __init__(self, store_dir: str, max_age_seconds: float = 30 * 24 * 3600, max_bytes: int = 50 * 1024 * 1024):
+        self.store_dir = store_dir
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.db_path = os.path.join(store_dir, 'index.sqlite3')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS svg_cache (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    svg_url TEXT,
+                    document_id TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _svg_path(self, key: str) -> str:
+        return os.path.join(self.store_dir, f"{key}.svg")
+
+    @staticmethod
+    def make_key(prompt: str, config_data: Dict[str, Any]) -> str:
+        """
+        根據 prompt 和配置數據生成規範化的雜湊鍵。
+
+        :param prompt: 生成平面圖使用的 prompt
+        :param config_data: 分割後的配置數據
+        :return: 十六進位的 SHA-256 雜湊字符串
+        """
+        stable_data = {k: v for k, v in config_data.items() if k not in VOLATILE_KEYS}
+        canonical = json.dumps({"prompt": prompt, "configuration": stable_data},
+                               ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        讀取快取的 SVG。
+
+        :param key: 雜湊鍵
+        :return: 包含 svg、svg_url 和 document_id 的字典，未命中或已過期時返回 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT svg_url, document_id, created_at FROM svg_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.max_age_seconds:
+                self._delete(conn, key)
+                return None
+            try:
+                with open(self._svg_path(key), 'r', encoding='utf-8') as f:
+                    svg_code = f.read()
+            except FileNotFoundError:
+                conn.execute("DELETE FROM svg_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE svg_cache SET last_access = ? WHERE key = ?", (now, key))
+        return {"svg": svg_code, "svg_url": row[0], "document_id": row[1]}
+
+    def put(self, key: str, svg_code: str, svg_url: str = None, document_id: str = None):
+        """
+        保存 SVG 和它的 Firestore 引用，然後執行淘汰。
+
+        :param key: 雜湊鍵
+        :param svg_code: SVG 代碼
+        :param svg_url: 提供該 SVG 的 URL
+        :param document_id: 已更新的 Firestore 文件 ID
+        """
+        data = svg_code.encode('utf-8')
+        tmp_path = self._svg_path(key) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._svg_path(key))
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO svg_cache (key, size, svg_url, document_id, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, len(data), svg_url, document_id, now, now)
+            )
+        self.evict()
+
+    def _delete(self, conn: sqlite3.Connection, key: str):
+        conn.execute("DELETE FROM svg_cache WHERE key = ?", (key,))
+        try:
+            os.remove(self._svg_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        刪除過期條目，並在總大小超過上限時淘汰最久未使用的條目。
+        """
+        now = time.time()
+        with self._connect() as conn:
+            expired = conn.execute(
+                "SELECT key FROM svg_cache WHERE created_at < ?", (now - self.max_age_seconds,)
+            ).fetchall()
+            for (key,) in expired:
+                self._delete(conn, key)
+
+            total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM svg_cache").fetchone()[0]
+            if total_bytes <= self.max_bytes:
+                return
+            for key, size in conn.execute("SELECT key, size FROM svg_cache ORDER BY last_access").fetchall():
+                self._delete(conn, key)
+                total_bytes -= size
+                if total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM svg_cache"
+            ).fetchone()
+        return {"entries": entries, "total_bytes": total_bytes}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 後端模塊直接放在 python/ 目錄下，測試按同樣的方式導入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+import time
+
+from design_jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, DesignJobStore
+
+
+def test_claim_is_exclusive(tmp_path):
+    store = DesignJobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create({"designName": "test"})
+
+    assert store.claim(job_id, "worker-1")
+    assert not store.claim(job_id, "worker-2")
+    assert store.get(job_id)["status"] == JOB_RUNNING
+
+
+def test_result_is_written_only_by_owner(tmp_path):
+    store = DesignJobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create({"designName": "test"})
+    store.claim(job_id, "worker-1")
+
+    assert not store.mark_succeeded(job_id, {"ok": True}, owner="worker-2")
+    assert store.mark_succeeded(job_id, {"ok": True}, owner="worker-1")
+    assert store.get(job_id)["result"] == {"ok": True}
+
+
+def test_requeue_only_expired_leases(tmp_path):
+    store = DesignJobStore(str(tmp_path / "jobs.sqlite3"))
+    alive = store.create({"designName": "alive"})
+    dead = store.create({"designName": "dead"})
+    store.claim(alive, "worker-1")
+    store.claim(dead, "worker-2")
+    time.sleep(0.2)
+    store.heartbeat(alive, "worker-1")
+
+    assert store.requeue_expired(lease=0.1) == [dead]
+    assert store.get(alive)["status"] == JOB_RUNNING
+    assert store.get(dead)["status"] == JOB_QUEUED
+    assert store.queued() == [dead]
+
+
+def test_requeue_gives_up_after_max_attempts(tmp_path):
+    store = DesignJobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create({"designName": "crash"})
+
+    store.claim(job_id, "worker-1")
+    assert store.requeue_expired(lease=-1, max_attempts=2) == [job_id]
+    store.claim(job_id, "worker-2")
+    assert store.requeue_expired(lease=-1, max_attempts=2) == []
+    assert store.get(job_id)["status"] == JOB_FAILED
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import history_store
+from history_store import DesignHistoryLog
+
+
+def write_history(path, designs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(designs, f, ensure_ascii=False)
+
+
+def test_migrate_from_json(tmp_path):
+    json_path = tmp_path / "design_history.json"
+    write_history(json_path, [{"designName": "舊設計1"}, {"designName": "舊設計2"}])
+    log = DesignHistoryLog(str(tmp_path / "design_history.jsonl"))
+    log.append({"designName": "新設計"})
+
+    assert log.migrate_from_json(str(json_path)) == 2
+    assert log.migrate_from_json(str(json_path)) == 0
+    assert [design["designName"] for design in log.iter_from()] == ["新設計", "舊設計1", "舊設計2"]
+    assert (tmp_path / "design_history.json.migrated").exists()
+
+
+def test_migrate_retry_after_crash_does_not_duplicate(tmp_path, monkeypatch):
+    json_path = tmp_path / "design_history.json"
+    write_history(json_path, [{"designName": "舊設計1"}, {"designName": "舊設計2"}])
+    log_path = str(tmp_path / "design_history.jsonl")
+    log = DesignHistoryLog(log_path)
+    log.append({"designName": "新設計"})
+
+    # 記錄已寫入日誌，但舊文件改名前進程崩潰
+    replace = history_store.os.replace
+
+    def crash_on_rename(src, dst):
+        if str(dst).endswith('.migrated'):
+            raise OSError("crash")
+        replace(src, dst)
+
+    monkeypatch.setattr(history_store.os, "replace", crash_on_rename)
+    with pytest.raises(OSError):
+        log.migrate_from_json(str(json_path))
+    monkeypatch.setattr(history_store.os, "replace", replace)
+
+    restarted = DesignHistoryLog(log_path)
+    assert restarted.migrate_from_json(str(json_path)) == 2
+    assert [design["designName"] for design in restarted.iter_from()] == ["新設計", "舊設計1", "舊設計2"]
+    assert not (tmp_path / "design_history.json.migrating").exists()
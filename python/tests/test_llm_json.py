@@ -0,0 +1,99 @@
+import json
+import random
+
+import pytest
+
+from llm_json import ConfigurationStreamParser, close_truncated, loads_lenient, parse_configurations, remove_trailing_commas
+
+CONFIGURATIONS = [
+    {"name": "方案1", "description": "客廳在位置A，臥室在位置B", "room_locations": {"livingRoom": ["位置A"]}},
+    {"name": "方案2", "description": "包含 \"引號\"、逗號, 和括號 ] }", "room_locations": {"bedroom": ["位置B", "位置C"]}},
+    {"name": "方案3", "description": "浴室在位置D", "room_locations": {"bathroom": ["位置D"]}},
+]
+RESPONSE = json.dumps({"configurations": CONFIGURATIONS}, ensure_ascii=False, indent=2)
+
+
+def test_loads_lenient_plain_json():
+    assert loads_lenient(RESPONSE) == {"configurations": CONFIGURATIONS}
+
+
+def test_loads_lenient_fenced_with_prose():
+    text = f"以下是三個配置：\n```json\n{RESPONSE}\n```\n希望對您有幫助，例如 {{不是 JSON}}。"
+    assert loads_lenient(text) == {"configurations": CONFIGURATIONS}
+
+
+def test_loads_lenient_trailing_commas():
+    text = '{"a": [1, 2, 3,], "b": {"c": "x, ]",},}'
+    assert loads_lenient(text) == {"a": [1, 2, 3], "b": {"c": "x, ]"}}
+
+
+def test_remove_trailing_commas_keeps_strings():
+    assert remove_trailing_commas('["a,]", "b",\n]') == '["a,]", "b"]'
+
+
+def test_loads_lenient_truncated():
+    text = RESPONSE[:RESPONSE.index('"方案3"') + 20]
+    value = loads_lenient(text)
+    assert value["configurations"][:2] == CONFIGURATIONS[:2]
+
+
+def test_loads_lenient_unparseable():
+    assert loads_lenient("抱歉，我無法生成配置。") is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[1, 2, [3, 4', [1, 2, [3, 4]]),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('[{"a": 1}, {"b": tr', [{"a": 1}]),
+])
+def test_close_truncated(text, expected):
+    assert json.loads(close_truncated(text)) == expected
+
+
+def test_parse_configurations_bare_array():
+    text = "```json\n" + json.dumps(CONFIGURATIONS, ensure_ascii=False) + "\n```"
+    assert parse_configurations(text) == CONFIGURATIONS
+
+
+def test_parse_configurations_missing():
+    assert parse_configurations('{"analysis": "沒有配置"}') == []
+
+
+def feed_in_chunks(text: str, rng: random.Random):
+    parser = ConfigurationStreamParser()
+    emitted = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        emitted.extend(parser.feed(text[position:position + size]))
+        position += size
+    emitted.extend(parser.close())
+    return parser, emitted
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_stream_parser_random_chunks(seed):
+    rng = random.Random(seed)
+    text = "```json\n" + RESPONSE.replace('"位置D"]', '"位置D",]') + "\n```\n以上。"
+    parser, emitted = feed_in_chunks(text, rng)
+    assert emitted == CONFIGURATIONS
+    assert parser.elements == CONFIGURATIONS
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_stream_parser_recovers_truncated_last_element(seed):
+    rng = random.Random(seed)
+    text = RESPONSE[:RESPONSE.index('"方案3"') + 20]
+    parser, emitted = feed_in_chunks(text, rng)
+    assert emitted[:2] == CONFIGURATIONS[:2]
+    assert len(emitted) == 3
+    assert emitted[2]["name"] == "方案3"
+
+
+def test_stream_parser_emits_each_element_once_complete():
+    parser = ConfigurationStreamParser()
+    first = json.dumps(CONFIGURATIONS[0], ensure_ascii=False)
+    assert parser.feed('{"configurations": [' + first[:-1]) == []
+    assert parser.feed(first[-1] + ', ') == [CONFIGURATIONS[0]]
+    assert parser.feed(']}') == []
+    assert parser.close() == []
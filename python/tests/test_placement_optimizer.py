@@ -0,0 +1,61 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from data_models import DesignData, Location
+from environment_rules import EnvironmentRules
+from layout_engine import LocalLayoutEngine
+from placement_optimizer import PlacementOptimizer
+
+
+def random_instance(rng: random.Random, location_count: int):
+    rules, _, _ = EnvironmentRules().get_room_environment_rules(
+        datetime(2024, rng.randint(1, 12), 1, rng.randint(0, 23))
+    )
+    locations = {
+        f"位置{index}": Location(rng.uniform(15, 32), rng.uniform(40, 90), rng.uniform(0, 800))
+        for index in range(location_count)
+    }
+    rooms = {"livingRoom": 1, "bedroom": rng.randint(1, 3), "kitchen": 1, "bathroom": rng.randint(1, 2)}
+    windows = {"north": rng.random() < 0.5, "south": rng.random() < 0.5}
+    return rooms, windows, locations, rules
+
+
+def enumerated_scores(rooms, windows, locations, rules, exclusive):
+    """用 LocalLayoutEngine 的窮舉和 calculate_total_score 計算所有分配的總分，從高到低排列。"""
+    engine = LocalLayoutEngine()
+    design_data = DesignData("test", 10, 10, rooms, windows)
+    room_areas = {room_type: 10.0 for room_type in rooms}
+    scores = [
+        engine.score_assignment(assignment, design_data, locations, room_areas, rules)["total_score"]
+        for assignment in engine._candidates(rooms, sorted(locations), exclusive)
+    ]
+    return sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_matches_enumeration(seed):
+    rng = random.Random(seed)
+    rooms, windows, locations, rules = random_instance(rng, rng.randint(3, 7))
+    exclusive = sum(rooms.values()) <= len(locations)
+
+    result = PlacementOptimizer().optimize(rooms, windows, locations, rules, top_k=3)
+
+    assert result["optimal"] is True
+    assert result["gap"] == 0.0
+    found = [assignment["scores"]["total_score"] for assignment in result["assignments"]]
+    assert found == enumerated_scores(rooms, windows, locations, rules, exclusive)[:3]
+
+
+def test_time_limit_reports_gap():
+    rng = random.Random(0)
+    _, windows, locations, rules = random_instance(rng, 36)
+    rooms = {"livingRoom": 2, "bedroom": 6, "kitchen": 2, "bathroom": 4}
+
+    result = PlacementOptimizer().optimize(rooms, windows, locations, rules, top_k=3, time_limit=0.05)
+
+    assert result["optimal"] is False
+    assert result["gap"] >= 0
+    assert result["assignments"]
+    assert result["upper_bound"] >= result["assignments"][0]["scores"]["total_score"]
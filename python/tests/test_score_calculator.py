@@ -0,0 +1,67 @@
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from environment_rules import EnvironmentRules
+from score_calculator import ScoreCalculator
+
+SENSOR_RANGES = {"temperature": (10, 35), "humidity": (30, 95), "sunlight": (0, 900)}
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_score_batch_matches_scalar(seed):
+    rng = random.Random(seed)
+    calculator = ScoreCalculator()
+    rules, _, _ = EnvironmentRules().get_room_environment_rules(
+        datetime(2024, rng.randint(1, 12), 1, rng.randint(0, 23))
+    )
+    location_count = rng.randint(2, 12)
+    # 偶數種子使用整數讀數，與感測器送來的數據相同
+    sensors = {
+        factor: [rng.uniform(low, high) if seed % 2 else rng.randint(low, high) for _ in range(location_count)]
+        for factor, (low, high) in SENSOR_RANGES.items()
+    }
+    counts = {"livingRoom": 1, "bedroom": rng.randint(1, 3), "kitchen": 1, "bathroom": rng.randint(1, 2)}
+    rooms = {room_type: 10.0 for room_type in counts}
+    windows = {"north": True, "south": rng.random() < 0.5}
+    assignments = {
+        room_type: np.array([[rng.randrange(location_count) for _ in range(count)] for _ in range(200)])
+        for room_type, count in counts.items()
+    }
+
+    batch = calculator.score_batch(rooms, windows, assignments, sensors, rules)
+
+    for index in range(200):
+        data = {
+            factor: {room_type: [readings[i] for i in assignments[room_type][index]] for room_type in counts}
+            for factor, readings in sensors.items()
+        }
+        scores = calculator.calculate_total_score(
+            rooms, windows, data["sunlight"], data["temperature"], data["humidity"], rules
+        )
+        for key, value in scores.items():
+            assert batch[key][index] == value
+
+
+def test_score_batch_accepts_custom_rules():
+    calculator = ScoreCalculator()
+    rules, _, _ = EnvironmentRules().get_room_environment_rules(datetime(2024, 7, 1, 12))
+    # 請求中傳入的規則不是預先計算的規則表
+    custom = {room: {factor: {"ideal": rule["ideal"] + 1, "range": list(rule["range"])}
+                     for factor, rule in room_rules.items()}
+              for room, room_rules in rules.items()}
+    rooms = {"livingRoom": 20.0, "bedroom": 12.0}
+    sensors = {"temperature": [24.0, 27.5, 30.0], "humidity": [55, 70, 85], "sunlight": [100, 400, 700]}
+    assignments = {"livingRoom": np.array([[0], [1], [2]]), "bedroom": np.array([[2], [0], [1]])}
+
+    batch = calculator.score_batch(rooms, {"north": True}, assignments, sensors, custom)
+
+    for index in range(3):
+        data = {factor: {room: [readings[assignments[room][index][0]]] for room in rooms}
+                for factor, readings in sensors.items()}
+        scores = calculator.calculate_total_score(
+            rooms, {"north": True}, data["sunlight"], data["temperature"], data["humidity"], custom
+        )
+        assert batch["total_score"][index] == scores["total_score"]
@@ -0,0 +1,72 @@
+import re
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # 未安裝時使用估算
+    tiktoken = None
+
+# 每條消息的格式開銷（role、分隔符），與 OpenAI 的計算方式一致
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+# 中日韓文字大約每個字一個 token
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+_encodings: Dict[str, object] = {}
+
+
+class TokenBudgetExceeded(ValueError):
+    """prompt 的 token 數超過設定的預算。"""
+
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """
+    計算文本的 token 數。安裝了 tiktoken 時是精確值，否則按字符估算。
+
+    :param text: 文本
+    :param model: 模型名稱
+    :return: token 數
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-4") -> int:
+    """
+    計算聊天消息列表作為 prompt 時的 token 數。
+
+    :param messages: OpenAI 格式的消息列表
+    :param model: 模型名稱
+    :return: token 數
+    """
+    total = _TOKENS_PER_REPLY
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", model)
+    return total
+
+
+def check_budget(prompt_tokens: int, budget: Optional[int]):
+    """
+    檢查 prompt 是否超出預算。
+
+    :param prompt_tokens: prompt 的 token 數
+    :param budget: 預算，None 或 0 表示不限制
+    :raises TokenBudgetExceeded: 超出預算時
+    """
+    if budget and prompt_tokens > budget:
+        raise TokenBudgetExceeded(f"prompt 有 {prompt_tokens} 個 token，超過預算 {budget}")
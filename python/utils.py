@@ -1,5 +1,3 @@
-import re
-import json
 from typing import Dict, List, Any
 from datetime import datetime
 
@@ -38,29 +36,6 @@ def extract_room_locations(description: str) -> dict[str, List[str]]:
 
     return room_locations
 
-def repair_json(json_string: str) -> dict[str, Any]:
-    """
-    嘗試修復無效的 JSON 字符串。
-
-    :param json_string: 可能無效的 JSON 字符串
-    :return: 修復後的 JSON 對象，如果無法修復則返回 None
-    """
-    # 移除可能導致問題的尾隨逗號
-    json_string = re.sub(r',\s*}', '}', json_string)
-    json_string = re.sub(r',\s*]', ']', json_string)
-    
-    # 嘗試找到並提取 JSON 對象
-    match = re.search(r'\{.*\}', json_string, re.DOTALL)
-    if match:
-        json_string = match.group()
-
-    try:
-        # 嘗試解析修復後的 JSON
-        return json.loads(json_string)
-    except json.JSONDecodeError as e:
-        print(f"無法修復 JSON: {str(e)}")
-        return None
-
 def validate_design_data(design_data: dict[str, Any]) -> bool:
     """
     驗證設計數據的有效性。